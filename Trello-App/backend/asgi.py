@@ -0,0 +1,496 @@
+"""
+ASGI variant of the API, on Starlette and Motor.
+
+    uvicorn --factory backend.asgi:create_asgi_app --host 0.0.0.0 --port 5000
+    WEB_WORKER_CLASS=uvicorn python -m backend.serve
+
+The routes that carry most of the traffic are coroutines here. Lookups that
+don't depend on each other run together with asyncio.gather(), and a slow
+query holds no thread while it waits:
+
+  GET  /health, /ready
+  POST /login          the password check runs in the hashing pool, off the loop
+  GET  /boards         the board versions, then the cached tree or the aggregation
+  GET  /boards/<id>    the board, then its cached snapshot or its lists and cards
+  GET  /lists          the board check and the page at once
+  GET  /cards
+  PUT  /cards/<id>     the card, the target list's owner check and the card's
+                       new neighbours at once, then the card's own list
+  GET  /boards/<id>/events
+                       the SSE stream waits on the event loop for the event
+                       bus (a Subscription notify callback), so an open
+                       stream holds no thread
+
+Both board reads check the version first, answer If-None-Match with 304
+when it still matches, and then serve the body from app.board_cache (see
+cache.py) when another request already built it at that version, as the
+Flask routes do.
+
+Every other request (signup, the other writes, /batch, ?stream=1 boards,
+event stream tickets, /metrics, CORS preflights) is handed to the Flask app
+from create_app() through a WSGI bridge and holds one of its threads while
+it runs; none of them stays open. The
+coroutines reuse app.py's pipelines, serializers and JSON provider, so each
+route answers with the same status, JSON and headers on either path. Both
+share this process's storage (see async_storage.py).
+
+Database commands of the coroutine routes are not attributed to requests by
+the CommandTracer (Motor runs them on its own threads); their requests are
+counted in /metrics under the same endpoint names.
+"""
+import asyncio
+import contextlib
+import logging
+import time
+from datetime import datetime, timedelta
+
+import jwt
+from a2wsgi import WSGIMiddleware
+from bson import ObjectId
+from pymongo import ReturnDocument
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import Response, StreamingResponse
+from starlette.routing import Mount, Route
+from werkzeug.http import parse_etags, quote_etag
+
+from .app import (CARD_DERIVED_FIELDS, CARD_FIELD_ALIASES, SSE_HEADERS, SSE_HEARTBEAT_SECONDS, auth_seconds,
+                  board_cache, board_etag, board_snapshot_key, card_move_changes, cards_collection, change_entry,
+                  create_app, drop_snapshots, event_bus, home_boards_filter, home_boards_pipeline, home_etag,
+                  home_snapshot_key, nest_board, password_hasher, pool_metrics, request_metrics, serialize_card,
+                  sse_event, storage, sub_board_changed, task_counter_filter, task_counter_inc, task_moves,
+                  ticket_user_id, upgrade_password_hash)
+from .async_storage import AsyncLazyStorage
+from .authz import owned_lists_pipeline
+from .pagination import PageError, page_of, page_query
+from .passwords import HasherBusy
+from .ranking import POSITION_ORDER, gap_too_small, has_position, position_at, position_between, schedule_rebalance
+
+log = logging.getLogger(__name__)
+
+
+# --- Responses ---
+
+def json_response(request, obj, status=200, headers=None):
+    # The Flask app's JSON provider: the same bytes jsonify() would send
+    body = request.app.state.flask.json.dumps(obj, separators=(',', ':')) + '\n'
+    return Response(body, status, headers, media_type='application/json')
+
+async def with_cache(fn, *args):
+    # The shared store is a network round trip; the local one is a dict lookup
+    return await asyncio.to_thread(fn, *args) if board_cache.shared else fn(*args)
+
+async def cached_json(request, key, version, build, headers=None):
+    """app.cached_json() for the coroutine routes; build is a coroutine function."""
+    body = await with_cache(board_cache.get, key, version)
+    if body is None:
+        body = json_response(request, await build()).body
+        await with_cache(board_cache.set, key, version, body)
+    return Response(body, 200, headers, media_type='application/json')
+
+def message(request, text, status):
+    return json_response(request, {'message': text}, status)
+
+def etag_headers(etag):
+    return {'ETag': quote_etag(etag), 'Cache-Control': 'private, no-cache'}
+
+def if_none_match(request):
+    return request.headers.get('if-none-match')
+
+def not_modified(etag):
+    return Response(status_code=304, headers=etag_headers(etag))
+
+def add_cors_headers(request, response):
+    """What flask-cors adds to the Flask routes (see create_app())."""
+    origin = request.headers.get('origin')
+    if origin:
+        response.headers['Access-Control-Allow-Origin'] = origin
+        response.headers['Access-Control-Expose-Headers'] = 'X-Next-Cursor'
+        response.headers['Access-Control-Allow-Credentials'] = 'true'
+        response.headers.append('Vary', 'Origin')
+
+
+class NativeRoute:
+    """
+    An ASGI endpoint that runs handler(request[, user_id]) as a coroutine and
+    counts it in /metrics under the Flask endpoint name. With auth=True the
+    bearer token is checked as by token_required(load_user=False). Requests
+    for which fallback(request) is true go to the Flask app instead.
+    """
+
+    def __init__(self, endpoint, handler, auth=False, fallback=None):
+        self.endpoint = endpoint
+        self.handler = handler
+        self.auth = auth
+        self.fallback = fallback
+
+    async def __call__(self, scope, receive, send):
+        request = Request(scope, receive)
+        if self.fallback and self.fallback(request):
+            return await request.app.state.wsgi(scope, receive, send)
+
+        started = time.perf_counter()
+        status = 500
+        request_metrics.in_flight.inc()
+        try:
+            response = await self.respond(request)
+            status = response.status_code
+        finally:
+            request_metrics.in_flight.dec()
+            request_metrics.latency.observe(time.perf_counter() - started, (self.endpoint, request.method))
+            request_metrics.requests.inc((self.endpoint, request.method, str(status)))
+        add_cors_headers(request, response)
+        await response(scope, receive, send)
+
+    async def respond(self, request):
+        if not self.auth:
+            return await self.handler(request)
+        token = None
+        if 'authorization' in request.headers:
+            token = request.headers['authorization'].split()[-1]
+        if not token:
+            return message(request, 'Token is missing!', 401)
+        try:
+            started = time.perf_counter()
+            data = jwt.decode(token, request.app.state.flask.config['SECRET_KEY'], algorithms=['HS256'])
+            auth_seconds.observe(time.perf_counter() - started, ('jwt_decode',))
+            if 'scope' in data:
+                # Event stream tickets are not API credentials (see app.ticket_required)
+                raise jwt.InvalidTokenError('scoped token')
+            user_id = str(ObjectId(data['user_id']))
+        except Exception:
+            return message(request, 'Token is invalid!', 401)
+        return await self.handler(request, user_id)
+
+
+def native(endpoint, auth=False, fallback=None):
+    return lambda handler: NativeRoute(endpoint, handler, auth, fallback)
+
+async def db_of(request):
+    return await request.app.state.storage.get()
+
+async def json_body(request):
+    try:
+        data = await request.json()
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+# --- Writes shared by the coroutine routes (the same documents as app.py writes) ---
+
+async def adjust_task_counters(db, board_id, total_delta, done_delta):
+    inc = task_counter_inc(total_delta, done_delta)
+    if inc:
+        await db.cards.update_one(task_counter_filter(board_id), {'$inc': inc})
+
+async def record_board_changes(db, board_id, *changes):
+    """app.record_board_changes() on Motor."""
+    board = await db.boards.find_one_and_update(
+        {'_id': ObjectId(board_id)}, {'$inc': {'version': 1}},
+        projection={'parent_board_id': 1, 'user_id': 1, 'version': 1}, return_document=ReturnDocument.AFTER)
+    if not board:
+        return
+    await with_cache(drop_snapshots, board)
+    await db.changes.insert_one(change_entry(board_id, board['version'], changes))
+    event_bus.publish(board_id, {'type': 'change', 'version': board['version'], 'changes': list(changes)})
+    if board.get('parent_board_id'):
+        await record_board_changes(db, board['parent_board_id'], sub_board_changed(board_id))
+
+async def owned_lists(db, user_id, list_ids):
+    """{list_id: list} for the lists among list_ids that user_id owns, as Ownership.lists()."""
+    lists = await db.lists.aggregate(owned_lists_pipeline(user_id, list_ids, db.boards.name)).to_list(None)
+    return {str(l['_id']): l for l in lists}
+
+async def neighbours(collection, scope, moving_id, index):
+    """ranking.neighbours() on Motor."""
+    others = {**scope, '_id': {'$ne': moving_id}}
+
+    async def last():
+        found = await collection.find(others, {'position': 1}).sort([('position', -1), ('_id', -1)]).limit(1).to_list(None)
+        return (found[0] if found else None), None
+
+    if index is None:
+        return await last()
+    if index <= 0:
+        found = await collection.find(others, {'position': 1}).sort(POSITION_ORDER).limit(1).to_list(None)
+        return None, (found[0] if found else None)
+
+    found = await collection.find(others, {'position': 1}).sort(POSITION_ORDER).skip(index - 1).limit(2).to_list(None)
+    if not found:
+        return await last()
+    return found[0], (found[1] if len(found) > 1 else None)
+
+
+# --- Routes ---
+
+@native('api.health_check')
+async def health_check(request):
+    return json_response(request, {'status': 'ok', 'message': 'Flask backend is running!'})
+
+@native('api.readiness_check')
+async def readiness_check(request):
+    async def ping():
+        db = await db_of(request)
+        await db.db.command('ping')
+
+    try:
+        await asyncio.wait_for(ping(), request.app.state.flask.config['READY_TIMEOUT_SECONDS'])
+    except Exception as e:
+        log.warning("Not ready: %r", e, extra={'event': 'not_ready'})
+        return json_response(request, {'status': 'unavailable', 'message': str(e) or repr(e)}, 503)
+    return json_response(request, {'status': 'ready'})
+
+@native('api.login')
+async def login(request):
+    data = await json_body(request)
+    if data is None:
+        return message(request, 'JSON body required', 400)
+    username = data.get('username')
+    password = data.get('password')
+
+    if not username or not password:
+        return message(request, 'Username and password are required', 400)
+
+    db = await db_of(request)
+    user = await db.users.find_one({'username': username})
+    if user:
+        started = time.perf_counter()
+        try:
+            password_ok = await asyncio.to_thread(password_hasher.verify, user['password'], password)
+        except HasherBusy:
+            return json_response(request, {'message': 'Too many sign-ins right now, please try again shortly'}, 503,
+                                 {'Retry-After': '1'})
+        auth_seconds.observe(time.perf_counter() - started, ('password_check',))
+    if not user or not password_ok:
+        log.info("Login failed", extra={'event': 'login_failed'})
+        return message(request, 'Invalid credentials', 401)
+
+    if password_hasher.needs_rehash(user['password']):
+        await asyncio.to_thread(upgrade_password_hash, user, password)
+
+    token = jwt.encode({
+        'user_id': str(user['_id']),
+        'exp': datetime.utcnow() + timedelta(hours=24)
+    }, request.app.state.flask.config['SECRET_KEY'], algorithm="HS256")
+
+    return json_response(request, {'token': token})
+
+@native('api.get_boards', auth=True)
+async def get_boards(request, user_id):
+    db = await db_of(request)
+    etag = home_etag(await db.boards.find(home_boards_filter(user_id), {'version': 1}).sort('_id', 1).to_list(None))
+    if if_none_match(request) and parse_etags(if_none_match(request)).contains_weak(etag):
+        return not_modified(etag)
+
+    async def tree():
+        return await db.boards.aggregate(home_boards_pipeline(user_id)).to_list(None)
+    return await cached_json(request, home_snapshot_key(user_id), etag, tree, etag_headers(etag))
+
+@native('api.get_board_details', auth=True, fallback=lambda request: request.query_params.get('stream') in ('1', 'true'))
+async def get_board_details(request, user_id):
+    try:
+        db = await db_of(request)
+        board = await db.boards.find_one({'_id': ObjectId(request.path_params['board_id'])})
+        if not board:
+            return message(request, 'Board not found', 404)
+
+        etag = board_etag(board)
+        if if_none_match(request) and parse_etags(if_none_match(request)).contains_weak(etag):
+            return not_modified(etag)
+
+        async def snapshot():
+            lists = await db.lists.find({'board_id': str(board['_id'])}).sort(POSITION_ORDER).to_list(None)
+            cards = await db.cards.find({'list_id': {'$in': [str(l['_id']) for l in lists]}}).sort(POSITION_ORDER).to_list(None)
+            return nest_board(board, lists, cards)
+        return await cached_json(request, board_snapshot_key(board['_id']), board.get('version', 0), snapshot,
+                                 etag_headers(etag))
+
+    except Exception as e:
+        return message(request, f'Error fetching board: {str(e)}', 500)
+
+@native('api.get_lists', auth=True)
+async def get_lists(request, user_id):
+    board_id = request.query_params.get('board_id')
+    if not board_id:
+        return message(request, 'Missing board_id parameter', 400)
+
+    db = await db_of(request)
+    board = db.boards.find_one({"_id": ObjectId(board_id)})
+    try:
+        query, projection, limit, keep = page_query({'board_id': board_id}, request.query_params)
+    except PageError as e:
+        if not await board:
+            return message(request, 'Board not found or unauthorized', 404)
+        return message(request, str(e), 400)
+
+    page = db.lists.find(query, projection).sort(POSITION_ORDER).limit(limit + 1).to_list(None)
+    board, docs = await asyncio.gather(board, page)
+    if not board:
+        return message(request, 'Board not found or unauthorized', 404)
+
+    lists, next_cursor = page_of(docs, limit, keep)
+    return json_response(request, lists, 200, {'X-Next-Cursor': next_cursor} if next_cursor else None)
+
+@native('api.get_cards', auth=True)
+async def get_cards(request, user_id):
+    list_id = request.query_params.get('list_id')
+    if not list_id:
+        return message(request, 'Missing list_id', 400)
+
+    try:
+        query, projection, limit, keep = page_query({'list_id': list_id}, request.query_params,
+                                                    aliases=CARD_FIELD_ALIASES, derived=CARD_DERIVED_FIELDS)
+    except PageError as e:
+        return message(request, str(e), 400)
+
+    db = await db_of(request)
+    docs = await db.cards.find(query, projection).sort(POSITION_ORDER).limit(limit + 1).to_list(None)
+    cards, next_cursor = page_of(docs, limit, keep, serialize=serialize_card)
+    return json_response(request, cards, 200, {'X-Next-Cursor': next_cursor} if next_cursor else None)
+
+@native('api.move_card', auth=True)
+async def move_card(request, user_id):
+    data = await json_body(request)
+    if data is None:
+        return message(request, 'JSON body required', 400)
+    new_list_id = data.get('new_list_id')
+    to_position = data.get('to_position')
+
+    if not new_list_id:
+        return message(request, 'New list ID is required', 400)
+
+    card_id = request.path_params['card_id']
+    if not ObjectId.is_valid(card_id):
+        return message(request, 'Card not found', 404)
+    card_oid = ObjectId(card_id)
+
+    # The card, whether its target list is the user's, and the card's new neighbours there
+    db = await db_of(request)
+    scope = {'list_id': new_list_id}
+    insert_position = to_position if isinstance(to_position, int) and to_position >= 0 else None
+    card, target, (before, after) = await asyncio.gather(
+        db.cards.find_one({'_id': card_oid}),
+        owned_lists(db, user_id, [new_list_id]),
+        neighbours(db.cards, scope, card_oid, insert_position))
+
+    current_list = None
+    if card:
+        current_list = target.get(card['list_id']) or (await owned_lists(db, user_id, [card['list_id']])).get(card['list_id'])
+    if not current_list:
+        return message(request, 'Card not found', 404)
+    new_list = target.get(new_list_id)
+    if not new_list:
+        return message(request, 'List not found', 404)
+
+    if (before and not has_position(before)) or (after and not has_position(after)):
+        # Cards from before positions existed: position_at() rebalances the list first
+        position = await asyncio.to_thread(position_at, cards_collection, scope, card_oid, insert_position)
+    else:
+        before_pos = before['position'] if before else None
+        after_pos = after['position'] if after else None
+        if gap_too_small(before_pos, after_pos):
+            schedule_rebalance(cards_collection, scope)
+        position = position_between(before_pos, after_pos)
+    await db.cards.update_one({'_id': card_oid}, {'$set': {'position': position, 'list_id': new_list_id}})
+
+    # Counters and change-log entries of different boards don't depend on each other
+    await asyncio.gather(
+        *(adjust_task_counters(db, *move) for move in task_moves(current_list, new_list)),
+        *(record_board_changes(db, board_id, change) for board_id, change in card_move_changes(card_oid, current_list, new_list)))
+    log.info("Card moved", extra={'event': 'card_moved', 'card_id': card_id,
+                                  'from_list_id': card['list_id'], 'to_list_id': new_list_id})
+
+    return message(request, 'Card moved successfully and progress updated if applicable', 200)
+
+
+@native('api.board_events')
+async def board_events(request):
+    """app.board_events(): the board's change-log entries as Server-Sent Events, opened with a ticket."""
+    board_id = request.path_params['board_id']
+    ticket = request.query_params.get('ticket')
+    if not ticket:
+        return message(request, 'Ticket is missing!', 401)
+    try:
+        user_id = ticket_user_id(ticket, board_id, request.app.state.flask.config['SECRET_KEY'])
+    except Exception:
+        return message(request, 'Ticket is invalid!', 401)
+
+    db = await db_of(request)
+    board = await db.boards.find_one({'_id': ObjectId(board_id), 'user_id': user_id}, {'version': 1})
+    if not board:
+        return message(request, 'Board not found or unauthorized', 404)
+
+    last_event_id = request.headers.get('last-event-id', '')
+    loop = asyncio.get_running_loop()
+    ready = asyncio.Event()
+
+    def notify():
+        # Called from whichever thread published the event
+        with contextlib.suppress(RuntimeError):  # the loop is already closed
+            loop.call_soon_threadsafe(ready.set)
+
+    async def stream():
+        sent_version = int(last_event_id) if last_event_id.isdigit() else board.get('version', 0)
+        # Subscribe before replaying so no event falls between the two. A change stream bus
+        # may wait for its stream to open, so this one call runs off the loop
+        subscription = await asyncio.to_thread(event_bus.subscribe, board_id, notify)
+        try:
+            yield 'retry: 3000\n\n'
+            if last_event_id.isdigit():
+                async for entry in db.changes.find({'board_id': board_id, 'version': {'$gt': sent_version}}).sort('version', 1):
+                    sent_version = entry['version']
+                    yield sse_event({'type': 'change', 'version': entry['version'], 'changes': entry['changes']})
+            while True:
+                event = subscription.get(timeout=0)
+                if event is None:
+                    ready.clear()
+                    # An event delivered before clear() is in the queue; one after it sets ready again
+                    event = subscription.get(timeout=0)
+                if event is None:
+                    try:
+                        await asyncio.wait_for(ready.wait(), SSE_HEARTBEAT_SECONDS)
+                    except asyncio.TimeoutError:
+                        yield ': keep-alive\n\n'
+                elif event['type'] != 'change' or event['version'] > sent_version:
+                    sent_version = event.get('version', sent_version)
+                    yield sse_event(event)
+        finally:
+            subscription.close()
+
+    return StreamingResponse(stream(), media_type='text/event-stream', headers=SSE_HEADERS)
+
+
+ROUTES = [
+    Route('/health', health_check, methods=['GET']),
+    Route('/ready', readiness_check, methods=['GET']),
+    Route('/login', login, methods=['POST']),
+    Route('/boards', get_boards, methods=['GET']),
+    Route('/boards/{board_id}', get_board_details, methods=['GET']),
+    Route('/lists', get_lists, methods=['GET']),
+    Route('/cards', get_cards, methods=['GET']),
+    Route('/cards/{card_id}', move_card, methods=['PUT']),
+    Route('/boards/{board_id}/events', board_events, methods=['GET']),
+]
+
+
+def create_asgi_app(config=None):
+    """
+    The ASGI app: the coroutine routes above, and the Flask app from
+    create_app(config) for everything else. Like create_app(), it opens
+    nothing until the first request.
+    """
+    flask_app = create_app(config)
+    async_storage = AsyncLazyStorage(storage, event_listeners=[pool_metrics])
+
+    @contextlib.asynccontextmanager
+    async def lifespan(app):
+        yield
+        async_storage.close()
+
+    wsgi = WSGIMiddleware(flask_app)
+    app = Starlette(routes=ROUTES + [Mount('', app=wsgi)], lifespan=lifespan)
+    app.state.flask = flask_app
+    app.state.wsgi = wsgi
+    app.state.storage = async_storage
+    return app
@@ -0,0 +1,121 @@
+"""
+Storage for the coroutine routes of the ASGI app (asgi.py).
+
+AsyncLazyStorage wraps the process's LazyStorage (storage.py) and opens,
+on first use, a Storage whose collections speak Motor's API: coroutine
+methods (find_one, insert_one, update_one, find_one_and_update, ...) and
+cursors from find() / aggregate() with sort, skip, limit, to_list() and
+`async for`.
+
+  mongo   a Motor client for the same MONGO_* settings as the pymongo one.
+          Commands wait on the network without holding the event loop.
+  memory  AsyncDatabase over the very MemoryDatabase the Flask routes use,
+          so both halves of the app see the same data. Its operations are
+          short and in memory, so they run inline.
+
+The synchronous storage is always opened first, which applies the indexes
+once (see indexes.py) whichever half of the app is used first.
+"""
+import asyncio
+import itertools
+
+from .storage import Storage, connect_mongo
+
+# Collection methods that return a cursor rather than a result
+CURSOR_METHODS = ('find', 'aggregate', 'list_indexes')
+
+
+class AsyncCursor:
+    """A synchronous cursor behind Motor's cursor API."""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def sort(self, key_or_list, direction=None):
+        self._cursor.sort(key_or_list, direction)
+        return self
+
+    def skip(self, skip):
+        self._cursor.skip(skip)
+        return self
+
+    def limit(self, limit):
+        self._cursor.limit(limit)
+        return self
+
+    def batch_size(self, batch_size):
+        return self
+
+    async def to_list(self, length):
+        return list(itertools.islice(self._cursor, length)) if length else list(self._cursor)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._cursor)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class AsyncCollection:
+    """A synchronous collection behind Motor's collection API."""
+
+    def __init__(self, collection):
+        self.delegate = collection
+        self.name = collection.name
+
+    def __getattr__(self, name):
+        method = getattr(self.delegate, name)
+        if name in CURSOR_METHODS:
+            return lambda *args, **kwargs: AsyncCursor(method(*args, **kwargs))
+
+        async def call(*args, **kwargs):
+            return method(*args, **kwargs)
+        return call
+
+
+class AsyncDatabase:
+    def __init__(self, db):
+        self.delegate = db
+        self.name = db.name
+
+    def __getitem__(self, name):
+        return AsyncCollection(self.delegate[name])
+
+    async def command(self, *args, **kwargs):
+        return self.delegate.command(*args, **kwargs)
+
+
+class AsyncLazyStorage:
+    """This process's async Storage, opened by the first get() inside its event loop."""
+
+    def __init__(self, storage, event_listeners=()):
+        self.storage = storage
+        self.event_listeners = tuple(event_listeners)
+        self._opened = None
+        self._lock = None
+
+    async def get(self):
+        if self._opened is not None:
+            return self._opened
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if self._opened is None:
+                opened = await asyncio.to_thread(self.storage.get)
+                if opened.client is None:
+                    self._opened = Storage(AsyncDatabase(opened.db))
+                else:
+                    from motor.motor_asyncio import AsyncIOMotorClient
+                    client, db = connect_mongo(self.event_listeners, client_class=AsyncIOMotorClient,
+                                               **self.storage.client_options)
+                    self._opened = Storage(db, client)
+        return self._opened
+
+    def close(self):
+        if self._opened is not None and self._opened.client is not None:
+            self._opened.client.close()
+        self._opened = None
+        self._lock = None
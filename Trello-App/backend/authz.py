@@ -0,0 +1,116 @@
+"""
+Ownership checks for the mutating routes.
+
+A board belongs to the user in its user_id, a list to the owner of its
+board and a card to the owner of its list. Ownership is resolved for a whole
+set of ids at once, with every query scoped by user_id:
+
+  cards   cards.find({_id: {$in: ...}})                      (any owner)
+  lists   lists.aggregate: $match _id $in, then $lookup of the owning board
+          restricted to {user_id}; lists of other users drop out
+  boards  boards.find({_id: {$in: ...}, user_id})
+
+so checking a card costs two indexed queries however many boards exist, and
+resolve() checks all the cards and lists of a request in the same two.
+
+Results are memoized on the Ownership object, which lives on flask.g for one
+request: asking again for an id that was already resolved costs nothing.
+Documents of other users (and ids that don't parse) resolve to None, so
+routes answer 404 without telling whether the document exists.
+"""
+from bson import ObjectId
+
+
+def object_ids(ids):
+    return [ObjectId(i) for i in ids if ObjectId.is_valid(i)]
+
+
+def owned_lists_pipeline(user_id, list_ids, boards_collection_name='boards'):
+    """The lists among list_ids whose board belongs to user_id, in one aggregation."""
+    return [
+        {'$match': {'_id': {'$in': object_ids(list_ids)}}},
+        {'$lookup': {
+            'from': boards_collection_name,
+            'let': {'board_id': {'$convert': {'input': '$board_id', 'to': 'objectId', 'onError': None}}},
+            'pipeline': [
+                {'$match': {'$expr': {'$eq': ['$_id', '$$board_id']}, 'user_id': str(user_id)}},
+                {'$project': {'_id': 1}}
+            ],
+            'as': 'owner'
+        }},
+        {'$match': {'owner': {'$ne': []}}},
+        {'$unset': 'owner'}
+    ]
+
+
+class Ownership:
+    def __init__(self, user_id, boards_collection, lists_collection, cards_collection):
+        self.user_id = str(user_id)
+        self.boards_collection = boards_collection
+        self.lists_collection = lists_collection
+        self.cards_collection = cards_collection
+        # id -> document, or None when missing / owned by someone else
+        self._boards, self._lists, self._cards = {}, {}, {}
+
+    def resolve(self, card_ids=(), list_ids=(), board_ids=()):
+        """Load everything not resolved yet: at most one query per collection."""
+        card_ids = self._unresolved(self._cards, card_ids)
+        if card_ids:
+            found = {str(c['_id']): c for c in self.cards_collection.find({'_id': {'$in': object_ids(card_ids)}})}
+            for card_id in card_ids:
+                self._cards[card_id] = found.get(card_id)
+
+        card_lists = {c['list_id'] for c in map(self._cards.get, card_ids) if c}
+        list_ids = self._unresolved(self._lists, set(list_ids) | card_lists)
+        if list_ids:
+            found = {str(l['_id']): l for l in self.lists_collection.aggregate(self.owned_lists_pipeline(list_ids))}
+            for list_id in list_ids:
+                self._lists[list_id] = found.get(list_id)
+
+        board_ids = self._unresolved(self._boards, board_ids)
+        if board_ids:
+            query = {'_id': {'$in': object_ids(board_ids)}, 'user_id': self.user_id}
+            found = {str(b['_id']): b for b in self.boards_collection.find(query)}
+            for board_id in board_ids:
+                self._boards[board_id] = found.get(board_id)
+
+    def owned_lists_pipeline(self, list_ids):
+        return owned_lists_pipeline(self.user_id, list_ids, self.boards_collection.name)
+
+    def board(self, board_id):
+        self.resolve(board_ids=[board_id])
+        return self._boards.get(str(board_id))
+
+    def list(self, list_id):
+        self.resolve(list_ids=[list_id])
+        return self._lists.get(str(list_id))
+
+    def card(self, card_id):
+        """The card if the user owns its list."""
+        self.resolve(card_ids=[card_id])
+        card = self._cards.get(str(card_id))
+        return card if card and self._lists.get(card['list_id']) else None
+
+    def lists(self, list_ids):
+        """{list_id: list} for the given ids the user owns."""
+        self.resolve(list_ids=list_ids)
+        return {str(i): self._lists[str(i)] for i in list_ids if self._lists.get(str(i))}
+
+    def cards(self, card_ids):
+        """{card_id: card} for the given ids the user owns."""
+        self.resolve(card_ids=card_ids)
+        owned = {}
+        for card_id in card_ids:
+            card = self.card(card_id)
+            if card:
+                owned[str(card_id)] = card
+        return owned
+
+    @staticmethod
+    def _unresolved(memo, ids):
+        ids = dict.fromkeys(str(i) for i in ids if isinstance(i, (str, ObjectId)))
+        unresolved = [i for i in ids if i not in memo]
+        for i in unresolved:
+            if not ObjectId.is_valid(i):
+                memo[i] = None
+        return [i for i in unresolved if i not in memo]
@@ -0,0 +1,244 @@
+"""
+Planner for POST /batch.
+
+A batch is an ordered list of card and list operations, typically one
+drag-and-drop session. load_plan() reads everything the batch refers to with
+three $in queries (the referenced cards and the user's lists among those
+referenced, both through authz.Ownership, then the cards of every list
+involved) and BatchPlan.run() replays the operations against that snapshot
+in memory:
+
+  - each operation only sees the cards and lists the user owns
+  - positions are taken from the in-memory list contents, so an operation
+    sees the effect of the ones before it
+  - writes are collected for one ordered bulk_write per collection, run in
+    one transaction where the deployment has them
+  - task counter deltas and change log entries are collected per board, so
+    a project sub-board is updated and versioned once per batch
+
+An operation that fails gets an error result and leaves the snapshot
+untouched; the rest of the batch still runs.
+
+Supported operations (the fields mirror the single-operation routes):
+  {"op": "create_card",  "list_id", "title", "type", "githubUrl"}
+  {"op": "move_card",    "card_id", "new_list_id", "to_position"}
+  {"op": "reorder_card", "card_id", "new_position", "new_list_id"}
+  {"op": "rename_list",  "list_id", "title"}
+  {"op": "delete_card",  "card_id"}
+  {"op": "delete_list",  "list_id"}
+"""
+from bson import ObjectId
+from pymongo import DeleteMany, DeleteOne, InsertOne, UpdateOne
+
+from .ranking import gap_too_small, has_position, position_between
+
+# Operations accepted per request
+MAX_BATCH_SIZE = 500
+
+
+class BatchError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def load_plan(operations, owned, cards_collection, is_done):
+    """owned is the request's authz.Ownership."""
+    card_ids = {op.get('card_id') for op in operations if isinstance(op.get('card_id'), str)}
+    list_ids = {op.get(key) for op in operations for key in ('list_id', 'new_list_id') if isinstance(op.get(key), str)}
+
+    owned.resolve(card_ids=card_ids, list_ids=list_ids)
+    list_ids |= {c['list_id'] for c in owned.cards(card_ids).values()}
+    lists = owned.lists(list_ids)
+    cards = list(cards_collection.find({'list_id': {'$in': list(lists)}}, {'list_id': 1, 'position': 1})) if lists else []
+
+    return BatchPlan(lists, cards, is_done)
+
+
+class BatchPlan:
+    def __init__(self, lists, cards, is_done):
+        """lists: {list_id: list} the user owns; cards: every card in those lists."""
+        self.lists = lists
+        self.is_done = is_done
+        self.card_list = {}  # card_id -> list_id
+        self.contents = {list_id: [] for list_id in lists}  # list_id -> [[position, card_id]] in order
+        for card in cards:
+            card_id = str(card['_id'])
+            self.card_list[card_id] = card['list_id']
+            self.contents[card['list_id']].append([card['position'] if has_position(card) else None, card_id])
+        for entries in self.contents.values():
+            # Mongo's order: missing positions first, ties broken by _id
+            entries.sort(key=lambda e: (e[0] is not None, e[0] or 0, e[1]))
+
+        self.results = []
+        self.card_writes = []
+        self.list_writes = []
+        self.counters = {}  # board_id -> [total_delta, done_delta]
+        self.changes = {}   # board_id -> {(kind, id): change}
+        self.rebalance_lists = set()
+
+    def run(self, operations):
+        handlers = {
+            'create_card': self.create_card,
+            'move_card': self.move_card,
+            'reorder_card': self.reorder_card,
+            'rename_list': self.rename_list,
+            'delete_card': self.delete_card,
+            'delete_list': self.delete_list
+        }
+        for op in operations:
+            try:
+                handler = handlers.get(op.get('op'))
+                if handler is None:
+                    raise BatchError(400, f"Unknown operation: {op.get('op')}")
+                self.results.append({'ok': True, 'status': 200, **(handler(op) or {})})
+            except BatchError as e:
+                self.results.append({'ok': False, 'status': e.status, 'message': e.message})
+        return self.results
+
+    def board_changes(self):
+        return {board_id: list(changes.values()) for board_id, changes in self.changes.items()}
+
+    # --- lookups ---
+
+    def list_for(self, list_id):
+        if not isinstance(list_id, str) or list_id not in self.lists:
+            raise BatchError(404, 'List not found')
+        return self.lists[list_id]
+
+    def card_for(self, card_id):
+        if not isinstance(card_id, str) or card_id not in self.card_list:
+            raise BatchError(404, 'Card not found')
+        return self.list_for(self.card_list[card_id])
+
+    # --- bookkeeping ---
+
+    def count_task(self, list_obj, delta):
+        counters = self.counters.setdefault(list_obj['board_id'], [0, 0])
+        counters[0] += delta
+        if self.is_done(list_obj):
+            counters[1] += delta
+
+    def change(self, board_id, kind, doc_id, op):
+        # Only the last operation on a document matters to clients
+        changes = self.changes.setdefault(board_id, {})
+        changes.pop((kind, doc_id), None)
+        changes[(kind, doc_id)] = {'kind': kind, 'id': doc_id, 'op': op}
+
+    def take(self, card_id):
+        list_id = self.card_list.pop(card_id)
+        self.contents[list_id] = [e for e in self.contents[list_id] if e[1] != card_id]
+
+    def place(self, card_id, list_id, index):
+        """Put card_id at index (None = end) of list_id; returns its new position."""
+        entries = self.contents[list_id]
+        if any(position is None for position, _ in entries):
+            # Legacy list: number it 0..n first, as ranking.position_at() would
+            for idx, entry in enumerate(entries):
+                if entry[0] != idx:
+                    entry[0] = idx
+                    self.card_writes.append(UpdateOne({'_id': ObjectId(entry[1])}, {'$set': {'position': idx}}))
+
+        if index is None or index > len(entries):
+            index = len(entries)
+        before = entries[index - 1][0] if index > 0 else None
+        after = entries[index][0] if index < len(entries) else None
+        if gap_too_small(before, after):
+            self.rebalance_lists.add(list_id)
+        position = position_between(before, after)
+        entries.insert(index, [position, card_id])
+        self.card_list[card_id] = list_id
+        return position
+
+    # --- operations ---
+
+    def create_card(self, op):
+        title = op.get('title')
+        card_type = op.get('type', 'card')
+        github_url = op.get('githubUrl')
+        if card_type == 'project-card':
+            raise BatchError(400, 'Project cards are created with POST /lists/<list_id>/cards')
+        if not title and card_type != 'github-repo':
+            raise BatchError(400, 'Card title is required for this type')
+        if card_type == 'github-repo' and not github_url:
+            raise BatchError(400, 'GitHub URL is required for this card type')
+        list_obj = self.list_for(op.get('list_id'))
+
+        card_id = ObjectId()
+        card = {'_id': card_id, 'list_id': op['list_id'], 'title': title, 'type': card_type}
+        if card_type == 'github-repo':
+            card['githubUrl'] = github_url
+        card['position'] = self.place(str(card_id), op['list_id'], None)
+        self.card_writes.append(InsertOne(card))
+
+        self.count_task(list_obj, 1)
+        self.change(list_obj['board_id'], 'card', str(card_id), 'upsert')
+        return {'status': 201, 'card': {**card, '_id': str(card_id)}}
+
+    def move_card(self, op):
+        if not op.get('new_list_id'):
+            raise BatchError(400, 'New list ID is required')
+        to_position = op.get('to_position')
+        index = to_position if isinstance(to_position, int) and to_position >= 0 else None
+        return self.move(op.get('card_id'), op['new_list_id'], index)
+
+    def reorder_card(self, op):
+        new_position = op.get('new_position')
+        if not isinstance(new_position, int) or isinstance(new_position, bool) or new_position < 0:
+            raise BatchError(400, 'A valid new_position integer is required')
+        from_list = self.card_for(op.get('card_id'))
+        return self.move(op['card_id'], op.get('new_list_id') or self.card_list[op['card_id']], new_position, from_list)
+
+    def move(self, card_id, list_id, index, from_list=None):
+        from_list = from_list or self.card_for(card_id)
+        to_list = self.list_for(list_id)
+
+        self.take(card_id)
+        position = self.place(card_id, list_id, index)
+        self.card_writes.append(UpdateOne({'_id': ObjectId(card_id)}, {'$set': {'position': position, 'list_id': list_id}}))
+
+        if from_list is not to_list:
+            self.count_task(from_list, -1)
+            self.count_task(to_list, 1)
+        if from_list['board_id'] != to_list['board_id']:
+            self.change(from_list['board_id'], 'card', card_id, 'delete')
+        self.change(to_list['board_id'], 'card', card_id, 'upsert')
+        return {'position': position}
+
+    def rename_list(self, op):
+        title = op.get('title')
+        if not title:
+            raise BatchError(400, 'New title is required')
+        list_id = op.get('list_id')
+        list_obj = self.list_for(list_id)
+
+        done_delta = int(self.is_done({'title': title})) - int(self.is_done(list_obj))
+        if done_delta:
+            self.counters.setdefault(list_obj['board_id'], [0, 0])[1] += done_delta * len(self.contents[list_id])
+        list_obj['title'] = title
+        self.list_writes.append(UpdateOne({'_id': ObjectId(list_id)}, {'$set': {'title': title}}))
+        self.change(list_obj['board_id'], 'list', list_id, 'upsert')
+
+    def delete_card(self, op):
+        card_id = op.get('card_id')
+        list_obj = self.card_for(card_id)
+
+        self.take(card_id)
+        self.card_writes.append(DeleteOne({'_id': ObjectId(card_id)}))
+        self.count_task(list_obj, -1)
+        self.change(list_obj['board_id'], 'card', card_id, 'delete')
+
+    def delete_list(self, op):
+        list_id = op.get('list_id')
+        list_obj = self.list_for(list_id)
+
+        removed = self.contents.pop(list_id)
+        for _, card_id in removed:
+            del self.card_list[card_id]
+        del self.lists[list_id]
+        self.card_writes.append(DeleteMany({'list_id': list_id}))
+        self.list_writes.append(DeleteOne({'_id': ObjectId(list_id)}))
+
+        self.count_task(list_obj, -len(removed))
+        self.change(list_obj['board_id'], 'list', list_id, 'delete')
@@ -0,0 +1,208 @@
+"""
+Small in-process caches.
+
+TTLCache is a bounded LRU map whose entries also expire after a fixed time.
+It is thread-safe and counts hits and misses so the hit ratio can be
+watched in production.
+
+SnapshotCache holds serialized responses (the JSON bytes of a board) under
+a key and the version they were built at. A lookup names the version it
+wants, so an entry stops being served the moment its board's version is
+bumped, with no expiry to tune; record_board_changes() also drops it right
+away to free the memory. Entries are evicted least recently used first once
+their total size passes max_bytes. An optional shared store (RedisStore)
+sits behind the local one, so replicas and workers reuse each other's
+snapshots.
+"""
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+log = logging.getLogger(__name__)
+
+
+class TTLCache:
+    def __init__(self, maxsize=1024, ttl=60.0, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (expires_at, value), least recently used first
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Cached value for key, or None on a miss or an expired entry."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= self.clock():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (self.clock() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'ttl': self.ttl
+            }
+
+
+class SnapshotCache:
+    def __init__(self, max_bytes=64 * 1024 * 1024, shared=None):
+        self.max_bytes = max_bytes
+        self.shared = shared  # RedisStore or None
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.bytes = 0
+        self._entries = OrderedDict()  # key -> (version, body), least recently used first
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        """
+        BOARD_CACHE_BYTES        local size limit, 0 disables the local tier (64 MiB)
+        BOARD_CACHE_REDIS_URL    shared store, e.g. redis://redis:6379/0 (none)
+        BOARD_CACHE_REDIS_TTL    seconds a shared entry lives unread (3600)
+        """
+        shared = None
+        url = os.environ.get('BOARD_CACHE_REDIS_URL')
+        if url:
+            import redis
+            shared = RedisStore(redis.Redis.from_url(url, socket_timeout=0.25, socket_connect_timeout=0.25),
+                                ttl=int(os.environ.get('BOARD_CACHE_REDIS_TTL', '3600')))
+        return cls(max_bytes=int(os.environ.get('BOARD_CACHE_BYTES', str(64 * 1024 * 1024))), shared=shared)
+
+    def get(self, key, version):
+        """The body stored for key at exactly this version, or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                self._drop(key)
+
+        body = self.shared.get(key, version) if self.shared else None
+        with self._lock:
+            if body is None:
+                self.misses += 1
+                return None
+            self.shared_hits += 1
+        self._store(key, version, body)
+        return body
+
+    def set(self, key, version, body):
+        self._store(key, version, body)
+        if self.shared:
+            self.shared.set(key, version, body)
+
+    def invalidate(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+        if self.shared:
+            self.shared.invalidate(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def _store(self, key, version, body):
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (version, body)
+            self.bytes += len(body)
+            while self.bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _drop(self, key):
+        _, body = self._entries.pop(key)
+        self.bytes -= len(body)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.shared_hits + self.misses
+            return {
+                'hits': self.hits,
+                'shared_hits': self.shared_hits,
+                'misses': self.misses,
+                'hit_ratio': (self.hits + self.shared_hits) / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'size': len(self._entries),
+                'bytes': self.bytes,
+                'max_bytes': self.max_bytes,
+                'shared_errors': self.shared.errors if self.shared else 0
+            }
+
+
+class RedisStore:
+    """
+    SnapshotCache's shared tier: one Redis key per cache key, holding the
+    version and the body. Redis errors count as misses (and in `errors`),
+    so an unreachable Redis slows nothing down beyond its socket timeout.
+    Set Redis' maxmemory-policy to allkeys-lru to bound its size too.
+    """
+
+    def __init__(self, client, prefix='trello:snapshot:', ttl=3600):
+        self.client = client
+        self.prefix = prefix
+        self.ttl = ttl
+        self.errors = 0
+
+    def get(self, key, version):
+        stored = self._call(self.client.get, self.prefix + key)
+        if stored is None:
+            return None
+        stored_version, _, body = stored.partition(b'\n')
+        return body if stored_version == str(version).encode() else None
+
+    def set(self, key, version, body):
+        self._call(self.client.set, self.prefix + key, str(version).encode() + b'\n' + body, ex=self.ttl)
+
+    def invalidate(self, key):
+        self._call(self.client.delete, self.prefix + key)
+
+    def _call(self, method, *args, **kwargs):
+        try:
+            return method(*args, **kwargs)
+        except Exception as e:
+            self.errors += 1
+            log.warning("Shared snapshot cache unavailable: %s", e, extra={'event': 'snapshot_cache_error'})
+            return None
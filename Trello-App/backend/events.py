@@ -0,0 +1,173 @@
+"""
+Board event buses for live updates.
+
+Every change-log entry written by record_board_changes() is also an event
+for the board's subscribers. Two interchangeable backends deliver them:
+
+  InProcessBus      fan-out through in-memory queues. Publishers and
+                    subscribers must share a process, so this fits a single
+                    backend pod (the default).
+  ChangeStreamBus   one Mongo change stream per process watches inserts
+                    into the board_changes collection and fans them out to
+                    the process's subscribers like InProcessBus, so an event
+                    written by any replica reaches clients of every replica
+                    for one cursor and connection however many are open.
+                    Needs a replica set; publish() is a no-op because the
+                    change log insert is the event. The stream opens with
+                    the first subscriber and closes once none are left.
+
+subscribe() returns a Subscription; get(timeout) yields the next event dict
+or None when nothing arrived in time (the SSE route sends a heartbeat). A
+subscriber that must not block a thread (the ASGI route) passes notify, which
+is called from the delivering thread after each event and typically wakes an
+event loop, then reads with get(timeout=0).
+"""
+import logging
+import queue
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+# Per-subscriber backlog; a client that falls this far behind is told to resync
+SUBSCRIBER_QUEUE_SIZE = 256
+
+CHANGE_LOG_INSERTS = [{'$match': {'operationType': 'insert'}}]
+# How long an idle change stream waits for an event before checking for subscribers
+CHANGE_STREAM_AWAIT_MS = 1000
+# How long subscribe() waits for the stream to open, and the pause before reopening a lost one
+CHANGE_STREAM_OPEN_SECONDS = 5
+CHANGE_STREAM_RETRY_SECONDS = 5
+
+OVERFLOW = {'type': 'resync'}
+
+
+class Subscription:
+    def __init__(self, on_close=None, notify=None):
+        self._queue = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self._on_close = on_close
+        self._notify = notify
+        self.closed = False
+
+    def deliver(self, event):
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            # Drop the backlog; the client reloads the board instead of replaying it
+            with self._queue.mutex:
+                self._queue.queue.clear()
+            self._queue.put_nowait(OVERFLOW)
+        if self._notify:
+            self._notify()
+
+    def get(self, timeout):
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            if self._on_close:
+                self._on_close(self)
+
+
+class InProcessBus:
+    def __init__(self):
+        self._subscribers = {}  # board_id -> set of Subscription
+        self._lock = threading.Lock()
+
+    def publish(self, board_id, event):
+        self._fan_out(board_id, event)
+
+    def _fan_out(self, board_id, event):
+        """Deliver to the subscribers of board_id, or to every subscriber when board_id is None."""
+        with self._lock:
+            if board_id is None:
+                subscribers = [s for board in self._subscribers.values() for s in board]
+            else:
+                subscribers = list(self._subscribers.get(str(board_id), ()))
+        for subscription in subscribers:
+            subscription.deliver(event)
+
+    def subscribe(self, board_id, notify=None):
+        board_id = str(board_id)
+
+        def unsubscribe(subscription):
+            with self._lock:
+                subscribers = self._subscribers.get(board_id)
+                if subscribers:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._subscribers[board_id]
+
+        subscription = Subscription(on_close=unsubscribe, notify=notify)
+        with self._lock:
+            self._subscribers.setdefault(board_id, set()).add(subscription)
+        return subscription
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(s) for s in self._subscribers.values())
+
+
+class ChangeStreamBus(InProcessBus):
+    def __init__(self, changes_collection):
+        super().__init__()
+        self.changes_collection = changes_collection
+        self._watching = None  # threading.Event of the running watcher, set once its stream is open
+
+    def publish(self, board_id, event):
+        pass
+
+    def subscribe(self, board_id, notify=None):
+        subscription = super().subscribe(board_id, notify)
+        with self._lock:
+            if self._watching is None:
+                self._watching = threading.Event()
+                threading.Thread(target=self._watch, args=(self._watching,), name='change-stream', daemon=True).start()
+            watching = self._watching
+        # As with a stream of its own, events written after subscribe() returns are delivered
+        watching.wait(CHANGE_STREAM_OPEN_SECONDS)
+        return subscription
+
+    def _watch(self, watching):
+        while True:
+            opened = False
+            try:
+                with self.changes_collection.watch(CHANGE_LOG_INSERTS, max_await_time_ms=CHANGE_STREAM_AWAIT_MS) as stream:
+                    opened = True
+                    watching.set()
+                    while stream.alive:
+                        change = stream.try_next()
+                        if change is not None:
+                            entry = change['fullDocument']
+                            self._fan_out(entry['board_id'], {
+                                'type': 'change', 'version': entry['version'], 'changes': entry['changes']})
+                        elif not self._keep_watching(watching):
+                            return
+            except Exception as e:
+                log.warning("Board change stream failed: %s", e, extra={'event': 'change_stream_failed'})
+            watching.set()
+            if not self._keep_watching(watching):
+                return
+            if opened:
+                # Events may have been missed while the stream was down; clients reload their boards
+                self._fan_out(None, OVERFLOW)
+            time.sleep(CHANGE_STREAM_RETRY_SECONDS)
+
+    def _keep_watching(self, watching):
+        """False, and the watcher is retired, once no subscriber is left."""
+        with self._lock:
+            if self._subscribers:
+                return True
+            if self._watching is watching:
+                self._watching = None
+            return False
+
+
+def create_bus(kind, changes_collection=None):
+    if kind == 'changestream':
+        return ChangeStreamBus(changes_collection)
+    return InProcessBus()
@@ -0,0 +1,90 @@
+"""
+Index registry for the Trello collections.
+
+INDEXES declares, per collection, the indexes that the API's query shapes
+rely on. ensure_indexes() applies them at every startup (create_indexes is a
+no-op for indexes that already exist), and index_report() compares the
+registry with what the server actually has and with $indexStats usage.
+
+Index names are left to Mongo's defaults (e.g. 'list_id_1_position_1__id_1') so
+indexes created by hand or by older versions of the app are recognised.
+"""
+import logging
+import os
+
+from pymongo import ASCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+log = logging.getLogger(__name__)
+
+# How long board change log entries are kept before Mongo's TTL monitor drops them
+CHANGE_LOG_TTL_SECONDS = int(os.environ.get('CHANGE_LOG_TTL_SECONDS', str(7 * 24 * 3600)))
+
+INDEXES = {
+    'users': [
+        # signup / login look users up by name
+        IndexModel([('username', ASCENDING)], unique=True),
+    ],
+    'boards': [
+        # GET /boards: a user's boards, narrowed to Work / Personal by title
+        IndexModel([('user_id', ASCENDING), ('title', ASCENDING)]),
+    ],
+    'lists': [
+        # find({'board_id': ...}).sort([position, _id]), keyset pages of GET /lists
+        # and the home page $lookup
+        IndexModel([('board_id', ASCENDING), ('position', ASCENDING), ('_id', ASCENDING)]),
+    ],
+    'cards': [
+        # find({'list_id': ...}).sort([position, _id]), keyset pages of GET /cards
+        # and the home page $lookup
+        IndexModel([('list_id', ASCENDING), ('position', ASCENDING), ('_id', ASCENDING)]),
+        # project card of a sub-board (progress counters); only project cards have the field
+        IndexModel([('sub_board_id', ASCENDING)], sparse=True),
+    ],
+    'board_changes': [
+        # GET /boards/<id>/changes?since=: a board's entries after a version
+        IndexModel([('board_id', ASCENDING), ('version', ASCENDING)], unique=True),
+        # compaction: entries expire, and clients that fall behind get a snapshot
+        IndexModel([('at', ASCENDING)], expireAfterSeconds=CHANGE_LOG_TTL_SECONDS),
+    ],
+}
+
+
+def index_name(model):
+    return model.document['name']
+
+
+def ensure_indexes(db, registry=INDEXES):
+    """Create every registered index that is missing. Returns {collection: [index names]}."""
+    applied = {}
+    for collection_name, models in registry.items():
+        try:
+            applied[collection_name] = db[collection_name].create_indexes(models)
+        except OperationFailure as e:
+            # An index with the same keys but different options already exists;
+            # keep serving and let index_report() surface it.
+            log.warning("Could not create indexes on %s: %s", collection_name, e, extra={'event': 'index_conflict'})
+            applied[collection_name] = []
+    return applied
+
+
+def index_report(db, registry=INDEXES):
+    """
+    For each collection, report registered indexes that are missing on the
+    server, indexes with no recorded use since the server started
+    ($indexStats), and indexes on the server that the registry does not know.
+    """
+    report = {}
+    for collection_name, models in registry.items():
+        collection = db[collection_name]
+        expected = [index_name(m) for m in models]
+        existing = [ix['name'] for ix in collection.list_indexes()]
+        usage = {s['name']: s['accesses']['ops'] for s in collection.aggregate([{'$indexStats': {}}])}
+
+        report[collection_name] = {
+            'missing': [name for name in expected if name not in existing],
+            'unused': [name for name in existing if name != '_id_' and usage.get(name, 0) == 0],
+            'unregistered': [name for name in existing if name != '_id_' and name not in expected],
+            'ops': usage
+        }
+    return report
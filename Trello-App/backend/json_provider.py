@@ -0,0 +1,124 @@
+"""
+JSON encoding for API responses.
+
+ApiJSONProvider is Flask's JSON provider with orjson underneath when it is
+installed (the stdlib encoder otherwise). Mongo values are encoded natively:
+ObjectId as its hex string and datetime as ISO 8601 (naive values are UTC),
+so routes can return documents without converting their ids first.
+
+Documents passed through api_document() are also given the API's field
+names while they are encoded:
+
+  sub_board_id -> subBoardId
+  name         -> title        (boards created with only a name)
+
+Only documents that have one of those fields are marked (as ApiDocument);
+everything else is encoded by orjson without calling back into Python, so a
+read route hands its documents to jsonify() as they came from Mongo and each
+one is walked once, by the encoder.
+
+Output matches Flask's default provider: keys sorted, compact separators,
+and indented in debug mode.
+"""
+import json
+from datetime import date, datetime, timezone
+
+from bson import ObjectId
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+RENAMES = {'sub_board_id': 'subBoardId'}
+
+
+class ApiDocument(dict):
+    """A Mongo document that is renamed to API field names when encoded."""
+    __slots__ = ()
+
+
+def api_document(doc):
+    """doc, marked for renaming if it has fields the API names differently."""
+    if 'sub_board_id' in doc or 'name' in doc:
+        return ApiDocument(doc)
+    return doc
+
+
+def api_fields(doc):
+    fields = {RENAMES.get(key, key): value for key, value in doc.items()}
+    if 'name' in fields and 'title' not in fields:
+        fields['title'] = fields.pop('name')
+    return fields
+
+
+def utc_isoformat(o):
+    return (o if o.tzinfo else o.replace(tzinfo=timezone.utc)).isoformat()
+
+
+# Exact-type dispatch keeps the per-value callback cheap; subclasses fall through
+ENCODERS = {
+    ApiDocument: api_fields,
+    ObjectId: str,
+    datetime: utc_isoformat,
+    date: date.isoformat
+}
+
+
+def encode_value(o):
+    """The JSON value for types neither encoder handles on its own."""
+    encoder = ENCODERS.get(type(o))
+    if encoder is not None:
+        return encoder(o)
+    if isinstance(o, ApiDocument):
+        return api_fields(o)
+    if isinstance(o, ObjectId):
+        return str(o)
+    if isinstance(o, datetime):
+        return utc_isoformat(o)
+    if isinstance(o, date):
+        return o.isoformat()
+    raise TypeError(f"Object of type {type(o).__name__} is not JSON serializable")
+
+
+def plain(o):
+    """
+    Stdlib fallback: json.dumps encodes dict subclasses itself and never
+    calls default() for them, so ApiDocuments are renamed (and ObjectIds
+    converted) in one walk up front.
+    """
+    if isinstance(o, dict):
+        return {k: plain(v) for k, v in (api_fields(o) if isinstance(o, ApiDocument) else o).items()}
+    if isinstance(o, list):
+        return [plain(v) for v in o]
+    if type(o) is ObjectId:
+        return str(o)
+    return o
+
+
+class ApiJSONProvider(DefaultJSONProvider):
+    def _orjson_options(self, indent):
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_SUBCLASS | orjson.OPT_NAIVE_UTC
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return option
+
+    def dumps(self, obj, **kwargs):
+        if orjson is not None:
+            return orjson.dumps(obj, default=encode_value, option=self._orjson_options(kwargs.get('indent'))).decode()
+        kwargs.setdefault('default', encode_value)
+        kwargs.setdefault('ensure_ascii', self.ensure_ascii)
+        kwargs.setdefault('sort_keys', self.sort_keys)
+        return json.dumps(plain(obj), **kwargs)
+
+    def response(self, *args, **kwargs):
+        if orjson is None:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+        # Bytes straight into the response; no str round trip
+        body = orjson.dumps(obj, default=encode_value, option=self._orjson_options(indent))
+        return self._app.response_class(body + b"\n", mimetype=self.mimetype)
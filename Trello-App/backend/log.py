@@ -0,0 +1,162 @@
+"""
+Structured, non-blocking logging.
+
+configure_logging() routes every logger through a QueueHandler: the calling
+thread only formats the message and enqueues the record; a background
+QueueListener writes one JSON object per line to stdout. When the queue is
+full, records are dropped (and counted) rather than blocking the request.
+
+    log = logging.getLogger(__name__)
+    log.info("card moved", extra={'event': 'card_moved', 'card_id': card_id})
+
+Fields passed in `extra` become JSON keys. Fields that look like secrets
+(REDACTED_FIELDS) are never written, whatever the caller passes.
+
+Settings (environment):
+  LOG_LEVEL       root level                                   (INFO)
+  LOG_LEVELS      per-logger levels, "backend.ranking=DEBUG,werkzeug=WARNING"
+  LOG_SAMPLE      share of records kept per event, "card_moved=0.01"
+                  (DEFAULT_SAMPLE_RATES; other events are always kept)
+  LOG_QUEUE_SIZE  records waiting to be written before new ones are dropped (10000)
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+from datetime import datetime, timezone
+
+# Per event, the share of records that are written
+DEFAULT_SAMPLE_RATES = {'card_moved': 0.01}
+
+REDACTED_FIELDS = frozenset({'password', 'password_hash', 'token', 'authorization', 'secret', 'secret_key'})
+
+# Attributes every LogRecord has; anything else came from `extra`
+RECORD_ATTRIBUTES = frozenset(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+def parse_pairs(value, convert):
+    """'a=1,b=2' -> {'a': convert('1'), 'b': convert('2')}"""
+    pairs = {}
+    for item in (value or '').split(','):
+        if item.strip():
+            name, _, setting = item.partition('=')
+            pairs[name.strip()] = convert(setting.strip())
+    return pairs
+
+
+class JSONFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in RECORD_ATTRIBUTES and not key.startswith('_'):
+                entry[key] = '[redacted]' if key.lower() in REDACTED_FIELDS else value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Keep a `rates[event]` share of the records carrying that event."""
+
+    def __init__(self, rates):
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record):
+        rate = self.rates.get(getattr(record, 'event', None))
+        return rate is None or random.random() < rate
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Never blocks: a record that does not fit in the queue is counted and dropped."""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Resolve args and the traceback here, where they are valid; the
+        # listener thread only serializes
+        record = logging.makeLogRecord(vars(record))
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_state = {}
+_state_lock = threading.Lock()
+
+
+def configure_logging(stream=None):
+    """
+    Install the queue handler on the root logger and start its writer
+    thread. Safe to call more than once; a forked child gets its own writer.
+    """
+    with _state_lock:
+        if _state.get('pid') == os.getpid():
+            return _state['handler']
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+
+        log_queue = queue.Queue(maxsize=int(os.environ.get('LOG_QUEUE_SIZE', '10000')))
+        handler = DroppingQueueHandler(log_queue)
+        rates = {**DEFAULT_SAMPLE_RATES, **parse_pairs(os.environ.get('LOG_SAMPLE'), float)}
+        handler.addFilter(SamplingFilter(rates))
+        output = logging.StreamHandler(stream or sys.stdout)
+        output.setFormatter(JSONFormatter())
+        listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+        listener.start()
+
+        root.addHandler(handler)
+        root.setLevel(os.environ.get('LOG_LEVEL', 'INFO').upper())
+        for name, level in parse_pairs(os.environ.get('LOG_LEVELS'), str.upper).items():
+            logging.getLogger(name).setLevel(level)
+
+        _state.update(pid=os.getpid(), handler=handler, listener=listener, stream=stream)
+        return handler
+
+
+def stop_logging():
+    """Write out what is queued and stop the writer thread."""
+    with _state_lock:
+        listener = _state.pop('listener', None)
+        _state.pop('pid', None)
+    if listener is not None:
+        listener.stop()
+
+
+def _restart_after_fork():
+    # The writer thread did not survive the fork, and _state_lock may have
+    # been held by another thread when it happened
+    global _state_lock
+    _state_lock = threading.Lock()
+    if _state.pop('pid', None) is not None:
+        _state.pop('listener', None)
+        configure_logging(_state.get('stream'))
+
+
+atexit.register(stop_logging)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_restart_after_fork)
@@ -0,0 +1,1175 @@
+"""
+Indexed in-memory storage engine (STORAGE_BACKEND=memory, see storage.py).
+
+MemoryDatabase and MemoryCollection implement the part of pymongo's
+Database and Collection API the app uses: find / find_one with sort, skip
+and limit, inserts, updates (with upsert), deletes, bulk_write,
+find_one_and_update, count_documents, distinct, and aggregate() with the
+$match, $sort, $skip, $limit, $project, $set, $unset and $lookup stages.
+Writes return pymongo's own result types, so callers can't tell the engines
+apart.
+
+Indexes come from the same registry as Mongo's (indexes.INDEXES, applied by
+ensure_indexes()). An index on (list_id, position, _id) becomes a dict keyed
+by list_id whose buckets keep their documents sorted by (position, _id):
+
+  find({'list_id': x}).sort(POSITION_ORDER)   one bucket, already in order
+  find({'list_id': {'$in': [...]}})           only those buckets
+  find({'_id': ...})                          the primary dict
+
+$lookup sub-pipelines that start with $match {$expr: {$eq: ['$field',
+'$$var']}} use the same indexes, so the home page tree costs one bucket read
+per board and per list, as it does on Mongo. Unique indexes are enforced
+(DuplicateKeyError), TTL indexes expire documents, and $indexStats reports
+how often each index was used.
+
+Documents are copied in and out: callers may mutate what they get back.
+Every operation runs under one lock per database. Sessions are accepted and
+ignored (each write is applied whole anyway); change streams are not
+supported.
+
+Like MongoClient(event_listeners=...), MemoryDatabase(event_listeners=...)
+tells pymongo CommandListeners about every command it runs, one per
+round trip the same call would make to Mongo (bulk_write sends one command
+per run of inserts, updates or deletes), so tools that count commands see
+the same numbers on both engines. Other kinds of listener (connection pool,
+server monitoring) are accepted and never called: there is no pool.
+"""
+import bisect
+import itertools
+import re
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+
+from bson import ObjectId, Regex
+from bson.errors import InvalidId
+from pymongo import IndexModel, ReturnDocument, monitoring
+from pymongo.errors import BulkWriteError, DuplicateKeyError, InvalidOperation, OperationFailure
+from pymongo.operations import DeleteMany, DeleteOne, InsertOne, UpdateMany, UpdateOne
+from pymongo.results import BulkWriteResult, DeleteResult, InsertManyResult, InsertOneResult, UpdateResult
+
+# Like Mongo's TTL monitor, expired documents are removed at most once a minute
+TTL_MONITOR_SECONDS = 60
+
+# A field that is not there: sorts and compares like null, but $type and $set tell them apart
+MISSING = type('Missing', (), {'__repr__': lambda self: 'MISSING'})()
+
+
+# --- Values ---
+
+def utc_naive(value):
+    return value.astimezone(timezone.utc).replace(tzinfo=None) if value.tzinfo else value
+
+
+def sort_key(value):
+    """A key that orders values the way Mongo does across types (null < numbers < strings < ...)."""
+    t = type(value)
+    if t is str:
+        return (3, value)
+    if t is int or t is float:
+        return (2, value)
+    if t is ObjectId:
+        return (7, value)
+    if value is None or value is MISSING:
+        return (1, 0)
+    if t is bool:
+        return (8, value)
+    if isinstance(value, datetime):
+        return (9, utc_naive(value))
+    if isinstance(value, (int, float)):
+        return (2, value)
+    if isinstance(value, str):
+        return (3, value)
+    if isinstance(value, dict):
+        return (4, tuple((k, sort_key(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple)):
+        return (5, tuple(sort_key(v) for v in value))
+    if isinstance(value, bytes):
+        return (6, value)
+    return (10, str(value))
+
+
+def compare(a, b):
+    a, b = sort_key(a), sort_key(b)
+    return (a > b) - (a < b)
+
+
+def copy_value(value):
+    """Deep copy of a document; scalars (ObjectId, datetime, ...) are immutable and shared."""
+    if isinstance(value, dict):
+        return {k: copy_value(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [copy_value(v) for v in value]
+    return value
+
+
+def get_path(doc, path):
+    value = doc
+    for part in path.split('.'):
+        if isinstance(value, dict) and part in value:
+            value = value[part]
+        else:
+            return MISSING
+    return value
+
+
+def set_path(doc, path, value):
+    *parents, last = path.split('.')
+    for part in parents:
+        doc = doc.setdefault(part, {})
+    doc[last] = value
+
+
+def unset_path(doc, path):
+    *parents, last = path.split('.')
+    for part in parents:
+        doc = doc.get(part)
+        if not isinstance(doc, dict):
+            return
+    doc.pop(last, None)
+
+
+def type_name(value):
+    if value is MISSING:
+        return 'missing'
+    if value is None:
+        return 'null'
+    if isinstance(value, bool):
+        return 'bool'
+    if isinstance(value, int):
+        return 'int' if -2 ** 31 <= value < 2 ** 31 else 'long'
+    if isinstance(value, float):
+        return 'double'
+    if isinstance(value, str):
+        return 'string'
+    if isinstance(value, ObjectId):
+        return 'objectId'
+    if isinstance(value, datetime):
+        return 'date'
+    if isinstance(value, dict):
+        return 'object'
+    if isinstance(value, list):
+        return 'array'
+    if isinstance(value, bytes):
+        return 'binData'
+    return type(value).__name__
+
+
+def is_null(value):
+    return value is None or value is MISSING
+
+
+def truthy(value):
+    if is_null(value) or value is False:
+        return False
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return value != 0
+    return True
+
+
+# --- Query matching ---
+
+def is_operator_dict(condition):
+    return isinstance(condition, dict) and bool(condition) and all(k.startswith('$') for k in condition)
+
+
+def is_pattern(value):
+    return isinstance(value, (re.Pattern, Regex))
+
+
+def regex_matches(value, pattern, options=''):
+    if isinstance(pattern, Regex):
+        pattern = pattern.try_compile()
+    elif not isinstance(pattern, re.Pattern):
+        flags = sum(getattr(re, f.upper(), 0) for f in options if f in 'imsx')
+        pattern = re.compile(pattern, flags)
+    values = value if isinstance(value, list) else [value]
+    return any(isinstance(v, str) and pattern.search(v) is not None for v in values)
+
+
+def equals(value, target):
+    """Field equality: an array field matches if it or any of its elements equals target."""
+    if is_pattern(target):
+        return regex_matches(value, target)
+    if isinstance(value, list) and not isinstance(target, list):
+        return any(sort_key(v) == sort_key(target) for v in value)
+    return sort_key(value) == sort_key(target)
+
+
+def compares(value, target, accept):
+    """$gt & co. only compare values of the same type bracket, as Mongo does."""
+    rank = sort_key(target)[0]
+    values = value if isinstance(value, list) else [value]
+    return any(v is not MISSING and sort_key(v)[0] == rank and accept(compare(v, target)) for v in values)
+
+
+FIELD_OPERATORS = {
+    '$eq': equals,
+    '$ne': lambda value, arg: not equals(value, arg),
+    '$gt': lambda value, arg: compares(value, arg, lambda c: c > 0),
+    '$gte': lambda value, arg: compares(value, arg, lambda c: c >= 0),
+    '$lt': lambda value, arg: compares(value, arg, lambda c: c < 0),
+    '$lte': lambda value, arg: compares(value, arg, lambda c: c <= 0),
+    '$in': lambda value, arg: any(equals(value, a) for a in arg),
+    '$nin': lambda value, arg: not any(equals(value, a) for a in arg),
+    '$exists': lambda value, arg: (value is not MISSING) == bool(arg),
+    '$not': lambda value, arg: not field_matches(value, arg),
+    '$size': lambda value, arg: isinstance(value, list) and len(value) == arg,
+    '$type': lambda value, arg: type_name(value) in (arg if isinstance(arg, list) else [arg]),
+}
+
+
+def field_matches(value, condition):
+    if not is_operator_dict(condition):
+        return equals(value, condition)
+    for op, arg in condition.items():
+        if op == '$options':
+            continue
+        if op == '$regex':
+            if not regex_matches(value, arg, condition.get('$options', '')):
+                return False
+            continue
+        test = FIELD_OPERATORS.get(op)
+        if test is None:
+            raise OperationFailure(f'unknown operator: {op}', 2)
+        if not test(value, arg):
+            return False
+    return True
+
+
+def matches(doc, query, variables=None):
+    for key, condition in query.items():
+        if key == '$and':
+            if not all(matches(doc, q, variables) for q in condition):
+                return False
+        elif key == '$or':
+            if not any(matches(doc, q, variables) for q in condition):
+                return False
+        elif key == '$nor':
+            if any(matches(doc, q, variables) for q in condition):
+                return False
+        elif key == '$expr':
+            if not truthy(evaluate(condition, doc, variables)):
+                return False
+        elif key.startswith('$'):
+            raise OperationFailure(f'unknown top level operator: {key}', 2)
+        elif not field_matches(get_path(doc, key), condition):
+            return False
+    return True
+
+
+def equality_values(query, field):
+    """Values query requires field to equal (from a literal, $eq or $in), or None if unconstrained."""
+    condition = query.get(field, MISSING)
+    if condition is not MISSING:
+        if is_operator_dict(condition):
+            if '$eq' in condition:
+                condition = condition['$eq']
+            elif '$in' in condition and not any(isinstance(v, (list, dict)) or is_pattern(v) for v in condition['$in']):
+                return list(condition['$in'])
+            else:
+                condition = MISSING
+        if condition is not MISSING and not isinstance(condition, (list, dict)) and not is_pattern(condition):
+            return [condition]
+    for subquery in query.get('$and', ()):
+        values = equality_values(subquery, field)
+        if values is not None:
+            return values
+    return None
+
+
+def expr_equalities(query, variables):
+    """
+    {field: value} for a $match on {$expr: {$eq: ['$field', '$$var']}}, the
+    shape $lookup sub-pipelines join on, so the planner can use an index.
+    """
+    expr = query.get('$expr')
+    if not isinstance(expr, dict) or list(expr) != ['$eq'] or not isinstance(expr['$eq'], list) or len(expr['$eq']) != 2:
+        return {}
+
+    def is_field(e):
+        return isinstance(e, str) and e.startswith('$') and not e.startswith('$$')
+
+    field, other = expr['$eq']
+    if is_field(other):
+        field, other = other, field
+    if not is_field(field) or is_field(other):
+        return {}
+    value = evaluate(other, {}, variables)
+    if value is MISSING or isinstance(value, (list, dict)):
+        return {}
+    return {field[1:]: value}
+
+
+# --- Aggregation expressions ---
+
+def evaluate(expr, doc, variables):
+    if isinstance(expr, str) and expr.startswith('$'):
+        if expr.startswith('$$'):
+            name, _, path = expr[2:].partition('.')
+            value = doc if name in ('ROOT', 'CURRENT') else (variables or {}).get(name, MISSING)
+            return get_path(value, path) if path else value
+        return get_path(doc, expr[1:])
+    if isinstance(expr, list):
+        return [evaluate(e, doc, variables) for e in expr]
+    if isinstance(expr, dict):
+        if len(expr) == 1:
+            op, = expr
+            if op.startswith('$'):
+                operator = EXPRESSIONS.get(op)
+                if operator is None:
+                    raise OperationFailure(f'Unrecognized expression {op!r}', 168)
+                return operator(expr[op], doc, variables)
+        return {k: evaluate(v, doc, variables) for k, v in expr.items()}
+    return expr
+
+
+def operands(arg, doc, variables):
+    return [evaluate(a, doc, variables) for a in (arg if isinstance(arg, list) else [arg])]
+
+
+def comparison(accept):
+    def operator(arg, doc, variables):
+        a, b = operands(arg, doc, variables)
+        return accept(compare(a, b))
+    return operator
+
+
+def arithmetic(fn):
+    def operator(arg, doc, variables):
+        values = operands(arg, doc, variables)
+        if any(is_null(v) for v in values):
+            return None
+        return fn(values)
+    return operator
+
+
+def divide(values):
+    a, b = values
+    if b == 0:
+        raise OperationFailure("can't $divide by zero", 16608)
+    return a / b
+
+
+def multiply(values):
+    product = 1
+    for v in values:
+        product *= v
+    return product
+
+
+def contains(item, array):
+    return any(compare(item, a) == 0 for a in array)
+
+
+def cond(arg, doc, variables):
+    if isinstance(arg, dict):
+        arg = [arg['if'], arg['then'], arg['else']]
+    test, then, otherwise = arg
+    return evaluate(then if truthy(evaluate(test, doc, variables)) else otherwise, doc, variables)
+
+
+def if_null(arg, doc, variables):
+    for expr in arg[:-1]:
+        value = evaluate(expr, doc, variables)
+        if not is_null(value):
+            return value
+    return evaluate(arg[-1], doc, variables)
+
+
+def to_string(value):
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, datetime):
+        return utc_naive(value).isoformat(timespec='milliseconds') + 'Z'
+    if isinstance(value, (str, int, float, ObjectId)):
+        return str(value)
+    raise OperationFailure(f'Unsupported conversion from {type_name(value)} to string', 241)
+
+
+def to_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise OperationFailure(f'Failed to convert {type_name(value)} to int', 241)
+
+
+def to_double(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        raise OperationFailure(f'Failed to convert {type_name(value)} to double', 241)
+
+
+def to_object_id(value):
+    if isinstance(value, ObjectId):
+        return value
+    try:
+        return ObjectId(value)
+    except (InvalidId, TypeError):
+        raise OperationFailure(f'Failed to parse objectId {value!r}', 241)
+
+
+CONVERSIONS = {
+    'string': to_string,
+    'int': to_int,
+    'long': to_int,
+    'double': to_double,
+    'objectId': to_object_id,
+    'bool': truthy,
+}
+
+
+def conversion(fn):
+    def operator(arg, doc, variables):
+        value = evaluate(arg, doc, variables)
+        return None if is_null(value) else fn(value)
+    return operator
+
+
+def convert(arg, doc, variables):
+    value = evaluate(arg['input'], doc, variables)
+    if is_null(value):
+        return evaluate(arg.get('onNull'), doc, variables)
+    try:
+        return CONVERSIONS[arg['to']](value)
+    except OperationFailure:
+        if 'onError' not in arg:
+            raise
+        return evaluate(arg['onError'], doc, variables)
+
+
+EXPRESSIONS = {
+    '$literal': lambda arg, doc, variables: arg,
+    '$eq': comparison(lambda c: c == 0),
+    '$ne': comparison(lambda c: c != 0),
+    '$gt': comparison(lambda c: c > 0),
+    '$gte': comparison(lambda c: c >= 0),
+    '$lt': comparison(lambda c: c < 0),
+    '$lte': comparison(lambda c: c <= 0),
+    '$and': lambda arg, doc, variables: all(truthy(v) for v in operands(arg, doc, variables)),
+    '$or': lambda arg, doc, variables: any(truthy(v) for v in operands(arg, doc, variables)),
+    '$not': lambda arg, doc, variables: not truthy(operands(arg, doc, variables)[0]),
+    '$in': lambda arg, doc, variables: contains(*operands(arg, doc, variables)),
+    '$cond': cond,
+    '$ifNull': if_null,
+    '$type': lambda arg, doc, variables: type_name(operands(arg, doc, variables)[0]),
+    '$size': lambda arg, doc, variables: len(operands(arg, doc, variables)[0]),
+    '$add': arithmetic(sum),
+    '$subtract': arithmetic(lambda values: values[0] - values[1]),
+    '$multiply': arithmetic(multiply),
+    '$divide': arithmetic(divide),
+    '$concat': arithmetic(''.join),
+    '$toString': conversion(to_string),
+    '$toInt': conversion(to_int),
+    '$toDouble': conversion(to_double),
+    '$toObjectId': conversion(to_object_id),
+    '$convert': convert,
+}
+
+
+# --- Documents in and out ---
+
+def normalize_sort(key_or_list, direction=None):
+    if isinstance(key_or_list, str):
+        return [(key_or_list, direction or 1)]
+    if isinstance(key_or_list, dict):
+        return list(key_or_list.items())
+    return [(key, direction) for key, direction in key_or_list]
+
+
+def sort_documents(docs, sort):
+    for field, direction in reversed(sort):
+        docs.sort(key=lambda d: sort_key(get_path(d, field)), reverse=direction < 0)
+    return docs
+
+
+def project(doc, projection):
+    """A copy of doc with a find() projection (top-level fields) applied."""
+    if not projection:
+        return copy_value(doc)
+    if isinstance(projection, (list, tuple)):
+        projection = dict.fromkeys(projection, 1)
+    fields = {k: v for k, v in projection.items() if k != '_id'}
+    if any(fields.values()) or (not fields and projection.get('_id')):
+        keep_id = projection.get('_id', 1)
+        return {k: copy_value(v) for k, v in doc.items() if (keep_id if k == '_id' else fields.get(k))}
+    return {k: copy_value(v) for k, v in doc.items() if projection.get(k, 1)}
+
+
+def apply_update(doc, update, inserting=False):
+    """Apply update operators to doc in place."""
+    if not update or not all(op.startswith('$') for op in update):
+        raise ValueError('update only works with $ operators')
+    for op, fields in update.items():
+        if op == '$setOnInsert' and not inserting:
+            continue
+        for path, value in fields.items():
+            current = get_path(doc, path)
+            if op in ('$set', '$setOnInsert'):
+                set_path(doc, path, copy_value(value))
+            elif op == '$unset':
+                unset_path(doc, path)
+            elif op == '$inc':
+                if current is MISSING:
+                    set_path(doc, path, value)
+                elif isinstance(current, (int, float)) and not isinstance(current, bool):
+                    set_path(doc, path, current + value)
+                else:
+                    raise OperationFailure(f'Cannot apply $inc to a value of non-numeric type {type_name(current)}', 14)
+            elif op in ('$min', '$max'):
+                order = 0 if current is MISSING else compare(value, current)
+                if current is MISSING or (order < 0 if op == '$min' else order > 0):
+                    set_path(doc, path, copy_value(value))
+            elif op == '$push':
+                items = value['$each'] if is_operator_dict(value) and '$each' in value else [value]
+                if current is MISSING:
+                    set_path(doc, path, copy_value(list(items)))
+                elif isinstance(current, list):
+                    current.extend(copy_value(list(items)))
+                else:
+                    raise OperationFailure(f'The field {path!r} must be an array', 2)
+            else:
+                raise OperationFailure(f'Unknown modifier: {op}', 9)
+
+
+def upsert_seed(query):
+    """The document an upsert starts from: the query's equality conditions."""
+    seed = {}
+    for key, condition in query.items():
+        if key.startswith('$'):
+            continue
+        if is_operator_dict(condition):
+            if '$eq' in condition:
+                set_path(seed, key, copy_value(condition['$eq']))
+        else:
+            set_path(seed, key, copy_value(condition))
+    return seed
+
+
+WRITE_COMMANDS = (('insert', InsertOne), ('update', (UpdateOne, UpdateMany)), ('delete', (DeleteOne, DeleteMany)))
+
+
+def write_commands(requests, ordered):
+    """
+    bulk_write() requests grouped into commands the way pymongo sends them:
+    runs of the same kind when ordered, one command per kind otherwise.
+    Returns [(command name, [(index, request), ...]), ...].
+    """
+    kinds = []
+    for i, request in enumerate(requests):
+        kind = next((name for name, types in WRITE_COMMANDS if isinstance(request, types)), None)
+        if kind is None:
+            raise TypeError(f'{request!r} is not a supported write operation')
+        kinds.append((kind, i, request))
+    if not kinds:
+        raise InvalidOperation('No operations to execute')
+    if not ordered:
+        return [(name, [(i, r) for kind, i, r in kinds if kind == name])
+                for name, _ in WRITE_COMMANDS if any(kind == name for kind, _, _ in kinds)]
+    commands = []
+    for kind, i, request in kinds:
+        if commands and commands[-1][0] == kind:
+            commands[-1][1].append((i, request))
+        else:
+            commands.append((kind, [(i, request)]))
+    return commands
+
+
+class CommandEvent:
+    """The parts of pymongo's CommandStarted/Succeeded/FailedEvent that listeners read."""
+
+    def __init__(self, command_name, collection, request_id, duration=None, failure=None):
+        self.command_name = command_name
+        self.command = {command_name: collection.name}
+        self.database_name = collection.database.name
+        self.request_id = self.operation_id = request_id
+        self.connection_id = ('memory', 0)
+        self.duration_micros = None if duration is None else int(duration * 1e6)
+        self.failure = failure
+
+
+class ResultCursor:
+    """Iterator over results that are already computed (aggregate, list_indexes)."""
+
+    def __init__(self, docs):
+        self._docs = iter(docs)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self._docs)
+
+    next = __next__
+
+    def close(self):
+        self._docs = iter(())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class MemoryCursor(ResultCursor):
+    """find()'s cursor: sort / skip / limit are applied when iteration starts."""
+
+    def __init__(self, collection, query, projection, sort=None, skip=0, limit=0):
+        self._collection = collection
+        self._query = query or {}
+        self._projection = projection
+        self._sort = normalize_sort(sort) if sort else None
+        self._skip = skip
+        self._limit = limit
+        self._docs = None
+
+    def sort(self, key_or_list, direction=None):
+        self._sort = normalize_sort(key_or_list, direction)
+        return self
+
+    def skip(self, skip):
+        self._skip = skip
+        return self
+
+    def limit(self, limit):
+        self._limit = abs(limit)
+        return self
+
+    def batch_size(self, batch_size):
+        return self
+
+    def __next__(self):
+        if self._docs is None:
+            self._docs = iter(self._collection._find(
+                self._query, self._projection, self._sort, self._skip, self._limit))
+        return next(self._docs)
+
+    next = __next__
+
+
+# --- Indexes ---
+
+class Index:
+    """
+    One registered index: a dict from the leading field's value to a bucket
+    of documents kept sorted by the remaining fields, then _id.
+    """
+
+    def __init__(self, name, keys, unique=False, sparse=False, expire_after=None):
+        self.name = name
+        self.keys = keys
+        self.field = keys[0][0]
+        self.fields = [field for field, _ in keys]
+        # Buckets are kept in ascending order; other directions only narrow lookups
+        self.order = self.fields[1:] if all(d == 1 for _, d in keys[1:]) else []
+        self.unique = unique
+        self.sparse = sparse
+        self.expire_after = expire_after
+        self.buckets = {}  # sort_key(leading value) -> ([entry keys], [documents])
+        self.ops = 0
+        self.since = datetime.utcnow()
+
+    def covers(self, doc):
+        return not self.sparse or any(get_path(doc, f) is not MISSING for f in self.fields)
+
+    def entry_key(self, doc):
+        return tuple(sort_key(get_path(doc, f)) for f in self.order) + (sort_key(doc['_id']),)
+
+    def add(self, doc):
+        if not self.covers(doc):
+            return
+        keys, docs = self.buckets.setdefault(sort_key(get_path(doc, self.field)), ([], []))
+        entry = self.entry_key(doc)
+        i = bisect.bisect(keys, entry)
+        keys.insert(i, entry)
+        docs.insert(i, doc)
+
+    def remove(self, doc):
+        if not self.covers(doc):
+            return
+        bucket_key = sort_key(get_path(doc, self.field))
+        keys, docs = self.buckets[bucket_key]
+        i = bisect.bisect_left(keys, self.entry_key(doc))
+        del keys[i], docs[i]
+        if not keys:
+            del self.buckets[bucket_key]
+
+    def bucket(self, value):
+        return self.buckets.get(sort_key(value), ((), ()))[1]
+
+    def duplicates(self, doc):
+        """Whether another document has the same values for every field of this (unique) index."""
+        if not self.covers(doc):
+            return False
+        keys, docs = self.buckets.get(sort_key(get_path(doc, self.field)), ((), ()))
+        prefix = tuple(sort_key(get_path(doc, f)) for f in self.order)
+        i = bisect.bisect_left(keys, prefix)
+        while i < len(keys) and keys[i][:len(prefix)] == prefix:
+            other = docs[i]
+            if other is not doc and all(sort_key(get_path(other, f)) == sort_key(get_path(doc, f)) for f in self.fields):
+                return True
+            i += 1
+        return False
+
+    def serves(self, sort):
+        """Whether a single bucket is already in `sort` order."""
+        order = self.order + ['_id']
+        return len(sort) <= len(order) and all(f == order[i] and d == 1 for i, (f, d) in enumerate(sort))
+
+    def describe(self):
+        info = {'v': 2, 'key': dict(self.keys), 'name': self.name}
+        if self.unique:
+            info['unique'] = True
+        if self.sparse:
+            info['sparse'] = True
+        if self.expire_after is not None:
+            info['expireAfterSeconds'] = self.expire_after
+        return info
+
+
+# --- Collections ---
+
+class MemoryCollection:
+    def __init__(self, database, name):
+        self.database = database
+        self.name = name
+        self.full_name = f'{database.name}.{name}'
+        self._lock = database.lock
+        self._docs = {}  # _id -> document
+        self._indexes = {}  # name -> Index, besides _id_ (self._docs)
+        self._id_ops = 0
+        self._created = datetime.utcnow()
+        self._next_expiry = 0
+
+    # Planning and reads (callers hold the lock)
+
+    def _plan(self, query, variables=None):
+        """Documents that may match query and the index they were read through (None if not one bucket)."""
+        hints = expr_equalities(query, variables)
+        plan = self._indexed({**hints, **query} if hints else query)
+        return plan if plan is not None else (list(self._docs.values()), None)
+
+    def _indexed(self, query):
+        """
+        (documents, index) read through the narrowest index, or None when only
+        a full scan will do. An $or whose every branch is indexed reads the
+        union of the branches, as Mongo does.
+        """
+        ids = equality_values(query, '_id')
+        if ids is not None:
+            self._id_ops += 1
+            found = (self._docs.get(i) for i in dict.fromkeys(ids))
+            return [d for d in found if d is not None], None
+
+        best = None
+        for index in self._indexes.values():
+            values = equality_values(query, index.field)
+            if values is None or (index.sparse and any(is_null(v) for v in values)):
+                continue
+            buckets = [index.bucket(v) for v in {sort_key(v): v for v in values}.values()]
+            size = sum(len(b) for b in buckets)
+            if best is None or size < best[0]:
+                best = (size, index, buckets)
+        if best is not None:
+            _, index, buckets = best
+            index.ops += 1
+            if len(buckets) == 1:
+                return buckets[0], index
+            return [d for b in buckets for d in b], None
+
+        branches = [self._indexed(q) for q in query.get('$or', ())]
+        if branches and all(plan is not None for plan in branches):
+            union = {}
+            for docs, _ in branches:
+                for doc in docs:
+                    union.setdefault(doc['_id'], doc)
+            return list(union.values()), None
+        return None
+
+    def _select(self, query, sort=None, variables=None):
+        self._expire()
+        docs, index = self._plan(query, variables)
+        selected = [d for d in docs if matches(d, query, variables)] if query else list(docs)
+        if sort and not (index and index.serves(sort)):
+            sort_documents(selected, sort)
+        return selected
+
+    def _find(self, query, projection, sort, skip, limit):
+        with self._lock, self._command('find'):
+            docs = self._select(query, sort)
+            if skip:
+                docs = docs[skip:]
+            if limit:
+                docs = docs[:limit]
+            return [project(d, projection) for d in docs]
+
+    def _expire(self):
+        now = time.monotonic()
+        if now < self._next_expiry:
+            return
+        self._next_expiry = now + TTL_MONITOR_SECONDS
+        for index in list(self._indexes.values()):
+            if index.expire_after is None:
+                continue
+            cutoff = datetime.utcnow() - timedelta(seconds=index.expire_after)
+            for doc in list(self._docs.values()):
+                at = get_path(doc, index.field)
+                if isinstance(at, datetime) and utc_naive(at) < cutoff:
+                    self._remove(doc)
+
+    # Writes (callers hold the lock)
+
+    def _check_unique(self, doc):
+        for index in self._indexes.values():
+            if index.unique and index.duplicates(doc):
+                raise DuplicateKeyError(
+                    f'E11000 duplicate key error collection: {self.full_name} index: {index.name}', 11000)
+
+    def _insert(self, document):
+        if '_id' not in document:
+            # pymongo sets the generated _id on the caller's document too
+            document['_id'] = ObjectId()
+        doc = copy_value(dict(document))
+        if doc['_id'] in self._docs:
+            raise DuplicateKeyError(f'E11000 duplicate key error collection: {self.full_name} index: _id_', 11000)
+        self._check_unique(doc)
+        self._docs[doc['_id']] = doc
+        for index in self._indexes.values():
+            index.add(doc)
+        return doc['_id']
+
+    def _remove(self, doc):
+        for index in self._indexes.values():
+            index.remove(doc)
+        del self._docs[doc['_id']]
+
+    def _modify(self, doc, update):
+        """Apply update to a stored document, keeping indexes in step. Returns whether it changed."""
+        before = copy_value(doc)
+        for index in self._indexes.values():
+            index.remove(doc)
+        try:
+            apply_update(doc, update)
+            if sort_key(doc.get('_id')) != sort_key(before['_id']):
+                raise OperationFailure("Performing an update on the path '_id' would modify the immutable field '_id'", 66)
+            self._check_unique(doc)
+        except Exception:
+            doc.clear()
+            doc.update(before)
+            raise
+        finally:
+            for index in self._indexes.values():
+                index.add(doc)
+        return doc != before
+
+    def _update(self, query, update, upsert=False, multi=False):
+        docs = self._select(query)
+        if not multi:
+            docs = docs[:1]
+        result = {'n': len(docs), 'nModified': sum(self._modify(d, update) for d in docs)}
+        if not docs and upsert:
+            doc = upsert_seed(query)
+            apply_update(doc, update, inserting=True)
+            result['upserted'] = self._insert(doc)
+            result['n'] = 1
+        return result
+
+    def _delete(self, query, multi=False):
+        docs = self._select(query)
+        if not multi:
+            docs = docs[:1]
+        for doc in docs:
+            self._remove(doc)
+        return len(docs)
+
+    # pymongo Collection API
+
+    def find(self, filter=None, projection=None, skip=0, limit=0, sort=None, session=None, **kwargs):
+        return MemoryCursor(self, filter, projection, sort, skip, limit)
+
+    def find_one(self, filter=None, projection=None, *args, session=None, **kwargs):
+        if filter is not None and not isinstance(filter, dict):
+            filter = {'_id': filter}
+        return next(iter(self.find(filter, projection, *args, **kwargs).limit(1)), None)
+
+    def count_documents(self, filter, session=None, **kwargs):
+        with self._lock, self._command('aggregate'):
+            return len(self._select(filter))
+
+    def estimated_document_count(self, **kwargs):
+        return len(self._docs)
+
+    def distinct(self, key, filter=None, session=None, **kwargs):
+        values = {}
+        with self._lock, self._command('distinct'):
+            for doc in self._select(filter or {}):
+                value = get_path(doc, key)
+                for v in (value if isinstance(value, list) else [value]):
+                    if v is not MISSING:
+                        values.setdefault(sort_key(v), copy_value(v))
+        return list(values.values())
+
+    def insert_one(self, document, session=None, **kwargs):
+        with self._lock, self._command('insert'):
+            return InsertOneResult(self._insert(document), True)
+
+    def insert_many(self, documents, ordered=True, session=None, **kwargs):
+        requests = [InsertOne(d) for d in documents]
+        self.bulk_write(requests, ordered=ordered)
+        return InsertManyResult([r._doc['_id'] for r in requests], True)
+
+    def update_one(self, filter, update, upsert=False, session=None, **kwargs):
+        with self._lock, self._command('update'):
+            return UpdateResult(self._update(filter, update, upsert), True)
+
+    def update_many(self, filter, update, upsert=False, session=None, **kwargs):
+        with self._lock, self._command('update'):
+            return UpdateResult(self._update(filter, update, upsert, multi=True), True)
+
+    def delete_one(self, filter, session=None, **kwargs):
+        with self._lock, self._command('delete'):
+            return DeleteResult({'n': self._delete(filter)}, True)
+
+    def delete_many(self, filter, session=None, **kwargs):
+        with self._lock, self._command('delete'):
+            return DeleteResult({'n': self._delete(filter, multi=True)}, True)
+
+    def find_one_and_update(self, filter, update, projection=None, sort=None, upsert=False,
+                            return_document=ReturnDocument.BEFORE, session=None, **kwargs):
+        with self._lock, self._command('findAndModify'):
+            docs = self._select(filter, normalize_sort(sort) if sort else None)
+            if docs:
+                before = project(docs[0], projection)
+                self._modify(docs[0], update)
+                return project(docs[0], projection) if return_document else before
+            if upsert:
+                doc = upsert_seed(filter)
+                apply_update(doc, update, inserting=True)
+                doc_id = self._insert(doc)
+                return project(self._docs[doc_id], projection) if return_document else None
+            return None
+
+    def bulk_write(self, requests, ordered=True, session=None, **kwargs):
+        result = {'writeErrors': [], 'writeConcernErrors': [], 'nInserted': 0, 'nUpserted': 0,
+                  'nMatched': 0, 'nModified': 0, 'nRemoved': 0, 'upserted': []}
+        with self._lock:
+            for command, run in write_commands(requests, ordered):
+                with self._command(command):
+                    self._write(run, ordered, result)
+                if ordered and result['writeErrors']:
+                    break
+        if result['writeErrors']:
+            raise BulkWriteError(result)
+        return BulkWriteResult(result, True)
+
+    def _write(self, run, ordered, result):
+        """Apply [(index, request)] of one write command, collecting counts and errors in result."""
+        for i, request in run:
+            try:
+                if isinstance(request, InsertOne):
+                    self._insert(request._doc)
+                    result['nInserted'] += 1
+                elif isinstance(request, (UpdateOne, UpdateMany)):
+                    updated = self._update(request._filter, request._doc, request._upsert,
+                                           multi=isinstance(request, UpdateMany))
+                    if 'upserted' in updated:
+                        result['nUpserted'] += 1
+                        result['upserted'].append({'index': i, '_id': updated['upserted']})
+                    else:
+                        result['nMatched'] += updated['n']
+                    result['nModified'] += updated['nModified']
+                else:
+                    result['nRemoved'] += self._delete(request._filter, multi=isinstance(request, DeleteMany))
+            except OperationFailure as e:
+                result['writeErrors'].append({'index': i, 'code': e.code, 'errmsg': str(e)})
+                if ordered:
+                    return
+
+    def aggregate(self, pipeline, session=None, **kwargs):
+        with self._lock, self._command('aggregate'):
+            return ResultCursor([copy_value(d) for d in self._aggregate(list(pipeline))])
+
+    def _aggregate(self, pipeline, variables=None):
+        """Run pipeline over this collection; results may share values with stored documents."""
+        if pipeline and '$indexStats' in pipeline[0]:
+            docs, pipeline = self._index_stats(), pipeline[1:]
+        elif pipeline and '$match' in pipeline[0]:
+            # A leading $match (and $sort) is answered through the indexes, like a find()
+            sort = pipeline[1].get('$sort') if len(pipeline) > 1 else None
+            docs = self._select(pipeline[0]['$match'], normalize_sort(sort) if sort else None, variables)
+            pipeline = pipeline[2 if sort else 1:]
+        else:
+            docs = list(self._docs.values())
+
+        for stage in pipeline:
+            (name, spec), = stage.items()
+            run = getattr(self, '_stage_' + name[1:], None)
+            if run is None:
+                raise OperationFailure(f'Unrecognized pipeline stage name: {name!r}', 40324)
+            docs = run(docs, spec, variables)
+        return docs
+
+    def _stage_match(self, docs, spec, variables):
+        return [d for d in docs if matches(d, spec, variables)]
+
+    def _stage_sort(self, docs, spec, variables):
+        return sort_documents(list(docs), normalize_sort(spec))
+
+    def _stage_skip(self, docs, spec, variables):
+        return docs[spec:]
+
+    def _stage_limit(self, docs, spec, variables):
+        return docs[:spec]
+
+    def _stage_set(self, docs, spec, variables):
+        out = []
+        for doc in docs:
+            new = dict(doc)
+            for field, expr in spec.items():
+                value = evaluate(expr, doc, variables)
+                if value is MISSING:
+                    new.pop(field, None)
+                else:
+                    new[field] = value
+            out.append(new)
+        return out
+
+    _stage_addFields = _stage_set
+
+    def _stage_unset(self, docs, spec, variables):
+        fields = {spec} if isinstance(spec, str) else set(spec)
+        return [{k: v for k, v in d.items() if k not in fields} for d in docs]
+
+    def _stage_project(self, docs, spec, variables):
+        computed = {k: v for k, v in spec.items() if not isinstance(v, (bool, int))}
+        flags = {k: v for k, v in spec.items() if k not in computed}
+        if not computed and not any(v for k, v in flags.items() if k != '_id') and flags.get('_id', 0) == 0:
+            return [project(d, flags) for d in docs]
+        out = []
+        for doc in docs:
+            new = project(doc, {**flags, **dict.fromkeys(computed, 1)})
+            for field, expr in computed.items():
+                value = evaluate(expr, doc, variables)
+                if value is not MISSING:
+                    new[field] = value
+            out.append(new)
+        return out
+
+    def _stage_lookup(self, docs, spec, variables):
+        foreign = self.database[spec['from']]
+        out = []
+        for doc in docs:
+            pipeline = list(spec.get('pipeline', []))
+            if 'localField' in spec:
+                local = get_path(doc, spec['localField'])
+                values = local if isinstance(local, list) else [None if local is MISSING else local]
+                pipeline.insert(0, {'$match': {spec['foreignField']: {'$in': values}}})
+            scope = dict(variables or {})
+            scope.update((name, evaluate(expr, doc, variables)) for name, expr in spec.get('let', {}).items())
+            out.append({**doc, spec['as']: foreign._aggregate(pipeline, scope)})
+        return out
+
+    def _index_stats(self):
+        stats = [{'name': '_id_', 'key': {'_id': 1}, 'accesses': {'ops': self._id_ops, 'since': self._created}}]
+        for index in self._indexes.values():
+            stats.append({'name': index.name, 'key': dict(index.keys), 'accesses': {'ops': index.ops, 'since': index.since}})
+        return stats
+
+    def create_indexes(self, indexes, session=None, **kwargs):
+        names = []
+        with self._lock, self._command('createIndexes'):
+            for model in indexes:
+                spec = model.document
+                names.append(spec['name'])
+                if spec['name'] in self._indexes:
+                    continue
+                index = Index(spec['name'], list(spec['key'].items()), unique=spec.get('unique', False),
+                              sparse=spec.get('sparse', False), expire_after=spec.get('expireAfterSeconds'))
+                for doc in self._docs.values():
+                    index.add(doc)
+                if index.unique and any(index.duplicates(d) for d in self._docs.values()):
+                    raise OperationFailure(f'E11000 duplicate key error collection: {self.full_name} index: {index.name}', 11000)
+                self._indexes[index.name] = index
+        return names
+
+    def create_index(self, keys, session=None, **kwargs):
+        return self.create_indexes([IndexModel(keys, **kwargs)])[0]
+
+    def list_indexes(self, session=None, **kwargs):
+        with self._lock, self._command('listIndexes'):
+            return ResultCursor([{'v': 2, 'key': {'_id': 1}, 'name': '_id_'}] +
+                                [index.describe() for index in self._indexes.values()])
+
+    def index_information(self, session=None, **kwargs):
+        return {ix.pop('name'): {**ix, 'key': list(ix['key'].items())} for ix in self.list_indexes()}
+
+    def drop(self, session=None, **kwargs):
+        self.database.drop_collection(self.name)
+
+    def watch(self, *args, **kwargs):
+        raise OperationFailure('The $changeStream stage is only supported on replica sets', 40573)
+
+    @contextmanager
+    def _command(self, name):
+        listeners = self.database.listeners
+        if not listeners:
+            yield
+            return
+        request_id = next(self.database.request_ids)
+        for listener in listeners:
+            listener.started(CommandEvent(name, self, request_id))
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception as e:
+            event = CommandEvent(name, self, request_id, time.perf_counter() - start,
+                                 failure={'errmsg': str(e), 'code': getattr(e, 'code', None)})
+            for listener in listeners:
+                listener.failed(event)
+            raise
+        event = CommandEvent(name, self, request_id, time.perf_counter() - start)
+        for listener in listeners:
+            listener.succeeded(event)
+
+
+class MemoryDatabase:
+    def __init__(self, name='trello', event_listeners=()):
+        self.name = name
+        self.lock = threading.RLock()
+        self.listeners = [l for l in event_listeners if isinstance(l, monitoring.CommandListener)]
+        self.request_ids = itertools.count(1)
+        self._collections = {}
+
+    def __getitem__(self, name):
+        with self.lock:
+            if name not in self._collections:
+                self._collections[name] = MemoryCollection(self, name)
+            return self._collections[name]
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return self[name]
+
+    get_collection = __getitem__
+
+    def list_collection_names(self, session=None, **kwargs):
+        with self.lock:
+            return list(self._collections)
+
+    def drop_collection(self, name, session=None, **kwargs):
+        with self.lock:
+            collection = self._collections.pop(name, None)
+            if collection is not None:
+                collection._docs.clear()
+                collection._indexes.clear()
+
+    def command(self, command, *args, **kwargs):
+        name = command if isinstance(command, str) else next(iter(command))
+        if name == 'ping':
+            return {'ok': 1.0}
+        raise OperationFailure(f'no such command: {name!r}', 59)
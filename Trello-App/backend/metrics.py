@@ -0,0 +1,260 @@
+"""
+Prometheus metrics, served by GET /metrics in the text exposition format
+(version 0.0.4).
+
+Counters, gauges and histograms are updated in place under a short lock per
+metric: a request pays a dict lookup and an add or two. Values that already
+live elsewhere (cache hit counts, database command totals) are read when the
+endpoint is scraped, through registry.collector(), so they cost nothing on
+the hot path.
+
+Each process keeps its own numbers; with several workers, scrape each one
+(Prometheus adds the instance label).
+"""
+import bisect
+import math
+import threading
+import time
+
+from flask import g, request
+from pymongo import monitoring
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Seconds. Request and database latency, from a cache hit to a slow aggregate
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Seconds. Waiting for a pooled connection is normally ~0
+POOL_WAIT_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+
+def format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(names, values, extra=''):
+    pairs = [f'{name}="{escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = {}  # label values tuple -> value
+        self._lock = threading.Lock()
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        with self._lock:
+            values = sorted(self._values.items())
+        for labels, value in values:
+            lines.append(f'{self.name}{format_labels(self.labels, labels)} {format_value(value)}')
+        return lines
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, labels=(), amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def inc(self, labels=(), amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, labels=(), amount=1):
+        self.inc(labels, -amount)
+
+    def set(self, labels=(), value=0):
+        with self._lock:
+            self._values[labels] = value
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, labels=()):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(labels)
+            if series is None:
+                # Per-bucket counts (the last is +Inf), sum
+                series = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        with self._lock:
+            values = sorted((labels, (list(counts), total)) for labels, (counts, total) in self._values.items())
+        for labels, (counts, total) in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                le = f'le="{format_value(float(bound))}"'
+                lines.append(f'{self.name}_bucket{format_labels(self.labels, labels, le)} {cumulative}')
+            lines.append(f'{self.name}_sum{format_labels(self.labels, labels)} {format_value(total)}')
+            lines.append(f'{self.name}_count{format_labels(self.labels, labels)} {cumulative}')
+        return lines
+
+
+class Sampled:
+    """A metric whose samples a collector produces at scrape time."""
+
+    def __init__(self, kind, name, documentation, labels=()):
+        self.kind = kind
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.samples = []  # (label values, value)
+
+    def add(self, labels, value):
+        self.samples.append((labels, value))
+        return self
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        for labels, value in self.samples:
+            lines.append(f'{self.name}{format_labels(self.labels, labels)} {format_value(value)}')
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []
+
+    def counter(self, name, documentation, labels=()):
+        return self._register(Counter(name, documentation, labels))
+
+    def gauge(self, name, documentation, labels=()):
+        return self._register(Gauge(name, documentation, labels))
+
+    def histogram(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram(name, documentation, labels, buckets))
+
+    def _register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def collector(self, fn):
+        """Register fn() -> iterable of Sampled, called on every scrape. Usable as a decorator."""
+        self.collectors.append(fn)
+        return fn
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        for collect in self.collectors:
+            for metric in collect():
+                lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+class PoolMetrics(monitoring.ConnectionPoolListener):
+    """
+    How long requests wait to check a connection out of pymongo's pool, and
+    how many are checked out. Waits that keep growing mean maxPoolSize (or
+    the server) is the bottleneck, not the app.
+    """
+
+    def __init__(self, registry):
+        self.wait = registry.histogram('trello_mongo_pool_checkout_seconds',
+                                       'Time spent waiting to check a connection out of the pool.',
+                                       buckets=POOL_WAIT_BUCKETS)
+        self.failures = registry.counter('trello_mongo_pool_checkout_failures_total',
+                                         'Connection checkouts that failed, by reason.', ('reason',))
+        self.checked_out = registry.gauge('trello_mongo_pool_checked_out_connections',
+                                          'Connections currently checked out of the pool.')
+        self._started = threading.local()
+
+    def connection_check_out_started(self, event):
+        self._started.at = time.perf_counter()
+
+    def connection_checked_out(self, event):
+        self.wait.observe(time.perf_counter() - getattr(self._started, 'at', time.perf_counter()))
+        self.checked_out.inc()
+
+    def connection_check_out_failed(self, event):
+        self.wait.observe(time.perf_counter() - getattr(self._started, 'at', time.perf_counter()))
+        self.failures.inc((event.reason,))
+
+    def connection_checked_in(self, event):
+        self.checked_out.dec()
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        pass
+
+
+class RequestMetrics:
+    """Request counts and latency by endpoint, and requests in flight."""
+
+    def __init__(self, registry):
+        self.requests = registry.counter('trello_http_requests_total', 'Requests handled, by endpoint, method and status.',
+                                         ('endpoint', 'method', 'status'))
+        self.latency = registry.histogram('trello_http_request_duration_seconds',
+                                          'Time from receiving a request to returning its response.',
+                                          ('endpoint', 'method'))
+        self.in_flight = registry.gauge('trello_http_requests_in_flight', 'Requests being handled right now.')
+
+    def init_app(self, app):
+        app.before_request(self._start)
+        app.after_request(self._observe)
+        app.teardown_request(self._finish)
+
+    def _start(self):
+        g.metrics_started = time.perf_counter()
+        self.in_flight.inc()
+
+    def _observe(self, response):
+        started = g.get('metrics_started')
+        if started is not None:
+            endpoint = request.endpoint or 'unmatched'
+            self.latency.observe(time.perf_counter() - started, (endpoint, request.method))
+            self.requests.inc((endpoint, request.method, str(response.status_code)))
+        return response
+
+    def _finish(self, exc=None):
+        if g.pop('metrics_started', None) is not None:
+            self.in_flight.dec()
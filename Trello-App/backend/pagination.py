@@ -0,0 +1,123 @@
+"""
+Keyset pagination and sparse fieldsets for GET /lists and GET /cards.
+
+Pages are ordered by (position, _id), the order the UI shows, and a page
+ends with an opaque cursor for the last document it returned. The next page
+is everything strictly after that key, so a page costs one index range scan
+on board_id/list_id + position + _id however deep the client has paged,
+and moves or inserts between requests never shift an offset.
+
+Query parameters:
+  limit   page size, 1..MAX_PAGE_SIZE (default MAX_PAGE_SIZE)
+  after   cursor from the previous page's X-Next-Cursor header
+  fields  comma-separated field names, e.g. fields=title,position; becomes
+          a Mongo projection. '_id' is always returned.
+
+The response body stays a bare JSON array; when more documents follow, the
+cursor for the next page is sent in the X-Next-Cursor header.
+"""
+import base64
+import json
+import os
+import re
+
+from bson import ObjectId
+from bson.errors import InvalidId
+
+from .json_provider import api_document
+from .ranking import POSITION_ORDER
+
+MAX_PAGE_SIZE = int(os.environ.get('MAX_PAGE_SIZE', '1000'))
+
+FIELD_NAME = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+
+class PageError(ValueError):
+    """A malformed limit, cursor or field list (answered with 400)."""
+
+
+def encode_cursor(doc):
+    key = json.dumps([doc.get('position'), str(doc['_id'])], separators=(',', ':'))
+    return base64.urlsafe_b64encode(key.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        position, doc_id = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        if position is not None and (isinstance(position, bool) or not isinstance(position, (int, float))):
+            raise ValueError(position)
+        return position, ObjectId(doc_id)
+    except (ValueError, TypeError, InvalidId):
+        raise PageError('Invalid cursor')
+
+
+def after(position, doc_id):
+    """Documents that sort after (position, _id); missing positions sort first, as in Mongo."""
+    if position is None:
+        return {'$or': [{'position': None, '_id': {'$gt': doc_id}}, {'position': {'$ne': None}}]}
+    return {'$or': [{'position': {'$gt': position}}, {'position': position, '_id': {'$gt': doc_id}}]}
+
+
+def parse_limit(value):
+    if value is None:
+        return MAX_PAGE_SIZE
+    try:
+        limit = int(value)
+    except ValueError:
+        raise PageError('limit must be an integer')
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        raise PageError(f'limit must be between 1 and {MAX_PAGE_SIZE}')
+    return limit
+
+
+def parse_fields(value, aliases):
+    """Requested document fields (API names mapped back through aliases), or None for all."""
+    if value is None:
+        return None
+    fields = {f.strip() for f in value.split(',') if f.strip()}
+    for field in fields:
+        if not FIELD_NAME.match(field):
+            raise PageError(f'Invalid field: {field}')
+    return {aliases.get(f, f) for f in fields} | {'_id'}
+
+
+def page_query(query, args, aliases=None, derived=None):
+    """(query, projection, limit, fields to keep) for the page the request args ask for."""
+    limit = parse_limit(args.get('limit'))
+    keep = parse_fields(args.get('fields'), aliases or {})
+    if args.get('after'):
+        query = {'$and': [query, after(*decode_cursor(args['after']))]}
+
+    projection = None
+    if keep is not None:
+        projection = dict.fromkeys(keep | {'position'}, 1)
+        for field in keep:
+            projection.update(dict.fromkeys((derived or {}).get(field, ()), 1))
+    return query, projection, limit, keep
+
+
+def page_of(docs, limit, keep, serialize=None):
+    """The page in up to limit + 1 fetched documents: (documents, next cursor or None)."""
+    # One extra document tells whether another page follows
+    next_cursor = encode_cursor(docs[limit - 1]) if len(docs) > limit else None
+    docs = docs[:limit]
+
+    if serialize:
+        docs = [serialize(doc) for doc in docs]
+    if keep is not None:
+        docs = [api_document({k: v for k, v in doc.items() if k in keep}) for doc in docs]
+    return docs, next_cursor
+
+
+def paginate(collection, query, args, serialize=None, aliases=None, derived=None):
+    """
+    One page of collection.find(query) in (position, _id) order, driven by
+    the request args. Returns (documents, next cursor or None).
+
+    serialize is applied to each document before trimming it to the
+    requested fields; derived maps a returned field to the stored fields it
+    is computed from (e.g. a card's progress from its task counters).
+    """
+    query, projection, limit, keep = page_query(query, args, aliases, derived)
+    docs = list(collection.find(query, projection).sort(POSITION_ORDER).limit(limit + 1))
+    return page_of(docs, limit, keep, serialize)
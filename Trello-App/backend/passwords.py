@@ -0,0 +1,120 @@
+"""
+Password hashing off the request threads.
+
+Hashing is deliberately slow CPU work. Done on a request thread it holds the
+GIL, so a burst of sign-ins stalls every other request the process serves.
+PasswordHasher runs it in a pool of worker processes instead: the request
+thread just waits on the result, and cheap routes keep running meanwhile.
+
+At most `max_pending` hashes may be queued or running. Past that, hash() and
+verify() raise HasherBusy at once and the API answers 503 with Retry-After,
+rather than piling up requests that would time out anyway.
+
+Settings (environment):
+  PASSWORD_HASH_METHOD       werkzeug method for new hashes   (pbkdf2:sha256:260000)
+  PASSWORD_HASH_SALT_LENGTH                                   (16)
+  PASSWORD_HASH_WORKERS      worker processes; 0 hashes on the calling thread
+                             (the CPU limit, see serve.cpu_limit(); backend.serve
+                             splits it between its server workers)
+  PASSWORD_HASH_QUEUE        hashes queued or running before rejecting (4 per worker)
+
+Stored hashes made with another method (e.g. the single-round 'sha256' that
+older versions wrote) still verify; needs_rehash() tells login to replace
+them.
+"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+DEFAULT_METHOD = 'pbkdf2:sha256:260000'
+
+
+class HasherBusy(Exception):
+    """Too many hashes queued; retry later."""
+
+
+class PasswordHasher:
+    def __init__(self, method=DEFAULT_METHOD, salt_length=16, workers=None, max_pending=None):
+        self.method = method
+        self.salt_length = salt_length
+        if workers is None:
+            # The container's CPU quota, not the host's cores
+            from .serve import cpu_limit
+            workers = cpu_limit()
+        self.workers = workers
+        self.max_pending = max_pending if max_pending is not None else 4 * max(self.workers, 1)
+        self.rejected = 0
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+
+    @classmethod
+    def from_env(cls):
+        workers = os.environ.get('PASSWORD_HASH_WORKERS')
+        queue = os.environ.get('PASSWORD_HASH_QUEUE')
+        return cls(
+            method=os.environ.get('PASSWORD_HASH_METHOD', DEFAULT_METHOD),
+            salt_length=int(os.environ.get('PASSWORD_HASH_SALT_LENGTH', '16')),
+            workers=int(workers) if workers else None,
+            max_pending=int(queue) if queue else None
+        )
+
+    @property
+    def pending(self):
+        return self._pending
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method, self.salt_length)
+
+    def verify(self, stored_hash, password):
+        return self._run(check_password_hash, stored_hash, password)
+
+    def needs_rehash(self, stored_hash):
+        """True for hashes made with a method other than the configured one."""
+        return stored_hash.split('$', 1)[0] != self.method
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise HasherBusy()
+        with self._lock:
+            self._pending += 1
+        try:
+            if self.workers == 0:
+                return fn(*args)
+            return self._pool().submit(fn, *args).result()
+        except BrokenProcessPool:
+            # A worker died; start a fresh pool for the next call
+            with self._lock:
+                self._executor = None
+            raise
+        finally:
+            with self._lock:
+                self._pending -= 1
+            self._slots.release()
+
+    def _pool(self):
+        # Created on first use in each process, so a server that forks its
+        # workers after importing the app gives each its own pool
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                # forkserver, not fork: the app process has threads (logging,
+                # rebalancer) whose locks a forked child would inherit
+                context = multiprocessing.get_context('forkserver')
+                context.set_forkserver_preload(['werkzeug.security'])
+                self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+                self._pid = os.getpid()
+            return self._executor
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None and self._pid == os.getpid():
+                self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
@@ -0,0 +1,206 @@
+"""
+Fractional positions for lists and cards.
+
+A moved document gets a position halfway between its new neighbours, so a
+drag writes only the document that moved instead of renumbering the whole
+list. Integer positions written by older versions are already valid
+fractional positions; documents with no position at all are backfilled by
+rebalance() (see the 'migrate-positions' CLI command).
+
+Repeated moves into the same gap halve it each time. Once a gap falls below
+MIN_GAP the scope (a board's lists or a list's cards) is queued for a
+background rebalance that renumbers it 0..n.
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from pymongo import UpdateOne
+
+# ~20 moves into the same gap before a rebalance; far above float precision
+MIN_GAP = 1e-6
+
+# Renumbering passes before a rebalance that keeps losing to concurrent moves gives up
+REBALANCE_ATTEMPTS = 3
+
+log = logging.getLogger(__name__)
+
+POSITION_ORDER = [('position', 1), ('_id', 1)]
+
+
+def has_position(doc):
+    return isinstance(doc.get('position'), (int, float)) and not isinstance(doc.get('position'), bool)
+
+
+def position_between(before, after):
+    """A position strictly between two neighbour positions (None = list end)."""
+    if before is None and after is None:
+        return 0
+    if before is None:
+        return after - 1
+    if after is None:
+        return before + 1
+    return (before + after) / 2
+
+
+def gap_too_small(before, after):
+    return before is not None and after is not None and after - before < MIN_GAP
+
+
+def neighbours(collection, scope, moving_id, index):
+    """
+    The documents that will sit right before and after `index` once the
+    document `moving_id` is placed there (either may be None). An index of
+    None, or one past the end, appends.
+    """
+    others = {**scope, '_id': {'$ne': moving_id}}
+
+    def last():
+        found = list(collection.find(others, {'position': 1}).sort([('position', -1), ('_id', -1)]).limit(1))
+        return (found[0] if found else None), None
+
+    if index is None:
+        return last()
+    if index <= 0:
+        found = list(collection.find(others, {'position': 1}).sort(POSITION_ORDER).limit(1))
+        return None, (found[0] if found else None)
+
+    found = list(collection.find(others, {'position': 1}).sort(POSITION_ORDER).skip(index - 1).limit(2))
+    if not found:
+        return last()
+    return found[0], (found[1] if len(found) > 1 else None)
+
+
+def position_at(collection, scope, moving_id, index):
+    """
+    Position for placing `moving_id` at `index` within `scope`. Costs one
+    read; rebalances synchronously only if a neighbour predates positions.
+    """
+    before, after = neighbours(collection, scope, moving_id, index)
+    if (before and not has_position(before)) or (after and not has_position(after)):
+        rebalance(collection, scope)
+        before, after = neighbours(collection, scope, moving_id, index)
+
+    before_pos = before['position'] if before else None
+    after_pos = after['position'] if after else None
+    if gap_too_small(before_pos, after_pos):
+        schedule_rebalance(collection, scope)
+    return position_between(before_pos, after_pos)
+
+
+def plan_reorder(positions):
+    """
+    Given the current positions of documents listed in their new order,
+    return {index: new_position} for the fewest documents that must move.
+
+    Documents on the longest strictly increasing run of positions keep
+    them; everything else is spread evenly between its kept neighbours.
+    """
+    positions = list(positions)
+    n = len(positions)
+    # Longest increasing subsequence, O(n log n) with predecessor links
+    tails, tail_idx, prev = [], [], [-1] * n
+    for i, pos in enumerate(positions):
+        if pos is None:
+            continue
+        lo, hi = 0, len(tails)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if tails[mid] < pos:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo > 0:
+            prev[i] = tail_idx[lo - 1]
+        if lo == len(tails):
+            tails.append(pos)
+            tail_idx.append(i)
+        else:
+            tails[lo] = pos
+            tail_idx[lo] = i
+
+    keep = set()
+    i = tail_idx[-1] if tail_idx else -1
+    while i != -1:
+        keep.add(i)
+        i = prev[i]
+
+    moves = {}
+    i = 0
+    while i < n:
+        if i in keep:
+            i += 1
+            continue
+        run_end = i
+        while run_end < n and run_end not in keep:
+            run_end += 1
+        before = positions[i - 1] if i > 0 else None
+        after = positions[run_end] if run_end < n else None
+        count = run_end - i
+        for k in range(count):
+            if before is None and after is None:
+                moves[i + k] = k
+            elif before is None:
+                moves[i + k] = after - (count - k)
+            elif after is None:
+                moves[i + k] = before + k + 1
+            else:
+                moves[i + k] = before + (after - before) * (k + 1) / (count + 1)
+        # later runs measure their gap from the positions assigned here
+        for k in range(count):
+            positions[i + k] = moves[i + k]
+        i = run_end
+    return moves
+
+
+def rebalance(collection, scope):
+    """
+    Renumber every document in scope to 0..n in its current order; returns the number rewritten.
+
+    Each update only applies if the document still has the position that
+    was read, so a move that lands meanwhile is not undone. When one
+    misses, the scope is read and renumbered again from its new order.
+    """
+    rewritten = 0
+    for attempt in range(REBALANCE_ATTEMPTS):
+        docs = collection.find(scope, {'position': 1}).sort(POSITION_ORDER)
+        updates = [
+            # {'position': None} also matches documents without a position
+            UpdateOne({'_id': doc['_id'], 'position': doc.get('position')}, {'$set': {'position': idx}})
+            for idx, doc in enumerate(docs) if doc.get('position') != idx
+        ]
+        if not updates:
+            break
+        result = collection.bulk_write(updates, ordered=False)
+        rewritten += result.modified_count
+        if result.matched_count == len(updates):
+            break
+    else:
+        log.warning("Rebalance of %s kept racing with moves; left for the next one", scope,
+                    extra={'event': 'rebalance_contended'})
+    return rewritten
+
+
+_rebalancer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='rebalance')
+_pending = set()
+_pending_lock = threading.Lock()
+
+
+def schedule_rebalance(collection, scope):
+    """Queue a background rebalance of scope; repeated requests for a queued scope are dropped."""
+    key = (collection.name, tuple(sorted(scope.items())))
+    with _pending_lock:
+        if key in _pending:
+            return
+        _pending.add(key)
+
+    def run():
+        try:
+            rebalance(collection, scope)
+        except Exception:
+            log.exception("Rebalance of %s failed", key, extra={'event': 'rebalance_failed'})
+        finally:
+            with _pending_lock:
+                _pending.discard(key)
+
+    _rebalancer.submit(run)
@@ -0,0 +1,153 @@
+"""
+Reconciler for PUT /boards/<id>.
+
+The client sends the whole board structure, lists in order, each with its
+cards in order:
+
+  [{"_id": "...", "title": "To Do", "cards": [{"_id": "...", "title": "..."}, ...]}, ...]
+
+diff_board() matches it against the stored lists and cards by _id and plans
+the fewest writes that make the stored board look like it:
+
+  - lists and cards without a known _id are inserted (new ids are minted)
+  - known ones get an update only for what changed: title, list_id (a card
+    moved to another list) or position
+  - stored lists and cards missing from the submission are deleted
+
+Positions follow ranking.plan_reorder(), so documents that keep their
+relative order keep their positions too. Fields the structure doesn't carry
+(card type, githubUrl, sub_board_id, ...) are left alone. A title that is
+left out keeps the stored one.
+
+The diff also counts how the board's tasks change (cards added or removed,
+cards moved into or out of a Done list, lists renamed to or from Done), so
+the project card of a sub-board is adjusted like the per-card routes do.
+"""
+from bson import ObjectId
+from pymongo import DeleteMany, InsertOne, UpdateOne
+
+from .ranking import has_position, plan_reorder
+
+
+class StructureError(ValueError):
+    """A malformed structure (answered with 400)."""
+
+
+class BoardDiff:
+    def __init__(self):
+        self.list_writes = []
+        self.card_writes = []
+        self.changes = []  # change log entries, see app.record_board_changes()
+        self.counters = [0, 0]  # [total_delta, done_delta] of the board's tasks
+
+    def change(self, kind, doc_id, op):
+        self.changes.append({'kind': kind, 'id': str(doc_id), 'op': op})
+
+
+def take(stored_by_id, doc_id, seen, kind):
+    """The stored document a submitted _id refers to, or None for a new one."""
+    if doc_id is None or str(doc_id) not in stored_by_id:
+        return None
+    if str(doc_id) in seen:
+        raise StructureError(f'{kind} {doc_id} appears more than once')
+    seen.add(str(doc_id))
+    return stored_by_id[str(doc_id)]
+
+
+def positions_for(entries, scope_id, scope_key):
+    """plan_reorder() over entries [(stored or None, data)] in their submitted order."""
+    current = [
+        stored['position'] if stored and str(stored[scope_key]) == scope_id and has_position(stored) else None
+        for stored, _ in entries
+    ]
+    return plan_reorder(current)
+
+
+def diff_board(board_id, stored_lists, stored_cards, structure, is_done):
+    """is_done(list) tells whether a list's cards count as done tasks."""
+    if not isinstance(structure, list) or not all(isinstance(l, dict) for l in structure):
+        raise StructureError('Invalid payload, expecting a list of lists with cards')
+
+    lists_by_id = {str(l['_id']): l for l in stored_lists}
+    cards_by_id = {str(c['_id']): c for c in stored_cards}
+    seen_lists, seen_cards = set(), set()
+    diff = BoardDiff()
+    # Start from the stored tasks and count the submitted ones back in
+    diff.counters[0] -= len(stored_cards)
+    diff.counters[1] -= sum(1 for c in stored_cards if c['list_id'] in lists_by_id and is_done(lists_by_id[c['list_id']]))
+
+    list_entries = [(take(lists_by_id, l.get('_id'), seen_lists, 'List'), l) for l in structure]
+    list_moves = positions_for(list_entries, str(board_id), 'board_id')
+
+    for idx, (stored, list_data) in enumerate(list_entries):
+        if stored is None:
+            list_id = ObjectId()
+            title = list_data.get('title') or 'Untitled'
+            diff.list_writes.append(InsertOne({
+                '_id': list_id,
+                'board_id': str(board_id),
+                'title': title,
+                'type': 'regular',
+                'position': list_moves[idx]
+            }))
+            diff.change('list', list_id, 'upsert')
+        else:
+            list_id = stored['_id']
+            title = list_data.get('title', stored.get('title', ''))
+            updates = {}
+            if 'title' in list_data and list_data['title'] != stored.get('title'):
+                updates['title'] = list_data['title']
+            if idx in list_moves:
+                updates['position'] = list_moves[idx]
+            if updates:
+                diff.list_writes.append(UpdateOne({'_id': list_id}, {'$set': updates}))
+                diff.change('list', list_id, 'upsert')
+
+        cards = list_data.get('cards', [])
+        if not isinstance(cards, list) or not all(isinstance(c, dict) for c in cards):
+            raise StructureError('cards must be a list of objects')
+        diff.counters[0] += len(cards)
+        if is_done({'title': title}):
+            diff.counters[1] += len(cards)
+        card_entries = [(take(cards_by_id, c.get('_id'), seen_cards, 'Card'), c) for c in cards]
+        card_moves = positions_for(card_entries, str(list_id), 'list_id')
+
+        for card_idx, (stored_card, card_data) in enumerate(card_entries):
+            if stored_card is None:
+                card_id = ObjectId()
+                diff.card_writes.append(InsertOne({
+                    '_id': card_id,
+                    'list_id': str(list_id),
+                    'title': card_data.get('title') or 'Untitled',
+                    'type': 'card',
+                    'position': card_moves[card_idx]
+                }))
+                diff.change('card', card_id, 'upsert')
+                continue
+
+            updates = {}
+            if 'title' in card_data and card_data['title'] != stored_card.get('title'):
+                updates['title'] = card_data['title']
+            if str(stored_card['list_id']) != str(list_id):
+                updates['list_id'] = str(list_id)
+            if card_idx in card_moves:
+                updates['position'] = card_moves[card_idx]
+            if updates:
+                diff.card_writes.append(UpdateOne({'_id': stored_card['_id']}, {'$set': updates}))
+                diff.change('card', stored_card['_id'], 'upsert')
+
+    removed_lists = [l['_id'] for list_id, l in lists_by_id.items() if list_id not in seen_lists]
+    removed_cards = [c for card_id, c in cards_by_id.items() if card_id not in seen_cards]
+    if removed_cards:
+        diff.card_writes.append(DeleteMany({'_id': {'$in': [c['_id'] for c in removed_cards]}}))
+        removed_list_ids = {str(i) for i in removed_lists}
+        for card in removed_cards:
+            # Deleting a list already tells clients its cards are gone
+            if str(card['list_id']) not in removed_list_ids:
+                diff.change('card', card['_id'], 'delete')
+    if removed_lists:
+        diff.list_writes.append(DeleteMany({'_id': {'$in': removed_lists}}))
+        for list_id in removed_lists:
+            diff.change('list', list_id, 'delete')
+
+    return diff
@@ -0,0 +1,172 @@
+"""
+Production server: the app under gunicorn, a pre-fork WSGI server.
+
+    python -m backend.serve
+
+The master imports the app once (cheap: storage opens lazily, see
+storage.py) and forks the workers; each worker opens its own MongoClient,
+password-hashing pool and log writer on first use.
+
+Settings (environment):
+  WEB_BIND                 address to listen on                        (0.0.0.0:5000)
+  WEB_WORKER_CLASS         gevent, gthread, sync or uvicorn            (gevent)
+  WEB_CONCURRENCY          worker processes   (gevent/uvicorn: 1 per CPU; gthread/sync: 2 per CPU + 1;
+                           1 with EVENT_BUS=memory)
+  WEB_THREADS              threads per gthread worker                  (4)
+  WEB_WORKER_CONNECTIONS   connections per gevent worker               (1000)
+  WEB_MAX_REQUESTS         recycle a worker after this many requests   (2000, 0 = never)
+  WEB_MAX_REQUESTS_JITTER  spread recycling so workers don't restart together (200)
+  WEB_TIMEOUT              kill a worker silent for this long (s)      (60)
+  WEB_GRACEFUL_TIMEOUT     on SIGTERM, time to finish requests (s)     (30)
+  WEB_KEEPALIVE            keep idle client connections open (s)       (5)
+
+CPUs are the container's CPU limit (cgroup quota) when there is one, not
+the host's core count, so a pod limited to 2 CPUs on a 64-core node runs 5
+workers, not 129.
+
+gevent is the default because every open board holds a
+/boards/<id>/events stream for as long as it is open: under gevent a
+stream is a cheap greenlet, while under gthread it holds one of the
+worker's threads, and a dozen open tabs would leave none for other
+requests (/health and /ready included). uvicorn serves the ASGI variant
+of the app instead (asgi.py), whose busiest routes are coroutines on Motor.
+
+Every worker starts its own password-hashing pool (see passwords.py); unless
+PASSWORD_HASH_WORKERS is set, the CPUs are split between them.
+
+With EVENT_BUS=memory (the default, see events.py) board events published
+by one worker reach only the SSE clients of that worker, so the server
+runs one worker unless EVENT_BUS=changestream, and refuses to start with
+an explicit WEB_CONCURRENCY above 1. STORAGE_BACKEND=memory would give
+each worker its own data, so it always runs a single worker.
+"""
+import logging
+import math
+import os
+
+from gunicorn.app.base import BaseApplication
+
+from .log import configure_logging
+
+log = logging.getLogger(__name__)
+
+WORKER_CLASSES = ('gthread', 'gevent', 'sync', 'uvicorn')
+
+# One event loop per worker process runs many requests at once
+ASYNC_WORKER_CLASSES = ('gevent', 'uvicorn')
+
+
+def cpu_limit():
+    """CPUs this process may use: the cgroup quota if set, else the CPUs it may run on."""
+    quota = None
+    try:
+        # cgroup v2: "<quota> <period>" or "max <period>"
+        with open('/sys/fs/cgroup/cpu.max') as f:
+            limit, period = f.read().split()
+            if limit != 'max':
+                quota = int(limit) / int(period)
+    except (OSError, ValueError):
+        try:
+            # cgroup v1
+            with open('/sys/fs/cgroup/cpu/cpu.cfs_quota_us') as f:
+                limit = int(f.read())
+            with open('/sys/fs/cgroup/cpu/cpu.cfs_period_us') as f:
+                period = int(f.read())
+            if limit > 0:
+                quota = limit / period
+        except (OSError, ValueError):
+            pass
+
+    try:
+        available = len(os.sched_getaffinity(0))
+    except AttributeError:
+        available = os.cpu_count() or 1
+    if quota is None:
+        return available
+    return max(1, min(available, math.ceil(quota)))
+
+
+def options(environ=os.environ, cpus=None):
+    """gunicorn settings from the environment."""
+    cpus = cpus or cpu_limit()
+    worker_class = environ.get('WEB_WORKER_CLASS', 'gevent')
+    if worker_class not in WORKER_CLASSES:
+        raise ValueError(f"unknown WEB_WORKER_CLASS {worker_class!r}, expected one of: {', '.join(WORKER_CLASSES)}")
+
+    in_process_events = environ.get('EVENT_BUS', 'memory') == 'memory'
+    if environ.get('WEB_CONCURRENCY'):
+        workers = int(environ['WEB_CONCURRENCY'])
+    elif in_process_events:
+        workers = 1
+    else:
+        workers = cpus if worker_class in ASYNC_WORKER_CLASSES else 2 * cpus + 1
+    if environ.get('STORAGE_BACKEND') == 'memory' and workers > 1:
+        log.warning("STORAGE_BACKEND=memory keeps data per process; running 1 worker instead of %d", workers)
+        workers = 1
+    if in_process_events and workers > 1:
+        raise ValueError(f"WEB_CONCURRENCY={workers} with EVENT_BUS=memory would deliver each board event only to "
+                         "the clients of one worker; set EVENT_BUS=changestream (needs a replica set) or run 1 worker")
+
+    settings = {
+        'bind': environ.get('WEB_BIND', '0.0.0.0:5000'),
+        'worker_class': 'uvicorn.workers.UvicornWorker' if worker_class == 'uvicorn' else worker_class,
+        'workers': workers,
+        'max_requests': int(environ.get('WEB_MAX_REQUESTS', '2000')),
+        'max_requests_jitter': int(environ.get('WEB_MAX_REQUESTS_JITTER', '200')),
+        'timeout': int(environ.get('WEB_TIMEOUT', '60')),
+        'graceful_timeout': int(environ.get('WEB_GRACEFUL_TIMEOUT', '30')),
+        'keepalive': int(environ.get('WEB_KEEPALIVE', '5')),
+        # gevent must patch the standard library before the app imports pymongo
+        'preload_app': worker_class != 'gevent',
+        'worker_exit': worker_exit,
+        # Requests are counted and timed in /metrics; errors still go to stderr
+        'accesslog': None,
+    }
+    if worker_class == 'gthread':
+        settings['threads'] = int(environ.get('WEB_THREADS', '4'))
+    if worker_class == 'gevent':
+        settings['worker_connections'] = int(environ.get('WEB_WORKER_CONNECTIONS', '1000'))
+    return settings
+
+
+def password_hash_workers(cpus, workers):
+    """Hashing processes per server worker, so that all the pools together use the CPUs once."""
+    return max(1, cpus // workers)
+
+
+def worker_exit(server, worker):
+    # Stop this worker's hashing processes instead of leaving them to the OS
+    from . import app as app_module
+    app_module.password_hasher.shutdown()
+
+
+class Server(BaseApplication):
+    def __init__(self, settings):
+        self.settings = settings
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.settings.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        if self.settings['worker_class'] == 'uvicorn.workers.UvicornWorker':
+            from .asgi import create_asgi_app
+            return create_asgi_app()
+        from .app import create_app
+        return create_app()
+
+
+def main():
+    configure_logging()
+    cpus = cpu_limit()
+    settings = options(cpus=cpus)
+    # Read by PasswordHasher.from_env() when the workers import the app
+    os.environ.setdefault('PASSWORD_HASH_WORKERS', str(password_hash_workers(cpus, settings['workers'])))
+    log.info("Serving with %d %s workers on %s", settings['workers'], settings['worker_class'], settings['bind'],
+             extra={'event': 'serve'})
+    Server(settings).run()
+
+
+if __name__ == '__main__':
+    main()
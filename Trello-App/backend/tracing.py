@@ -0,0 +1,201 @@
+"""
+Per-request database command tracing.
+
+CommandTracer is a pymongo CommandListener (MemoryDatabase accepts it too)
+that attributes every command, and how long it took, to the Flask request
+and endpoint that issued it:
+
+  - with app.debug or DB_TRACE_HEADERS=1, responses carry a summary:
+        X-DB-Commands: 3
+        X-DB-Time: 1.214                      (ms)
+        Server-Timing: db;dur=1.214;desc="3 commands"
+  - per-endpoint totals (requests, commands, time, worst request, requests
+    over budget, commands by name) are kept for metrics; see stats()
+
+Routes declare how many commands one request may issue with
+@query_budget(n). A request over budget is logged, and tests can make it
+fail:
+
+    with assert_query_budget(command_tracer):
+        client.get('/boards', headers=headers)
+
+Commands outside a request (startup, background rebalances) and
+connection handshakes are not counted.
+"""
+import contextvars
+import threading
+from contextlib import contextmanager
+
+from flask import current_app, g, request
+from pymongo import monitoring
+
+# Connection handshakes and monitoring, not a route's work
+UNTRACED_COMMANDS = frozenset({'hello', 'isMaster', 'ismaster', 'ping', 'endSessions', 'saslStart', 'saslContinue'})
+
+_current_trace = contextvars.ContextVar('db_trace', default=None)
+
+
+def query_budget(commands):
+    """Declare the most database commands one request to this route may issue."""
+    def decorate(view):
+        view.query_budget = commands
+        return view
+    return decorate
+
+
+class Trace:
+    """The commands of one request: [command name, collection, seconds or None while running]."""
+
+    def __init__(self, endpoint, budget=None):
+        self.endpoint = endpoint
+        self.budget = budget
+        self.commands = []
+        self._running = {}  # request_id -> index in commands
+
+    @property
+    def count(self):
+        return len(self.commands)
+
+    @property
+    def seconds(self):
+        return sum(c[2] or 0.0 for c in self.commands)
+
+    @property
+    def over_budget(self):
+        return self.budget is not None and self.count > self.budget
+
+    def describe(self):
+        return ', '.join(f"{name} {collection}" for name, collection, _ in self.commands)
+
+
+class EndpointStats:
+    def __init__(self):
+        self.requests = 0
+        self.commands = 0
+        self.seconds = 0.0
+        self.max_commands = 0
+        self.over_budget = 0
+        self.by_command = {}  # command name -> [count, seconds]
+
+    def add(self, trace):
+        self.requests += 1
+        self.commands += trace.count
+        self.seconds += trace.seconds
+        self.max_commands = max(self.max_commands, trace.count)
+        self.over_budget += trace.over_budget
+        for name, _, seconds in trace.commands:
+            totals = self.by_command.setdefault(name, [0, 0.0])
+            totals[0] += 1
+            totals[1] += seconds or 0.0
+
+
+def collection_of(event):
+    target = event.command.get(event.command_name)
+    return target if isinstance(target, str) else event.command.get('collection', '')
+
+
+class CommandTracer(monitoring.CommandListener):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.endpoints = {}  # endpoint -> EndpointStats
+        self.watchers = []  # open assert_query_budget() blocks
+
+    def init_app(self, app):
+        app.before_request(self._start_request)
+        app.after_request(self._add_headers)
+        # Streamed responses keep issuing commands after after_request; teardown runs once they are done
+        app.teardown_request(self._finish_request)
+
+    # CommandListener
+
+    def started(self, event):
+        trace = _current_trace.get()
+        if trace is None or event.command_name in UNTRACED_COMMANDS:
+            return
+        trace._running[event.request_id] = len(trace.commands)
+        trace.commands.append([event.command_name, collection_of(event), None])
+
+    def succeeded(self, event):
+        self._finish_command(event)
+
+    def failed(self, event):
+        self._finish_command(event)
+
+    def _finish_command(self, event):
+        trace = _current_trace.get()
+        index = trace._running.pop(event.request_id, None) if trace is not None else None
+        if index is not None:
+            trace.commands[index][2] = event.duration_micros / 1e6
+
+    # Request hooks
+
+    def _start_request(self):
+        view = current_app.view_functions.get(request.endpoint)
+        # One bucket for every unrouted path, so scans can't grow the stats (as in metrics.RequestMetrics)
+        trace = Trace(request.endpoint or 'unmatched', getattr(view, 'query_budget', None))
+        g.db_trace = trace
+        g.db_trace_token = _current_trace.set(trace)
+
+    def _add_headers(self, response):
+        trace = g.get('db_trace')
+        if trace is not None and (current_app.debug or current_app.config.get('DB_TRACE_HEADERS')):
+            ms = trace.seconds * 1000
+            response.headers['X-DB-Commands'] = str(trace.count)
+            response.headers['X-DB-Time'] = f"{ms:.3f}"
+            response.headers.add('Server-Timing', f'db;dur={ms:.3f};desc="{trace.count} commands"')
+        return response
+
+    def _finish_request(self, exc=None):
+        trace = g.pop('db_trace', None)
+        token = g.pop('db_trace_token', None)
+        if trace is None:
+            return
+        try:
+            _current_trace.reset(token)
+        except ValueError:
+            # Finished in another context (streamed response)
+            _current_trace.set(None)
+
+        with self.lock:
+            self.endpoints.setdefault(trace.endpoint, EndpointStats()).add(trace)
+            for seen in self.watchers:
+                seen.append(trace)
+        if trace.over_budget:
+            current_app.logger.warning("%s issued %d database commands, budget %d: %s",
+                                       trace.endpoint, trace.count, trace.budget, trace.describe(),
+                                       extra={'event': 'query_budget_exceeded'})
+
+    def stats(self):
+        """{endpoint: EndpointStats} snapshot."""
+        with self.lock:
+            snapshot = {}
+            for endpoint, stats in self.endpoints.items():
+                copy = EndpointStats()
+                copy.__dict__.update(stats.__dict__, by_command={k: list(v) for k, v in stats.by_command.items()})
+                snapshot[endpoint] = copy
+            return snapshot
+
+
+@contextmanager
+def assert_query_budget(tracer, limit=None):
+    """
+    Fail when a request that finishes inside the block issues more commands
+    than `limit`, or, without a limit, than its route's @query_budget.
+    Yields the list of traces collected so far.
+    """
+    seen = []
+    with tracer.lock:
+        tracer.watchers.append(seen)
+    try:
+        yield seen
+    finally:
+        with tracer.lock:
+            tracer.watchers.remove(seen)
+
+    over = []
+    for trace in seen:
+        budget = trace.budget if limit is None else limit
+        if budget is not None and trace.count > budget:
+            over.append(f"{trace.endpoint}: {trace.count} commands, budget {budget} ({trace.describe()})")
+    if over:
+        raise AssertionError("Query budget exceeded:\n  " + "\n  ".join(over))
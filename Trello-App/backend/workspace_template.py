@@ -0,0 +1,131 @@
+"""
+Default workspace templates.
+
+The boards a new user starts with are declared once below and compiled at
+import time into flat rows per collection, with parent references resolved
+to row indexes. materialize() then only has to mint ObjectIds client-side
+and fill in the references, so a whole workspace is written with one
+insert_many per collection instead of one insert_one per list and card.
+"""
+from bson import ObjectId
+
+PROJECT_SUB_LISTS = ['To Do', 'In Progress', 'Done']
+
+
+def sub_board_name(project_title):
+    return f"{project_title} - Tasks"
+
+WORK_BOARD = {
+    'title': 'Work',
+    'lists': [
+        {'title': 'Projects', 'cards': [
+            {'title': 'Trello Clone', 'type': 'project-card', 'githubUrl': 'https://github.com/example/trello-clone'},
+            {'title': 'DevOps Pipeline', 'type': 'project-card', 'githubUrl': 'https://github.com/example/devops-pipeline'}
+        ]},
+        {'title': 'To Do', 'cards': [{'title': 'Write documentation'}]},
+        {'title': 'In Progress', 'cards': [{'title': 'Set up CI/CD'}]},
+        {'title': 'Done', 'cards': [{'title': 'Initial commit'}]},
+        {'title': 'Questions', 'cards': [{'title': 'Clarify backend API schema'}]}
+    ]
+}
+
+PERSONAL_BOARD = {
+    'title': 'Personal',
+    'lists': [
+        {'title': 'To Do', 'cards': [{'title': 'Buy groceries'}, {'title': 'Call mom'}]},
+        {'title': 'Grocery', 'cards': [{'title': 'Milk'}, {'title': 'Bread'}, {'title': 'Eggs'}]},
+        {'title': 'Calendar', 'cards': [{'title': 'Doctor appointment'}]},
+        {'title': 'Done', 'cards': []}
+    ]
+}
+
+
+class WorkspaceTemplate:
+    """
+    A set of root boards compiled into three flat row lists:
+      boards: (parent board row or None, fields)     (roots first, then project sub-boards)
+      lists:  (board row, fields)
+      cards:  (list row, sub-board row or None, fields)
+    """
+
+    def __init__(self, root_boards):
+        self.boards, self.lists, self.cards = [], [], []
+        for board in root_boards:
+            self.boards.append((None, {'title': board['title']}))
+
+        for root_row, board in enumerate(root_boards):
+            for list_position, list_spec in enumerate(board['lists']):
+                list_row = self._add_list(root_row, list_spec['title'], list_position)
+                for card_position, card_spec in enumerate(list_spec['cards']):
+                    self._add_card(root_row, list_row, card_spec, card_position)
+
+    def _add_list(self, board_row, title, position):
+        self.lists.append((board_row, {'title': title, 'position': position}))
+        return len(self.lists) - 1
+
+    def _add_card(self, board_row, list_row, card_spec, position):
+        if card_spec.get('type') != 'project-card':
+            self.cards.append((list_row, None, {'title': card_spec['title'], 'position': position}))
+            return
+
+        self.boards.append((board_row, {'name': sub_board_name(card_spec['title'])}))
+        sub_board_row = len(self.boards) - 1
+        for sub_list_idx, sub_list_title in enumerate(PROJECT_SUB_LISTS):
+            self._add_list(sub_board_row, sub_list_title, sub_list_idx)
+
+        self.cards.append((list_row, sub_board_row, {
+            'title': card_spec['title'],
+            'type': 'project-card',
+            'githubUrl': card_spec['githubUrl'],
+            'progress': 0,
+            'task_total': 0,
+            'task_done': 0,
+            'position': position
+        }))
+
+    def materialize(self, user_id, root_board_ids=None):
+        """
+        Documents for one copy of the template, keyed by collection. Pass
+        root_board_ids when the root boards already exist; they are then
+        reused and not emitted.
+        """
+        board_ids = list(root_board_ids) if root_board_ids else []
+        board_ids += [ObjectId() for _ in range(len(self.boards) - len(board_ids))]
+        list_ids = [ObjectId() for _ in self.lists]
+
+        first_new_board = len(root_board_ids) if root_board_ids else 0
+        boards = []
+        for row, (parent_row, fields) in enumerate(self.boards):
+            if row < first_new_board:
+                continue
+            board = {'_id': board_ids[row], **fields, 'user_id': user_id}
+            if parent_row is not None:
+                board['parent_board_id'] = str(board_ids[parent_row])
+            boards.append(board)
+        lists = [
+            {'_id': list_ids[row], 'board_id': str(board_ids[board_row]), **fields}
+            for row, (board_row, fields) in enumerate(self.lists)
+        ]
+        cards = []
+        for list_row, sub_board_row, fields in self.cards:
+            card = {'_id': ObjectId(), 'list_id': str(list_ids[list_row]), **fields}
+            if sub_board_row is not None:
+                card['sub_board_id'] = str(board_ids[sub_board_row])
+            cards.append(card)
+
+        return {'boards': boards, 'lists': lists, 'cards': cards}
+
+
+def materialize_sub_board(user_id, project_title, parent_board_id):
+    """Documents for the sub-board of a new project card, shaped like the template's."""
+    board_id = ObjectId()
+    return {
+        'boards': [{'_id': board_id, 'name': sub_board_name(project_title), 'user_id': user_id,
+                    'parent_board_id': str(parent_board_id)}],
+        'lists': [{'_id': ObjectId(), 'board_id': str(board_id), 'title': title, 'position': position}
+                  for position, title in enumerate(PROJECT_SUB_LISTS)]
+    }
+
+
+DEFAULT_WORKSPACE = WorkspaceTemplate([WORK_BOARD, PERSONAL_BOARD])
+WORK_BOARD_TEMPLATE = WorkspaceTemplate([WORK_BOARD])
@@ -0,0 +1,135 @@
+"""
+Round-trip benchmark for GET /boards (main page tree).
+
+Seeds a throwaway database with one user's Work and Personal boards plus a
+configurable number of project sub-boards, lists and cards, then counts the
+Mongo commands issued by the old N+1 loop and by the aggregation pipeline
+used in backend/app.py.
+
+Storage:
+  memory  (default) the in-memory engine (backend/memory_store.py)
+  mongo   a local mongod at MONGO_URI; the BENCH_DATABASE_NAME database is
+          dropped and reseeded
+
+Usage:
+    python benchmarks/bench_home_boards.py
+    STORAGE_BACKEND=mongo MONGO_URI=mongodb://localhost:27017 python benchmarks/bench_home_boards.py
+"""
+import os
+import sys
+import time
+
+from pymongo import MongoClient, monitoring
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+os.environ.setdefault('FLASK_ENV', 'test')
+
+from backend.app import home_boards_pipeline  # noqa: E402
+from backend.memory_store import MemoryDatabase  # noqa: E402
+
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "memory")
+MONGO_URI = os.environ.get("MONGO_URI", "mongodb://localhost:27017")
+DATABASE_NAME = os.environ.get("BENCH_DATABASE_NAME", "trello_bench")
+LISTS_PER_BOARD = int(os.environ.get("BENCH_LISTS_PER_BOARD", "10"))
+CARDS_PER_LIST = int(os.environ.get("BENCH_CARDS_PER_LIST", "20"))
+SUB_BOARDS = int(os.environ.get("BENCH_SUB_BOARDS", "20"))
+ROUNDS = int(os.environ.get("BENCH_ROUNDS", "20"))
+USER_ID = "bench-user"
+
+
+class CommandCounter(monitoring.CommandListener):
+    def __init__(self):
+        self.count = 0
+
+    def started(self, event):
+        if event.command_name not in ('isMaster', 'hello', 'ping', 'endSessions'):
+            self.count += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+def seed(db):
+    for name in ('boards', 'lists', 'cards'):
+        db[name].drop()
+
+    titles = ['Work', 'Personal'] + [f"Project {i} - Tasks" for i in range(SUB_BOARDS)]
+    board_ids = db.boards.insert_many([{'title': t, 'user_id': USER_ID} for t in titles]).inserted_ids
+    for board_id in board_ids:
+        list_ids = db.lists.insert_many([
+            {'board_id': str(board_id), 'title': f"List {i}", 'position': i}
+            for i in range(LISTS_PER_BOARD)
+        ]).inserted_ids
+        db.cards.insert_many([
+            {'list_id': str(list_id), 'title': f"Card {i}", 'position': i}
+            for list_id in list_ids for i in range(CARDS_PER_LIST)
+        ])
+    db.lists.create_index([('board_id', 1), ('position', 1)])
+    db.cards.create_index([('list_id', 1), ('position', 1)])
+
+
+def legacy_home_boards(db, user_id):
+    """The per-board / per-list loop GET /boards used before the aggregation."""
+    filtered_boards = []
+    for board in db.boards.find({'user_id': user_id}):
+        if board.get('title', board.get('name', '')).strip().lower() not in ['work', 'personal']:
+            continue
+        board['_id'] = str(board['_id'])
+        if 'name' in board:
+            board['title'] = board.pop('name')
+        lists = list(db.lists.find({'board_id': board['_id']}))
+        for lst in lists:
+            lst['_id'] = str(lst['_id'])
+            cards = list(db.cards.find({'list_id': lst['_id']}))
+            for card in cards:
+                card['_id'] = str(card['_id'])
+            lst['cards'] = cards
+        board['lists'] = lists
+        filtered_boards.append(board)
+    return filtered_boards
+
+
+def aggregated_home_boards(db, user_id):
+    return list(db.boards.aggregate(home_boards_pipeline(user_id)))
+
+
+def open_bench_db(counter):
+    """(database, client or None for the in-memory engine)"""
+    if STORAGE_BACKEND == 'memory':
+        return MemoryDatabase(DATABASE_NAME, event_listeners=[counter]), None
+    if STORAGE_BACKEND == 'mongo':
+        client = MongoClient(MONGO_URI, event_listeners=[counter])
+        return client[DATABASE_NAME], client
+    raise SystemExit(f"Unknown STORAGE_BACKEND {STORAGE_BACKEND!r}")
+
+
+def measure(name, fn, db, counter):
+    fn(db, USER_ID)  # warm-up
+    counter.count = 0
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        result = fn(db, USER_ID)
+    elapsed = (time.perf_counter() - start) / ROUNDS
+    round_trips = counter.count / ROUNDS
+    print(f"{name:<12} {round_trips:>8.1f} round trips/request {elapsed * 1000:>9.2f} ms/request")
+    return result
+
+
+if __name__ == "__main__":
+    counter = CommandCounter()
+    db, client = open_bench_db(counter)
+    seed(db)
+
+    print(f"{STORAGE_BACKEND}: {LISTS_PER_BOARD} lists/board, {CARDS_PER_LIST} cards/list, {SUB_BOARDS} project sub-boards")
+    legacy = measure("legacy N+1", legacy_home_boards, db, counter)
+    aggregated = measure("aggregation", aggregated_home_boards, db, counter)
+
+    def cards_by_list(boards):
+        return {l['_id']: [c['_id'] for c in l['cards']] for b in boards for l in b['lists']}
+
+    assert cards_by_list(legacy) == cards_by_list(aggregated), "Aggregation returned a different tree"
+    if client is not None:
+        client.drop_database(DATABASE_NAME)
@@ -0,0 +1,109 @@
+"""
+Serialization microbenchmark for GET /boards/<id>.
+
+Builds a board tree as it comes out of Mongo (ObjectId ids, project cards
+with sub_board_id) and times turning it into a JSON response three ways:
+
+  legacy     the per-document loops the read routes used to run (ids to str,
+             sub_board_id renamed) followed by Flask's stdlib provider
+  stdlib     serialize_card() / api_document() as board_snapshot() calls
+             them, encoded by ApiJSONProvider without orjson (the fallback)
+  orjson     the same with orjson (the default when installed)
+
+No database is needed:
+    python benchmarks/bench_json.py
+"""
+import json
+import os
+import sys
+import time
+
+from bson import ObjectId
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+os.environ.setdefault('FLASK_ENV', 'test')
+
+from backend import json_provider  # noqa: E402
+from backend.app import serialize_card  # noqa: E402
+from backend.json_provider import ApiJSONProvider, api_document  # noqa: E402
+
+LISTS = int(os.environ.get("BENCH_LISTS", "10"))
+CARDS_PER_LIST = int(os.environ.get("BENCH_CARDS_PER_LIST", "100"))
+ROUNDS = int(os.environ.get("BENCH_ROUNDS", "50"))
+
+BOARD_ID = ObjectId()
+LIST_IDS = [ObjectId() for _ in range(LISTS)]
+CARD_IDS = [[ObjectId() for _ in range(CARDS_PER_LIST)] for _ in range(LISTS)]
+SUB_BOARD_ID = str(ObjectId())
+
+
+def board_tree():
+    """A fresh board as the collections return it (routes mutate what they get)."""
+    lists = []
+    for i, list_id in enumerate(LIST_IDS):
+        cards = []
+        for j, card_id in enumerate(CARD_IDS[i]):
+            card = ({'_id': card_id, 'list_id': str(list_id), 'title': f"Card {j}", 'type': 'card', 'position': j})
+            if j % 10 == 0:
+                card.update({'type': 'project-card', 'sub_board_id': SUB_BOARD_ID, 'progress': 40,
+                             'githubUrl': 'https://github.com/example/repo', 'task_total': 5, 'task_done': 2})
+            cards.append(card)
+        lists.append(({'_id': list_id, 'board_id': str(BOARD_ID), 'title': f"List {i}", 'position': i, 'cards': cards}))
+    return ({'_id': BOARD_ID, 'title': 'Work', 'user_id': 'bench-user', 'version': 7, 'lists': lists})
+
+
+def legacy_serialize(board):
+    """The conversions board_snapshot() / serialize_card() did before the JSON provider."""
+    for l in board['lists']:
+        l['_id'] = str(l['_id'])
+        for c in l['cards']:
+            c['_id'] = str(c['_id'])
+            c['list_id'] = str(c['list_id'])
+            if c.get('sub_board_id'):
+                c['subBoardId'] = str(c.pop('sub_board_id'))
+    board['_id'] = str(board['_id'])
+    return board
+
+
+def api_serialize(board):
+    """What board_snapshot() does now: progress for project cards and rename marks."""
+    for l in board['lists']:
+        l['cards'] = [serialize_card(c) for c in l['cards']]
+    return api_document(board)
+
+
+def measure(name, app, prepare):
+    trees = [board_tree() for _ in range(ROUNDS + 1)]
+    with app.app_context():
+        body = app.json.response(prepare(trees.pop())).get_data()  # warm-up
+        start = time.perf_counter()
+        for tree in trees:
+            app.json.response(prepare(tree)).get_data()
+        elapsed = (time.perf_counter() - start) / ROUNDS
+    print(f"{name:<8} {elapsed * 1000:>8.2f} ms/response {len(body) / 1024:>8.1f} KiB")
+    return json.loads(body)
+
+
+if __name__ == "__main__":
+    legacy_app = Flask('legacy')
+    legacy_app.json = DefaultJSONProvider(legacy_app)
+    api_app = Flask('api')
+    api_app.json = ApiJSONProvider(api_app)
+
+    print(f"{LISTS} lists x {CARDS_PER_LIST} cards, {ROUNDS} rounds")
+    legacy = measure("legacy", legacy_app, legacy_serialize)
+
+    orjson = json_provider.orjson
+    json_provider.orjson = None
+    try:
+        stdlib = measure("stdlib", api_app, api_serialize)
+    finally:
+        json_provider.orjson = orjson
+    if orjson is not None:
+        fast = measure("orjson", api_app, api_serialize)
+        assert fast == legacy, "orjson provider returned a different document"
+    else:
+        print("orjson    not installed")
+    assert stdlib == legacy, "stdlib provider returned a different document"
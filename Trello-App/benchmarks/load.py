@@ -0,0 +1,560 @@
+"""
+Load test for the API routes.
+
+Seeds synthetic workspaces, then drives a weighted mix of requests through
+the Flask app in-process (test client, no HTTP server in the way) and
+reports for every route and overall: p50/p95/p99 latency, throughput, and
+database commands per request. Routes that went over their @query_budget
+(backend/tracing.py) are listed after the table. Results are written as
+JSON; pass an earlier result file as BENCH_BASELINE to compare a run
+against it.
+
+Storage:
+  memory  (default) the in-memory engine (backend/memory_store.py)
+  mongo   a local mongod at MONGO_URI; the BENCH_DATABASE_NAME database is
+          dropped and reseeded
+
+Usage:
+    python benchmarks/load.py
+    STORAGE_BACKEND=mongo MONGO_URI=mongodb://localhost:27017 python benchmarks/load.py
+    BENCH_BASELINE=benchmarks/results/load-abc1234-memory.json python benchmarks/load.py
+
+Settings (environment):
+  BENCH_USERS          users, each with its own workspace           (20)
+  BENCH_BOARDS         boards per user, Work and Personal first     (3)
+  BENCH_LISTS          lists per board, the last one named Done     (5)
+  BENCH_CARDS          cards per list                               (20)
+  BENCH_PROJECT_CARDS  project cards per user, each with a sub-board (3)
+  BENCH_PROJECT_TASKS  cards per project sub-board                  (9)
+  BENCH_REQUESTS       requests to send                             (2000)
+  BENCH_THREADS        concurrent clients                           (1)
+  BENCH_MIX            route weights, e.g. "home=5,move_card=2"     (DEFAULT_MIX)
+  BENCH_SEED           random seed                                  (1)
+  BENCH_OUTPUT         result file  (benchmarks/results/load-<commit>-<storage>.json)
+
+Password hashing uses PASSWORD_HASH_METHOD (pbkdf2:sha256:1000 unless set)
+and the app's worker pool (PASSWORD_HASH_WORKERS).
+
+GET /boards/<id>/events (an endless SSE stream) is not part of the mix.
+"""
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+
+import jwt
+from bson import ObjectId
+from pymongo import MongoClient, monitoring
+from werkzeug.security import generate_password_hash
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+os.environ.setdefault('FLASK_ENV', 'test')
+# Production's 260000 rounds would make login/signup measure PBKDF2, not the routes
+os.environ.setdefault('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:1000')
+
+from backend import app as app_module  # noqa: E402
+from backend.indexes import ensure_indexes  # noqa: E402
+from backend.memory_store import MemoryDatabase  # noqa: E402
+from backend.storage import Storage  # noqa: E402
+from backend.workspace_template import PROJECT_SUB_LISTS, WorkspaceTemplate  # noqa: E402
+
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "memory")
+MONGO_URI = os.environ.get("MONGO_URI", "mongodb://localhost:27017")
+DATABASE_NAME = os.environ.get("BENCH_DATABASE_NAME", "trello_bench")
+USERS = int(os.environ.get("BENCH_USERS", "20"))
+BOARDS = int(os.environ.get("BENCH_BOARDS", "3"))
+LISTS = int(os.environ.get("BENCH_LISTS", "5"))
+CARDS = int(os.environ.get("BENCH_CARDS", "20"))
+PROJECT_CARDS = int(os.environ.get("BENCH_PROJECT_CARDS", "3"))
+PROJECT_TASKS = int(os.environ.get("BENCH_PROJECT_TASKS", "9"))
+REQUESTS = int(os.environ.get("BENCH_REQUESTS", "2000"))
+THREADS = int(os.environ.get("BENCH_THREADS", "1"))
+SEED = int(os.environ.get("BENCH_SEED", "1"))
+PASSWORD = "bench-password"
+
+# Mostly reads, then drag and drop, then everything else
+DEFAULT_MIX = {
+    'home': 20, 'board': 15, 'changes': 10, 'move_card': 10, 'reorder_card': 8,
+    'cards_page': 5, 'update_card': 5, 'create_card': 5, 'lists_page': 3, 'batch': 3,
+    'delete_card': 3, 'board_stream': 2, 'reorder_lists': 2, 'rename_list': 2, 'login': 2,
+    'put_board': 1, 'create_list': 1, 'create_board': 1, 'delete_list': 1, 'signup': 1, 'health': 1,
+}
+
+# Connection handshakes and monitoring, not the route's work
+UNCOUNTED_COMMANDS = {'hello', 'isMaster', 'ismaster', 'ping', 'endSessions', 'saslStart', 'saslContinue'}
+
+
+class CommandCounter(monitoring.CommandListener):
+    """Database commands issued by the current thread."""
+
+    def __init__(self):
+        self.local = threading.local()
+
+    @property
+    def count(self):
+        return getattr(self.local, 'count', 0)
+
+    def started(self, event):
+        if event.command_name not in UNCOUNTED_COMMANDS:
+            self.local.count = self.count + 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+# --- Seeding ---
+
+def workspace_template():
+    """Boards for one user, sized by the BENCH_* settings."""
+    titles = (['Work', 'Personal'] + [f"Board {i}" for i in range(2, BOARDS)])[:BOARDS]
+    boards = []
+    for title in titles:
+        lists = [{'title': 'Done' if i == LISTS - 1 else f"List {i}",
+                  'cards': [{'title': f"Card {j}"} for j in range(CARDS)]} for i in range(LISTS)]
+        boards.append({'title': title, 'lists': lists})
+    if boards and boards[0]['lists']:
+        boards[0]['lists'][0]['cards'] += [
+            {'title': f"Project {i}", 'type': 'project-card', 'githubUrl': None} for i in range(PROJECT_CARDS)
+        ]
+    return WorkspaceTemplate(boards)
+
+
+def add_project_tasks(docs):
+    """Spread PROJECT_TASKS cards over each sub-board's lists (the template leaves them empty)."""
+    sub_lists = defaultdict(list)
+    sub_boards = {str(b['_id']) for b in docs['boards'] if 'parent_board_id' in b}
+    for lst in docs['lists']:
+        if lst['board_id'] in sub_boards:
+            sub_lists[lst['board_id']].append(lst)
+    for lists in sub_lists.values():
+        for i in range(PROJECT_TASKS):
+            lst = lists[i % len(PROJECT_SUB_LISTS)]
+            docs['cards'].append({'_id': ObjectId(), 'list_id': str(lst['_id']), 'title': f"Task {i}",
+                                  'position': i // len(lists)})
+
+
+def insert_chunked(collection, docs, size=5000):
+    for start in range(0, len(docs), size):
+        collection.insert_many(docs[start:start + size], ordered=False)
+
+
+def seed(storage):
+    """Users and their workspaces; returns a Workspace model per user."""
+    template = workspace_template()
+    hashed = generate_password_hash(PASSWORD, method=app_module.password_hasher.method)
+    users, workspaces = [], []
+    docs = {'boards': [], 'lists': [], 'cards': []}
+    for i in range(USERS):
+        username = f"bench-user-{i}"
+        users.append({'username': username, 'password': hashed})
+    insert_chunked(storage.users, users)
+
+    for user in users:
+        workspace = template.materialize(str(user['_id']))
+        add_project_tasks(workspace)
+        for name in docs:
+            docs[name] += workspace[name]
+        token = jwt.encode({'user_id': str(user['_id'])}, app_module.app.config['SECRET_KEY'], algorithm="HS256")
+        workspaces.append(Workspace(user['username'], token, workspace))
+
+    for name, collection in (('boards', storage.boards), ('lists', storage.lists), ('cards', storage.cards)):
+        insert_chunked(collection, docs[name])
+    # Counters of every project card, as the app keeps them
+    app_module.rebuild_task_counters()
+    return workspaces, {name: len(rows) for name, rows in docs.items()}
+
+
+def open_bench_storage(counter):
+    if STORAGE_BACKEND == 'memory':
+        storage = Storage(MemoryDatabase(DATABASE_NAME, event_listeners=[counter, app_module.command_tracer]))
+    elif STORAGE_BACKEND == 'mongo':
+        client = MongoClient(MONGO_URI, event_listeners=[counter, app_module.command_tracer])
+        client.drop_database(DATABASE_NAME)
+        storage = Storage(client[DATABASE_NAME], client)
+    else:
+        raise SystemExit(f"Unknown STORAGE_BACKEND {STORAGE_BACKEND!r}")
+    ensure_indexes(storage.db)
+    return storage
+
+
+def install(storage):
+    """Serve the app from storage."""
+    app_module.storage.use(storage)
+
+
+# --- Client-side model of a workspace ---
+
+class Workspace:
+    """
+    What a client knows about one user's boards: list ids per board and card
+    ids per list, in order. Mutating scenarios update it from the responses
+    so later requests refer to documents that exist.
+    """
+
+    def __init__(self, username, token, docs):
+        self.username = username
+        self.headers = {'Authorization': f'Bearer {token}'}
+        self.boards = {str(b['_id']): [] for b in docs['boards']}
+        self.cards = {}
+        self.versions = {}
+        self.created = 0
+        for lst in sorted(docs['lists'], key=lambda l: l['position']):
+            self.boards[lst['board_id']].append(str(lst['_id']))
+            self.cards[str(lst['_id'])] = []
+        for card in sorted(docs['cards'], key=lambda c: c['position']):
+            self.cards[card['list_id']].append(str(card['_id']))
+
+    def name(self, prefix):
+        self.created += 1
+        return f"{prefix} {self.created}"
+
+    def board(self, rng, min_lists=1):
+        candidates = [b for b, lists in self.boards.items() if len(lists) >= min_lists]
+        return rng.choice(candidates) if candidates else None
+
+    def card(self, rng, min_lists=1):
+        """(board_id, list_id, index, card_id) of a random card, or None."""
+        for _ in range(10):
+            board_id = self.board(rng, min_lists)
+            if board_id is None:
+                return None
+            list_id = rng.choice(self.boards[board_id])
+            if self.cards[list_id]:
+                index = rng.randrange(len(self.cards[list_id]))
+                return board_id, list_id, index, self.cards[list_id][index]
+        return None
+
+    def move(self, card_id, from_list, to_list, position):
+        self.cards[from_list].remove(card_id)
+        target = self.cards[to_list]
+        target.insert(min(position, len(target)), card_id)
+
+    def forget_list(self, board_id, list_id):
+        self.boards[board_id].remove(list_id)
+        self.cards.pop(list_id, None)
+
+
+# --- Scenarios: (workspace, rng) -> (method, path, body, after) or None when not applicable ---
+
+def home(ws, rng):
+    return 'GET', '/boards', None, None
+
+
+def board(ws, rng):
+    return 'GET', f"/boards/{ws.board(rng)}", None, None
+
+
+def board_stream(ws, rng):
+    return 'GET', f"/boards/{ws.board(rng)}?stream=1", None, None
+
+
+def changes(ws, rng):
+    board_id = ws.board(rng)
+
+    def after(body):
+        ws.versions[board_id] = body['version']
+    return 'GET', f"/boards/{board_id}/changes?since={ws.versions.get(board_id, 0)}", None, after
+
+
+def lists_page(ws, rng):
+    return 'GET', f"/lists?board_id={ws.board(rng)}&limit=20", None, None
+
+
+def cards_page(ws, rng):
+    found = ws.card(rng)
+    return found and ('GET', f"/cards?list_id={found[1]}&limit=20&fields=title,position,progress", None, None)
+
+
+def move_card(ws, rng):
+    found = ws.card(rng, min_lists=2)
+    if not found:
+        return None
+    board_id, list_id, _, card_id = found
+    target = rng.choice([l for l in ws.boards[board_id] if l != list_id])
+    position = rng.randint(0, len(ws.cards[target]))
+    return 'PUT', f"/cards/{card_id}", {'new_list_id': target, 'to_position': position}, \
+        lambda body: ws.move(card_id, list_id, target, position)
+
+
+def reorder_card(ws, rng):
+    found = ws.card(rng)
+    if not found:
+        return None
+    _, list_id, _, card_id = found
+    position = rng.randrange(len(ws.cards[list_id]))
+    return 'PATCH', f"/cards/{card_id}/reorder", {'new_position': position, 'new_list_id': list_id}, \
+        lambda body: ws.move(card_id, list_id, list_id, position)
+
+
+def reorder_lists(ws, rng):
+    board_id = ws.board(rng, min_lists=2)
+    if board_id is None:
+        return None
+    order = list(ws.boards[board_id])
+    order.insert(rng.randrange(len(order)), order.pop(rng.randrange(len(order))))
+
+    def after(body):
+        ws.boards[board_id] = order
+    return 'PATCH', '/lists/reorder', {'reorderedListIds': order}, after
+
+
+def update_card(ws, rng):
+    found = ws.card(rng)
+    return found and ('PATCH', f"/cards/{found[3]}", {'title': ws.name('Card')}, None)
+
+
+def rename_list(ws, rng):
+    board_id = ws.board(rng)
+    return 'PATCH', f"/lists/{rng.choice(ws.boards[board_id])}", {'title': ws.name('List')}, None
+
+
+def create_card(ws, rng):
+    board_id = ws.board(rng)
+    list_id = rng.choice(ws.boards[board_id])
+
+    def after(body):
+        ws.cards[list_id].append(body['_id'])
+    return 'POST', f"/lists/{list_id}/cards", {'title': ws.name('Card')}, after
+
+
+def delete_card(ws, rng):
+    found = ws.card(rng)
+    if not found:
+        return None
+    _, list_id, _, card_id = found
+    return 'DELETE', f"/cards/{card_id}", None, lambda body: ws.cards[list_id].remove(card_id)
+
+
+def create_list(ws, rng):
+    board_id = rng.choice(list(ws.boards))
+
+    def after(body):
+        ws.boards[board_id].append(body['_id'])
+        ws.cards[body['_id']] = []
+    return 'POST', f"/boards/{board_id}/lists", {'title': ws.name('List')}, after
+
+
+def delete_list(ws, rng):
+    board_id = ws.board(rng, min_lists=3)
+    if board_id is None:
+        return None
+    list_id = rng.choice(ws.boards[board_id])
+    return 'DELETE', f"/lists/{list_id}", None, lambda body: ws.forget_list(board_id, list_id)
+
+
+def create_board(ws, rng):
+    def after(body):
+        ws.boards[body['_id']] = []
+    return 'POST', '/boards', {'name': ws.name('Board')}, after
+
+
+def batch(ws, rng):
+    """One drag-and-drop session on a board: reorders within lists and a rename."""
+    board_id = ws.board(rng)
+    operations = []
+    for _ in range(rng.randint(5, 10)):
+        list_id = rng.choice(ws.boards[board_id])
+        if ws.cards[list_id]:
+            operations.append({'op': 'reorder_card', 'card_id': rng.choice(ws.cards[list_id]),
+                               'new_position': rng.randrange(len(ws.cards[list_id])), 'new_list_id': list_id})
+    operations.append({'op': 'rename_list', 'list_id': rng.choice(ws.boards[board_id]), 'title': ws.name('List')})
+    return 'POST', '/batch', {'operations': operations}, None
+
+
+def put_board(ws, rng):
+    """Save the whole board with one card moved, as the frontend's board editor does."""
+    found = ws.card(rng, min_lists=2)
+    if not found:
+        return None
+    board_id, list_id, index, _ = found
+    cards = {l: list(ws.cards[l]) for l in ws.boards[board_id]}
+    card_id = cards[list_id].pop(index)
+    target = rng.choice(ws.boards[board_id])
+    cards[target].insert(rng.randint(0, len(cards[target])), card_id)
+    structure = [{'_id': l, 'cards': [{'_id': c} for c in cards[l]]} for l in ws.boards[board_id]]
+
+    def after(body):
+        ws.cards.update(cards)
+    return 'PUT', f"/boards/{board_id}", structure, after
+
+
+def signup(ws, rng):
+    return 'POST', '/signup', {'username': f"{ws.username}-{rng.getrandbits(64):016x}", 'password': PASSWORD}, None
+
+
+def login(ws, rng):
+    return 'POST', '/login', {'username': ws.username, 'password': PASSWORD}, None
+
+
+def health(ws, rng):
+    return 'GET', '/health', None, None
+
+
+SCENARIOS = {fn.__name__: fn for fn in (
+    home, board, board_stream, changes, lists_page, cards_page, move_card, reorder_card, reorder_lists,
+    update_card, rename_list, create_card, delete_card, create_list, delete_list, create_board, batch,
+    put_board, signup, login, health
+)}
+
+
+def parse_mix(value):
+    if not value:
+        return dict(DEFAULT_MIX)
+    mix = {}
+    for item in value.split(','):
+        name, _, weight = item.partition('=')
+        if name.strip() not in SCENARIOS:
+            raise SystemExit(f"Unknown scenario {name!r}; known: {', '.join(SCENARIOS)}")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+# --- Running ---
+
+def worker(index, workspaces, mix, count, counter, samples):
+    rng = random.Random(SEED * 1000 + index)
+    client = app_module.app.test_client()
+    names, weights = list(mix), list(mix.values())
+    sent = 0
+    while sent < count:
+        name = rng.choices(names, weights)[0]
+        ws = rng.choice(workspaces)
+        call = SCENARIOS[name](ws, rng)
+        if not call:
+            continue
+        method, path, body, after = call
+        commands = counter.count
+        start = time.perf_counter()
+        response = client.open(path, method=method, json=body, headers=ws.headers)
+        response.get_data()  # drain streamed bodies
+        elapsed = time.perf_counter() - start
+        samples.append((name, elapsed, counter.count - commands, response.status_code))
+        if after and response.status_code < 300:
+            after(response.get_json())
+        sent += 1
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[max(0, math.ceil(p / 100 * len(sorted_values)) - 1)]
+
+
+def summarize(samples, seconds):
+    latencies = sorted(s[1] for s in samples)
+    statuses = defaultdict(int)
+    for s in samples:
+        statuses[str(s[3])] += 1
+    return {
+        'requests': len(samples),
+        'errors': sum(1 for s in samples if s[3] >= 400),
+        'status': dict(sorted(statuses.items())),
+        'throughput': round(len(samples) / seconds, 1) if seconds else 0.0,
+        'mean_ms': round(sum(latencies) / len(latencies) * 1000, 3) if latencies else 0.0,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+        'commands_per_request': round(sum(s[2] for s in samples) / len(samples), 2) if samples else 0.0,
+    }
+
+
+def current_commit():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+    return commit
+
+
+def print_table(result, baseline=None):
+    print(f"{'route':<14}{'reqs':>7}{'err':>5}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'req/s':>9}{'cmds':>7}"
+          + (f"{'Δp95':>9}{'Δcmds':>8}" if baseline else ''))
+    rows = sorted(result['routes'].items()) + [('TOTAL', result['total'])]
+    for name, r in rows:
+        line = (f"{name:<14}{r['requests']:>7}{r['errors']:>5}{r['p50_ms']:>9.2f}{r['p95_ms']:>9.2f}"
+                f"{r['p99_ms']:>9.2f}{r['throughput']:>9.1f}{r['commands_per_request']:>7.1f}")
+        before = baseline and (baseline['total'] if name == 'TOTAL' else baseline['routes'].get(name))
+        if before:
+            delta = (r['p95_ms'] - before['p95_ms']) / before['p95_ms'] * 100 if before['p95_ms'] else 0.0
+            line += f"{delta:>+8.0f}%{r['commands_per_request'] - before['commands_per_request']:>+8.1f}"
+        print(line)
+
+
+def main():
+    mix = parse_mix(os.environ.get("BENCH_MIX"))
+    counter = CommandCounter()
+    storage = open_bench_storage(counter)
+    install(storage)
+
+    start = time.perf_counter()
+    workspaces, seeded = seed(storage)
+    seed_seconds = time.perf_counter() - start
+    print(f"{STORAGE_BACKEND}: seeded {USERS} users, {seeded['boards']} boards, {seeded['lists']} lists, "
+          f"{seeded['cards']} cards in {seed_seconds:.1f}s")
+
+    samples = [[] for _ in range(THREADS)]
+    threads = [
+        threading.Thread(target=worker, args=(i, workspaces[i::THREADS] or workspaces, mix,
+                                              REQUESTS // THREADS + (i < REQUESTS % THREADS), counter, samples[i]))
+        for i in range(THREADS)
+    ]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    seconds = time.perf_counter() - start
+
+    flat = [s for thread_samples in samples for s in thread_samples]
+    by_route = defaultdict(list)
+    for s in flat:
+        by_route[s[0]].append(s)
+    result = {
+        'commit': current_commit(),
+        'storage': STORAGE_BACKEND,
+        'started_at': datetime.utcnow().isoformat() + 'Z',
+        'settings': {'users': USERS, 'boards': BOARDS, 'lists': LISTS, 'cards': CARDS,
+                     'project_cards': PROJECT_CARDS, 'project_tasks': PROJECT_TASKS, 'requests': REQUESTS,
+                     'threads': THREADS, 'seed': SEED, 'mix': mix},
+        'seeded': {**seeded, 'seconds': round(seed_seconds, 2)},
+        'seconds': round(seconds, 3),
+        'total': summarize(flat, seconds),
+        # Per-route throughput is that route's share of the run
+        'routes': {name: summarize(route_samples, seconds) for name, route_samples in sorted(by_route.items())},
+        # Requests over their route's @query_budget, by endpoint (seeding included)
+        'over_budget': {endpoint: stats.over_budget for endpoint, stats in sorted(app_module.command_tracer.stats().items())
+                        if stats.over_budget},
+    }
+
+    baseline = None
+    if os.environ.get("BENCH_BASELINE"):
+        with open(os.environ["BENCH_BASELINE"]) as f:
+            baseline = json.load(f)
+        print(f"Compared with {baseline['commit']} ({baseline['storage']}, {baseline['started_at']})")
+    print_table(result, baseline)
+    for endpoint, count in result['over_budget'].items():
+        print(f"over query budget: {endpoint} x{count}")
+
+    output = os.environ.get("BENCH_OUTPUT") or os.path.join(
+        os.path.dirname(__file__), 'results', f"load-{result['commit']}-{STORAGE_BACKEND}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(result, f, indent=2)
+    print(f"Results written to {output}")
+
+    if STORAGE_BACKEND == 'mongo':
+        storage.client.drop_database(DATABASE_NAME)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""
+HTTP throughput of the production server (backend/serve.py) by worker count.
+
+For each WEB_CONCURRENCY in BENCH_WORKERS it starts `python -m backend.serve`
+on a free port, waits for it to answer, and lets BENCH_CLIENTS client
+processes (one keep-alive connection each) send GET BENCH_PATH for
+BENCH_SECONDS. Reported per worker count: requests/s, p50/p99 latency, and
+the speed-up over the first row.
+
+Workers add throughput only up to the CPUs the server may use (see
+serve.cpu_limit(), printed first): on a single CPU more workers cannot
+help a CPU-bound route, they can only overlap waiting on the database.
+Client processes compete for the same CPUs, so on a small machine run the
+clients elsewhere (BENCH_URL) or read the numbers as a lower bound.
+
+The default path, /health, touches no storage, so the run needs no
+database. To include Mongo round trips point BENCH_PATH at /ready with the
+MONGO_* settings of a reachable server. STORAGE_BACKEND=memory always runs
+one worker (its data lives in the process) and is refused here. The server
+runs with EVENT_BUS=changestream, without which serve.py refuses more than
+one worker; no request here opens an event stream, so no replica set is
+needed.
+
+A few errors per run are workers being recycled (WEB_MAX_REQUESTS) while a
+client holds a keep-alive connection to them; the client reconnects.
+
+Usage:
+    python benchmarks/serve.py
+    BENCH_WORKERS=1,2,4,8 BENCH_WORKER_CLASS=gthread python benchmarks/serve.py
+    BENCH_URL=http://10.0.0.5:5000 BENCH_WORKERS=4 python benchmarks/serve.py
+
+Settings (environment):
+  BENCH_WORKERS        worker counts to compare                     (1,2,4)
+  BENCH_WORKER_CLASS   WEB_WORKER_CLASS for the server              (gevent)
+  BENCH_CLIENTS        concurrent client processes                  (8)
+  BENCH_SECONDS        measuring time per worker count              (5)
+  BENCH_PATH           path to request                              (/health)
+  BENCH_URL            an already running server; BENCH_WORKERS is then
+                       only a label
+"""
+import http.client
+import multiprocessing
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from urllib.parse import urlsplit
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+WORKERS = [int(n) for n in os.environ.get('BENCH_WORKERS', '1,2,4').split(',')]
+WORKER_CLASS = os.environ.get('BENCH_WORKER_CLASS', 'gevent')
+CLIENTS = int(os.environ.get('BENCH_CLIENTS', '8'))
+SECONDS = float(os.environ.get('BENCH_SECONDS', '5'))
+PATH = os.environ.get('BENCH_PATH', '/health')
+URL = os.environ.get('BENCH_URL')
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(workers, port):
+    env = {
+        **os.environ,
+        'WEB_BIND': f'127.0.0.1:{port}',
+        'WEB_CONCURRENCY': str(workers),
+        'WEB_WORKER_CLASS': WORKER_CLASS,
+        'EVENT_BUS': 'changestream',
+        'LOG_LEVEL': 'WARNING',
+        'DATABASE_NAME': os.environ.get('DATABASE_NAME', 'trello'),
+    }
+    env.pop('FLASK_ENV', None)
+    server = subprocess.Popen([sys.executable, '-m', 'backend.serve'], cwd=ROOT, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            conn.request('GET', '/health')
+            conn.getresponse().read()
+            return server
+        except OSError:
+            if server.poll() is not None:
+                raise RuntimeError(f'server exited with {server.returncode}')
+            time.sleep(0.1)
+    server.terminate()
+    raise RuntimeError('server did not start')
+
+
+def client(args):
+    host, port, stop_at = args
+    conn = http.client.HTTPConnection(host, port, timeout=30)
+    latencies, errors = [], 0
+    while time.monotonic() < stop_at:
+        started = time.perf_counter()
+        try:
+            conn.request('GET', PATH)
+            response = conn.getresponse()
+            response.read()
+            if response.status >= 400:
+                errors += 1
+        except (OSError, http.client.HTTPException):
+            errors += 1
+            conn.close()
+            conn = http.client.HTTPConnection(host, port, timeout=30)
+            continue
+        latencies.append(time.perf_counter() - started)
+    conn.close()
+    return latencies, errors
+
+
+def measure(pool, host, port):
+    # Warm every worker's connection and code path before measuring
+    pool.map(client, [(host, port, time.monotonic() + 0.5)] * CLIENTS)
+    started = time.monotonic()
+    results = pool.map(client, [(host, port, started + SECONDS)] * CLIENTS)
+    elapsed = time.monotonic() - started
+    latencies = sorted(l for lats, _ in results for l in lats)
+    errors = sum(e for _, e in results)
+    return {
+        'rps': len(latencies) / elapsed,
+        'p50': statistics.median(latencies) * 1000 if latencies else 0,
+        'p99': latencies[int(len(latencies) * 0.99)] * 1000 if latencies else 0,
+        'errors': errors,
+    }
+
+
+def main():
+    if os.environ.get('STORAGE_BACKEND') == 'memory':
+        sys.exit('STORAGE_BACKEND=memory runs a single worker; nothing to compare')
+    from backend.serve import cpu_limit
+    print(f"server CPUs {cpu_limit()}, {WORKER_CLASS} workers, {CLIENTS} clients, GET {PATH}, {SECONDS:g}s each")
+    print(f"{'workers':>7} {'req/s':>10} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7} {'speed-up':>9}")
+
+    first = None
+    with multiprocessing.Pool(CLIENTS) as pool:
+        for workers in WORKERS:
+            server = None
+            if URL:
+                parts = urlsplit(URL)
+                host, port = parts.hostname, parts.port or 80
+            else:
+                host, port = '127.0.0.1', free_port()
+                server = start_server(workers, port)
+            try:
+                result = measure(pool, host, port)
+            finally:
+                if server:
+                    server.terminate()
+                    server.wait(timeout=60)
+            first = first or result['rps']
+            print(f"{workers:>7} {result['rps']:>10.0f} {result['p50']:>8.2f} {result['p99']:>8.2f} "
+                  f"{result['errors']:>7} {result['rps'] / first:>8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Cold start and worker spawn times.
+
+Each run starts a fresh interpreter that imports backend.app, answers its
+first requests, then forks a child the way a pre-fork server spawns a
+worker and times the child's first request. Reported per step (median and
+worst over the runs):
+
+  import        python -c "import backend.app" up to the module being ready
+  first_health  first GET /health (no storage involved)
+  first_ready   first GET /ready: opens storage, applies indexes, pings
+  fork_ready    fork() to the child's first GET /ready, its own storage
+
+Storage is the in-memory engine unless STORAGE_BACKEND is set, so the
+numbers are the app's own cost, not the network's.
+
+Usage:
+    python benchmarks/startup.py
+    STARTUP_RUNS=20 python benchmarks/startup.py
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+RUNS = int(os.environ.get("STARTUP_RUNS", "5"))
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+CHILD = r"""
+import json, os, time
+started = time.perf_counter()
+import backend.app as app_module
+timings = {'import': time.perf_counter() - started}
+
+client = app_module.app.test_client()
+for step, path in (('first_health', '/health'), ('first_ready', '/ready')):
+    started = time.perf_counter()
+    assert client.get(path).status_code == 200, path
+    timings[step] = time.perf_counter() - started
+
+read, write = os.pipe()
+started = time.perf_counter()
+pid = os.fork()
+if pid == 0:
+    os.close(read)
+    status = app_module.app.test_client().get('/ready').status_code
+    os.write(write, json.dumps([status, time.perf_counter() - started]).encode())
+    os._exit(0)
+os.close(write)
+status, seconds = json.loads(os.read(read, 1024))
+os.waitpid(pid, 0)
+assert status == 200, status
+timings['fork_ready'] = seconds
+print(json.dumps(timings))
+"""
+
+
+def run_once():
+    env = {**os.environ, 'STORAGE_BACKEND': os.environ.get('STORAGE_BACKEND', 'memory'), 'LOG_LEVEL': 'WARNING'}
+    env.pop('FLASK_ENV', None)
+    output = subprocess.run([sys.executable, '-c', CHILD], cwd=ROOT, env=env, check=True,
+                            capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    runs = [run_once() for _ in range(RUNS)]
+    print(f"{'step':<14} {'median ms':>10} {'worst ms':>10}")
+    for step in ('import', 'first_health', 'first_ready', 'fork_ready'):
+        values = [r[step] * 1000 for r in runs]
+        print(f"{step:<14} {statistics.median(values):>10.1f} {max(values):>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
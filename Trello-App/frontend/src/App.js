@@ -75,7 +75,9 @@ export default function App() {
       console.log("Fetching board:", boardId);
       const res = await axios.get(`${API_URL}/boards/${boardId}`, {
         headers: { Authorization: `Bearer ${token}` },
-        params: { t: new Date().getTime() }, // force cache bypass
+        // No cache-busting param: the backend sends an ETag with
+        // "Cache-Control: no-cache", so the browser revalidates and an
+        // unchanged board comes back as a cheap 304.
       });
 
       // Directly modify res.data.lists and its cards for sorting
@@ -125,6 +127,56 @@ export default function App() {
     }
   }, [token, showMessage]);
 
+  // Live updates: the backend pushes an event whenever the open board changes,
+  // including edits made in other sessions. Refetching is cheap because an
+  // unchanged board revalidates as a 304.
+  const openBoardId = currentBoard ? currentBoard._id : null;
+  useEffect(() => {
+    if (!token || !openBoardId || viewBoards) return undefined;
+    let source = null;
+    let retryTimer = null;
+    let stopped = false;
+    const refresh = () => fetchBoard(openBoardId);
+
+    // EventSource cannot send the Authorization header, so the stream is opened
+    // with a short-lived ticket for this board; the token never goes in a URL
+    const open = async () => {
+      try {
+        const res = await axios.post(`${API_URL}/boards/${openBoardId}/events/ticket`, null, {
+          headers: { Authorization: `Bearer ${token}` },
+        });
+        if (stopped) return;
+        source = new EventSource(
+          `${API_URL}/boards/${openBoardId}/events?ticket=${encodeURIComponent(res.data.ticket)}`
+        );
+        source.addEventListener("change", refresh);
+        source.addEventListener("resync", refresh);
+        source.onerror = () => {
+          // The browser gives up once a reconnect is refused, e.g. with an expired ticket
+          if (source.readyState === EventSource.CLOSED) reopen();
+        };
+      } catch (error) {
+        if (!error.response || error.response.status >= 500) reopen();
+      }
+    };
+    const reopen = () => {
+      if (source) source.close();
+      source = null;
+      if (stopped) return;
+      retryTimer = setTimeout(() => {
+        open();
+        refresh(); // catch up on changes made while disconnected
+      }, 3000);
+    };
+
+    open();
+    return () => {
+      stopped = true;
+      clearTimeout(retryTimer);
+      if (source) source.close();
+    };
+  }, [token, openBoardId, viewBoards, fetchBoard]);
+
   const handleAuth = async () => {
     const endpoint = authMode === "signup" ? "/signup" : "/login";
     try {
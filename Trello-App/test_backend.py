@@ -1,6 +1,28 @@
 import unittest
 import os
 from unittest.mock import patch, MagicMock
+from bson import ObjectId
+
+def mock_ownership(mock_lists_collection, mock_cards_collection, lists=(), cards=()):
+    """
+    Answer authz.Ownership's queries: `lists` are the user's lists and `cards`
+    exist. Other cards queries get the usual find() mock.
+    """
+    def aggregate(pipeline):
+        ids = {str(i) for i in pipeline[0]['$match']['_id']['$in']}
+        return [l for l in lists if str(l['_id']) in ids]
+
+    chained = mock_cards_collection.find.return_value
+
+    def find(query, *args, **kwargs):
+        if isinstance(query.get('_id'), dict) and '$in' in query['_id']:
+            ids = {str(i) for i in query['_id']['$in']}
+            return [c for c in cards if str(c['_id']) in ids]
+        return chained
+
+    mock_lists_collection.aggregate.side_effect = aggregate
+    mock_cards_collection.find.side_effect = find
+
 
 class TestAuthRoutes(unittest.TestCase):
     @classmethod
@@ -32,6 +54,23 @@ class TestAuthRoutes(unittest.TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertIn(b"token", response.data)
 
+    @patch('backend.app.cards_collection')
+    @patch('backend.app.lists_collection')
+    @patch('backend.app.boards_collection')
+    @patch('backend.app.users_collection')
+    def test_signup_writes_workspace_in_bulk(self, mock_users_collection, mock_boards_collection, mock_lists_collection, mock_cards_collection):
+        mock_users_collection.find_one.return_value = None
+        mock_users_collection.insert_one.return_value = MagicMock(inserted_id='12345')
+
+        response = self.app.post('/signup', json={"username": "bulkuser", "password": "testpass"})
+
+        self.assertEqual(response.status_code, 200)
+        for collection in (mock_boards_collection, mock_lists_collection, mock_cards_collection):
+            collection.insert_many.assert_called_once()
+            collection.insert_one.assert_not_called()
+        boards = mock_boards_collection.insert_many.call_args.args[0]
+        self.assertEqual([b.get('title') for b in boards[:2]], ['Work', 'Personal'])
+
     @patch('backend.app.users_collection')
     def test_login(self, mock_users_collection):
         from werkzeug.security import generate_password_hash
@@ -48,5 +87,1422 @@ class TestAuthRoutes(unittest.TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertIn(b"token", response.data)
 
+class TestBoardRoutes(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        import jwt
+        from backend.app import app
+        cls.app = app.test_client()
+        cls.app.testing = True
+        token = jwt.encode({'user_id': '64b000000000000000000001'}, app.config['SECRET_KEY'], algorithm="HS256")
+        cls.headers = {'Authorization': f'Bearer {token}'}
+
+    def setUp(self):
+        # Mocked boards reuse ids and versions; a snapshot cached by one test must not answer the next
+        from backend.app import board_cache
+        board_cache.clear()
+
+    @patch('backend.app.cards_collection')
+    @patch('backend.app.lists_collection')
+    @patch('backend.app.boards_collection')
+    @patch('backend.app.users_collection')
+    def test_get_boards_single_round_trip(self, mock_users_collection, mock_boards_collection, mock_lists_collection, mock_cards_collection):
+        mock_users_collection.find_one.return_value = {'_id': '64b000000000000000000001', 'username': 'testuser'}
+        mock_boards_collection.aggregate.return_value = iter([
+            {'_id': 'board1', 'title': 'Work', 'user_id': '64b000000000000000000001', 'lists': [
+                {'_id': 'list1', 'board_id': 'board1', 'title': 'To Do', 'position': 0, 'cards': [
+                    {'_id': 'card1', 'list_id': 'list1', 'title': 'Write documentation'}
+                ]}
+            ]}
+        ])
+
+        response = self.app.get('/boards', headers=self.headers)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()[0]['lists'][0]['cards'][0]['title'], 'Write documentation')
+        mock_boards_collection.aggregate.assert_called_once()
+        mock_lists_collection.find.assert_not_called()
+        mock_cards_collection.find.assert_not_called()
+
+    @patch('backend.app.cards_collection')
+    @patch('backend.app.lists_collection')
+    @patch('backend.app.boards_collection')
+    @patch('backend.app.users_collection')
+    def test_move_card_to_done_increments_counters(self, mock_users_collection, mock_boards_collection, mock_lists_collection, mock_cards_collection):
+        mock_users_collection.find_one.return_value = {'_id': '64b000000000000000000001', 'username': 'testuser'}
+        card_id, todo_id, done_id, sub_board_id = ('64b0000000000000000000c1', '64b0000000000000000000a1',
+                                                   '64b0000000000000000000a2', '64b0000000000000000000b1')
+        mock_cards_collection.find.return_value.sort.return_value.limit.return_value = []
+        mock_ownership(mock_lists_collection, mock_cards_collection, lists=[
+            {'_id': todo_id, 'board_id': sub_board_id, 'title': 'To Do'},
+            {'_id': done_id, 'board_id': sub_board_id, 'title': 'Done'}
+        ], cards=[{'_id': card_id, 'list_id': todo_id, 'title': 'Task'}])
+        mock_boards_collection.find_one_and_update.return_value = None
+
+        response = self.app.put(f'/cards/{card_id}', json={'new_list_id': done_id, 'to_position': 0}, headers=self.headers)
+
+        self.assertEqual(response.status_code, 200)
+        mock_cards_collection.update_one.assert_any_call({'sub_board_id': sub_board_id, 'task_total': {'$exists': True}}, {'$inc': {'task_done': 1}})
+        # Both lists are checked in one scoped query; boards are never scanned
+        mock_lists_collection.aggregate.assert_called_once()
+        mock_lists_collection.find.assert_not_called()
+        mock_boards_collection.find.assert_not_called()
+
+    @patch('backend.app.cards_collection')
+    @patch('backend.app.lists_collection')
+    @patch('backend.app.boards_collection')
+    @patch('backend.app.users_collection')
+    def test_board_details_reads_progress_from_counters(self, mock_users_collection, mock_boards_collection, mock_lists_collection, mock_cards_collection):
+        mock_users_collection.find_one.return_value = {'_id': '64b000000000000000000001', 'username': 'testuser'}
+        board_id = '64b0000000000000000000b2'
+        mock_boards_collection.find_one.return_value = {'_id': board_id, 'title': 'Work'}
+        mock_lists_collection.find.return_value.sort.return_value = [{'_id': 'list1', 'board_id': board_id, 'title': 'Projects'}]
+        mock_cards_collection.find.return_value.sort.return_value = [{
+            '_id': 'card1', 'list_id': 'list1', 'title': 'Trello Clone', 'type': 'project-card',
+            'sub_board_id': 'sub1', 'progress': 0, 'task_total': 3, 'task_done': 1
+        }]
+
+        response = self.app.get(f'/boards/{board_id}', headers=self.headers)
+
+        self.assertEqual(response.status_code, 200)
+        card = response.get_json()['lists'][0]['cards'][0]
+        self.assertEqual(card['progress'], 33)
+        self.assertEqual(card['subBoardId'], 'sub1')
+        self.assertEqual(mock_lists_collection.find.call_count, 1)
+        self.assertEqual(mock_cards_collection.find.call_count, 1)
+
+    @patch('backend.app.cards_collection')
+    @patch('backend.app.lists_collection')
+    @patch('backend.app.boards_collection')
+    @patch('backend.app.users_collection')
+    def test_reorder_card_writes_only_the_moved_card(self, mock_users_collection, mock_boards_collection, mock_lists_collection, mock_cards_collection):
+        mock_users_collection.find_one.return_value = {'_id': '64b000000000000000000001', 'username': 'testuser'}
+        card_id, list_id = '64b0000000000000000000c1', '64b0000000000000000000a1'
+        mock_cards_collection.find.return_value.sort.return_value.skip.return_value.limit.return_value = [
+            {'_id': 'c2', 'position': 2}, {'_id': 'c3', 'position': 3}
+        ]
+        mock_ownership(mock_lists_collection, mock_cards_collection,
+                       lists=[{'_id': list_id, 'board_id': '64b0000000000000000000b1', 'title': 'To Do'}],
+                       cards=[{'_id': card_id, 'list_id': list_id, 'position': 7}])
+        mock_boards_collection.find_one_and_update.return_value = None
+
+        response = self.app.patch(f'/cards/{card_id}/reorder', json={'new_position': 3}, headers=self.headers)
+
+        self.assertEqual(response.status_code, 200)
+        mock_cards_collection.find.return_value.sort.return_value.skip.assert_called_once_with(2)
+        mock_cards_collection.update_one.assert_called_once_with(
+            {'_id': card_id}, {'$set': {'position': 2.5, 'list_id': list_id}})
+
+    @patch('backend.app.users_collection')
+    def test_id_only_routes_skip_user_lookup(self, mock_users_collection):
+        with patch('backend.app.boards_collection') as mock_boards_collection:
+            mock_boards_collection.aggregate.return_value = iter([])
+            response = self.app.get('/boards', headers=self.headers)
+
+        self.assertEqual(response.status_code, 200)
+        mock_users_collection.find_one.assert_not_called()
+
+    @patch('backend.app.boards_collection')
+    @patch('backend.app.users_collection')
+    def test_user_lookup_is_cached(self, mock_users_collection, mock_boards_collection):
+        from backend.app import user_cache, invalidate_user
+        user_cache.clear()
+        mock_users_collection.find_one.return_value = {'_id': '64b000000000000000000001', 'username': 'testuser'}
+        mock_boards_collection.insert_one.return_value = MagicMock(inserted_id='board1')
+
+        for _ in range(3):
+            response = self.app.post('/boards', json={'name': 'Side project'}, headers=self.headers)
+            self.assertEqual(response.status_code, 201)
+        self.assertEqual(mock_users_collection.find_one.call_count, 1)
+
+        invalidate_user('64b000000000000000000001')
+        self.app.post('/boards', json={'name': 'Side project'}, headers=self.headers)
+        self.assertEqual(mock_users_collection.find_one.call_count, 2)
+
+    @patch('backend.app.cards_collection')
+    @patch('backend.app.lists_collection')
+    @patch('backend.app.boards_collection')
+    def test_work_board_is_inserted_after_its_template(self, mock_boards_collection, mock_lists_collection,
+                                                       mock_cards_collection):
+        writes = MagicMock()
+        writes.attach_mock(mock_boards_collection, 'boards')
+        writes.attach_mock(mock_lists_collection, 'lists')
+        writes.attach_mock(mock_cards_collection, 'cards')
+
+        response = self.app.post('/boards', json={'name': 'Work'}, headers=self.headers)
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([c[0] for c in writes.mock_calls],
+                         ['boards.insert_many', 'lists.insert_many', 'cards.insert_many', 'boards.insert_one'])
+        board = mock_boards_collection.insert_one.call_args[0][0]
+        self.assertEqual(str(board['_id']), response.get_json()['_id'])
+        root_lists = [l for l in mock_lists_collection.insert_many.call_args[0][0] if l['board_id'] == str(board['_id'])]
+        self.assertEqual(len(root_lists), 5)
+
+    @patch('backend.app.cards_collection')
+    @patch('backend.app.lists_collection')
+    @patch('backend.app.boards_collection')
+    def test_board_details_not_modified(self, mock_boards_collection, mock_lists_collection, mock_cards_collection):
+        board_id = '64b0000000000000000000b2'
+        mock_boards_collection.find_one.return_value = {'_id': board_id, 'title': 'Work', 'version': 7}
+        mock_lists_collection.find.return_value.sort.return_value = []
+        mock_cards_collection.find.return_value.sort.return_value = []
+
+        first = self.app.get(f'/boards/{board_id}', headers=self.headers)
+        etag = first.headers['ETag']
+        second = self.app.get(f'/boards/{board_id}', headers={**self.headers, 'If-None-Match': etag})
+
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(second.status_code, 304)
+        self.assertEqual(second.headers['ETag'], etag)
+        self.assertEqual(mock_lists_collection.find.call_count, 1)
+        self.assertEqual(mock_cards_collection.find.call_count, 1)
+
+        mock_boards_collection.find_one.return_value = {'_id': board_id, 'title': 'Work', 'version': 8}
+        third = self.app.get(f'/boards/{board_id}', headers={**self.headers, 'If-None-Match': etag})
+        self.assertEqual(third.status_code, 200)
+
+    @patch('backend.app.changes_collection')
+    @patch('backend.app.boards_collection')
+    def test_sub_board_changes_are_logged_on_parent(self, mock_boards_collection, mock_changes_collection):
+        from backend.app import record_board_changes, upserted
+        sub_board_id, parent_id = '64b0000000000000000000b1', '64b0000000000000000000b2'
+        mock_boards_collection.find_one_and_update.side_effect = [
+            {'_id': ObjectId(sub_board_id), 'version': 4, 'parent_board_id': parent_id},
+            {'_id': ObjectId(parent_id), 'version': 9}
+        ]
+
+        record_board_changes(sub_board_id, upserted('card', 'card1'))
+
+        logged = [call.args[0] for call in mock_changes_collection.insert_one.call_args_list]
+        self.assertEqual([(e['board_id'], e['version']) for e in logged], [(sub_board_id, 4), (parent_id, 9)])
+        self.assertEqual(logged[0]['changes'], [{'kind': 'card', 'id': 'card1', 'op': 'upsert'}])
+        self.assertEqual(logged[1]['changes'], [{'kind': 'card', 'sub_board_id': sub_board_id, 'op': 'upsert'}])
+
+    @patch('backend.app.changes_collection')
+    @patch('backend.app.cards_collection')
+    @patch('backend.app.lists_collection')
+    @patch('backend.app.boards_collection')
+    def test_delete_list_logs_deletion(self, mock_boards_collection, mock_lists_collection, mock_cards_collection, mock_changes_collection):
+        board_id, list_id = '64b0000000000000000000b2', '64b0000000000000000000a1'
+        mock_ownership(mock_lists_collection, mock_cards_collection,
+                       lists=[{'_id': ObjectId(list_id), 'board_id': board_id, 'title': 'Done'}])
+        mock_boards_collection.find_one_and_update.return_value = {'_id': ObjectId(board_id), 'version': 5}
+        mock_cards_collection.delete_many.return_value = MagicMock(deleted_count=2)
+
+        response = self.app.delete(f'/lists/{list_id}', headers=self.headers)
+
+        self.assertEqual(response.status_code, 200)
+        mock_cards_collection.update_one.assert_called_once_with({'sub_board_id': board_id, 'task_total': {'$exists': True}}, {'$inc': {'task_total': -2, 'task_done': -2}})
+        entry = mock_changes_collection.insert_one.call_args.args[0]
+        self.assertEqual(entry['changes'], [{'kind': 'list', 'id': list_id, 'op': 'delete'}])
+
+    @patch('backend.app.changes_collection')
+    @patch('backend.app.cards_collection')
+    @patch('backend.app.lists_collection')
+    @patch('backend.app.boards_collection')
+    def test_changes_since_version(self, mock_boards_collection, mock_lists_collection, mock_cards_collection, mock_changes_collection):
+        board_id, list_id = '64b0000000000000000000b2', '64b0000000000000000000a1'
+        card_id, gone_id = '64b0000000000000000000c1', '64b0000000000000000000c2'
+        mock_boards_collection.find.return_value = [{'_id': ObjectId(board_id), 'user_id': '64b000000000000000000001', 'version': 12}]
+        mock_changes_collection.find.return_value.sort.return_value = [
+            {'version': 11, 'changes': [{'kind': 'card', 'id': card_id, 'op': 'upsert'}, {'kind': 'card', 'id': gone_id, 'op': 'upsert'}]},
+            {'version': 12, 'changes': [{'kind': 'card', 'id': gone_id, 'op': 'delete'}]}
+        ]
+        mock_cards_collection.find.return_value = [{'_id': ObjectId(card_id), 'list_id': list_id, 'title': 'Moved', 'position': 1.5}]
+
+        response = self.app.get(f'/boards/{board_id}/changes?since=10', headers=self.headers)
+
+        self.assertEqual(response.status_code, 200)
+        body = response.get_json()
+        self.assertEqual(body['version'], 12)
+        self.assertEqual([c['_id'] for c in body['cards']], [card_id])
+        self.assertEqual(body['deleted_cards'], [gone_id])
+        mock_lists_collection.find.assert_not_called()
+
+    @patch('backend.app.changes_collection')
+    @patch('backend.app.cards_collection')
+    @patch('backend.app.lists_collection')
+    @patch('backend.app.boards_collection')
+    def test_changes_fall_back_to_snapshot_after_compaction(self, mock_boards_collection, mock_lists_collection, mock_cards_collection, mock_changes_collection):
+        board_id = '64b0000000000000000000b2'
+        mock_boards_collection.find.return_value = [{'_id': ObjectId(board_id), 'title': 'Work', 'version': 12}]
+        # Entry for version 11 has expired
+        mock_changes_collection.find.return_value.sort.return_value = [
+            {'version': 12, 'changes': [{'kind': 'list', 'id': '64b0000000000000000000a1', 'op': 'upsert'}]}
+        ]
+        mock_lists_collection.find.return_value.sort.return_value = []
+        mock_cards_collection.find.return_value.sort.return_value = []
+
+        response = self.app.get(f'/boards/{board_id}/changes?since=10', headers=self.headers)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['snapshot']['_id'], board_id)
+
+    @patch('backend.app.changes_collection')
+    @patch('backend.app.boards_collection')
+    def test_changes_of_other_users_boards_are_not_found(self, mock_boards_collection, mock_changes_collection):
+        board_id = '64b0000000000000000000b2'
+        # The board exists but belongs to someone else, so the user-scoped lookup finds nothing
+        mock_boards_collection.find.return_value = []
+
+        response = self.app.get(f'/boards/{board_id}/changes?since=0', headers=self.headers)
+
+        self.assertEqual(response.status_code, 404)
+        mock_boards_collection.find.assert_called_once_with({'_id': {'$in': [ObjectId(board_id)]}, 'user_id': '64b000000000000000000001'})
+        mock_changes_collection.find.assert_not_called()
+
+    @patch('backend.app.changes_collection')
+    @patch('backend.app.cards_collection')
+    @patch('backend.app.lists_collection')
+    @patch('backend.app.boards_collection')
+    def test_batch_writes_once_per_collection_and_board(self, mock_boards_collection, mock_lists_collection, mock_cards_collection, mock_changes_collection):
+        sub_board_id, todo_id, done_id = '64b0000000000000000000b1', '64b0000000000000000000a1', '64b0000000000000000000a2'
+        card1, card2 = '64b0000000000000000000c1', '64b0000000000000000000c2'
+        cards = [{'_id': ObjectId(card1), 'list_id': todo_id, 'position': 0},
+                 {'_id': ObjectId(card2), 'list_id': todo_id, 'position': 1}]
+        mock_cards_collection.find.return_value = cards
+        mock_ownership(mock_lists_collection, mock_cards_collection, cards=cards, lists=[
+            {'_id': ObjectId(todo_id), 'board_id': sub_board_id, 'title': 'To Do'},
+            {'_id': ObjectId(done_id), 'board_id': sub_board_id, 'title': 'Done'}
+        ])
+        mock_boards_collection.find_one_and_update.return_value = {'_id': ObjectId(sub_board_id), 'version': 3}
+
+        response = self.app.post('/batch', json={'operations': [
+            {'op': 'move_card', 'card_id': card1, 'new_list_id': done_id},
+            {'op': 'move_card', 'card_id': card2, 'new_list_id': done_id, 'to_position': 0},
+            {'op': 'create_card', 'list_id': todo_id, 'title': 'New task'},
+            {'op': 'delete_card', 'card_id': '64b0000000000000000000c9'}
+        ]}, headers=self.headers)
+
+        self.assertEqual(response.status_code, 200)
+        results = response.get_json()['results']
+        self.assertEqual([r['status'] for r in results], [200, 200, 201, 404])
+        self.assertLess(results[1]['position'], results[0]['position'])
+        mock_cards_collection.bulk_write.assert_called_once()
+        self.assertEqual(len(mock_cards_collection.bulk_write.call_args.args[0]), 3)
+        mock_cards_collection.update_one.assert_called_once_with({'sub_board_id': sub_board_id, 'task_total': {'$exists': True}}, {'$inc': {'task_total': 1, 'task_done': 2}})
+        mock_changes_collection.insert_one.assert_called_once()
+        self.assertEqual(len(mock_changes_collection.insert_one.call_args.args[0]['changes']), 3)
+        mock_lists_collection.aggregate.assert_called_once()
+
+    @patch('backend.app.changes_collection')
+    @patch('backend.app.cards_collection')
+    @patch('backend.app.lists_collection')
+    @patch('backend.app.boards_collection')
+    def test_partly_written_batch_still_versions_its_boards(self, mock_boards_collection, mock_lists_collection,
+                                                            mock_cards_collection, mock_changes_collection):
+        from pymongo.errors import OperationFailure
+        board_id, todo_id, done_id = '64b0000000000000000000b1', '64b0000000000000000000a1', '64b0000000000000000000a2'
+        card_id = '64b0000000000000000000c1'
+        cards = [{'_id': ObjectId(card_id), 'list_id': todo_id, 'position': 0}]
+        mock_cards_collection.find.return_value = cards
+        mock_ownership(mock_lists_collection, mock_cards_collection, cards=cards, lists=[
+            {'_id': ObjectId(todo_id), 'board_id': board_id, 'title': 'To Do'},
+            {'_id': ObjectId(done_id), 'board_id': board_id, 'title': 'Done'}
+        ])
+        find_owned = mock_cards_collection.find.side_effect
+        mock_cards_collection.find.side_effect = lambda query, *args, **kwargs: (
+            [] if 'sub_board_id' in query else find_owned(query, *args, **kwargs))
+        mock_boards_collection.find_one_and_update.return_value = {'_id': ObjectId(board_id), 'version': 3}
+        # No transaction in this deployment: the card move lands, the rename fails
+        mock_lists_collection.bulk_write.side_effect = OperationFailure('write failed')
+
+        response = self.app.post('/batch', json={'operations': [
+            {'op': 'move_card', 'card_id': card_id, 'new_list_id': done_id},
+            {'op': 'rename_list', 'list_id': todo_id, 'title': 'Backlog'}
+        ]}, headers=self.headers)
+
+        self.assertEqual(response.status_code, 500)
+        mock_cards_collection.bulk_write.assert_called_once()
+        mock_boards_collection.find_one_and_update.assert_called_once()
+        mock_changes_collection.insert_one.assert_called_once()
+        # Counters are recounted rather than shifted by a delta that may not have been written
+        mock_cards_collection.find.assert_any_call({'sub_board_id': board_id}, {'sub_board_id': 1, 'list_id': 1})
+
+    @patch('backend.app.cards_collection')
+    @patch('backend.app.lists_collection')
+    @patch('backend.app.boards_collection')
+    def test_batch_rejects_lists_of_other_users(self, mock_boards_collection, mock_lists_collection, mock_cards_collection):
+        list_id = '64b0000000000000000000a1'
+        # The list exists, but the scoped lookup finds no board of this user for it
+        mock_ownership(mock_lists_collection, mock_cards_collection, lists=[])
+
+        response = self.app.post('/batch', json={'operations': [
+            {'op': 'rename_list', 'list_id': list_id, 'title': 'Done'}
+        ]}, headers=self.headers)
+
+        self.assertEqual(response.get_json()['results'][0]['status'], 404)
+        pipeline = mock_lists_collection.aggregate.call_args.args[0]
+        self.assertEqual(pipeline[1]['$lookup']['pipeline'][0]['$match']['user_id'], '64b000000000000000000001')
+        mock_lists_collection.bulk_write.assert_not_called()
+        mock_boards_collection.find_one_and_update.assert_not_called()
+
+    @patch('backend.app.changes_collection')
+    @patch('backend.app.cards_collection')
+    @patch('backend.app.lists_collection')
+    @patch('backend.app.boards_collection')
+    def test_board_structure_writes_only_differences(self, mock_boards_collection, mock_lists_collection, mock_cards_collection, mock_changes_collection):
+        board_id, todo_id, done_id = '64b0000000000000000000b2', '64b0000000000000000000a1', '64b0000000000000000000a2'
+        card_id = '64b0000000000000000000c1'
+        mock_boards_collection.find.return_value = [{'_id': ObjectId(board_id), 'user_id': '64b000000000000000000001'}]
+        mock_boards_collection.find_one_and_update.return_value = None
+        mock_lists_collection.find.return_value = [
+            {'_id': ObjectId(todo_id), 'board_id': board_id, 'title': 'To Do', 'position': 0},
+            {'_id': ObjectId(done_id), 'board_id': board_id, 'title': 'Done', 'position': 1}
+        ]
+        stored_cards = [{'_id': ObjectId(card_id), 'list_id': todo_id, 'title': 'Write tests', 'position': 0}]
+        mock_cards_collection.find.side_effect = lambda query, *args, **kwargs: stored_cards if 'list_id' in query else []
+        for collection in (mock_lists_collection, mock_cards_collection):
+            collection.bulk_write.return_value = MagicMock(inserted_count=0, modified_count=1, deleted_count=0)
+
+        response = self.app.put(f'/boards/{board_id}', json=[
+            {'_id': todo_id, 'title': 'To Do', 'cards': []},
+            {'_id': done_id, 'title': 'Done', 'cards': [{'_id': card_id, 'title': 'Write tests'}]}
+        ], headers=self.headers)
+
+        self.assertEqual(response.status_code, 200)
+        # Lists unchanged: no list writes; the card moves with one update
+        mock_lists_collection.bulk_write.assert_not_called()
+        writes = mock_cards_collection.bulk_write.call_args.args[0]
+        self.assertEqual(len(writes), 1)
+        self.assertEqual(writes[0]._doc, {'$set': {'list_id': done_id, 'position': 0}})
+        self.assertEqual(response.get_json()['applied']['cards'], {'inserted': 0, 'updated': 1, 'deleted': 0})
+        # The card moved into Done: the sub-board's project card counts one more done task
+        mock_cards_collection.update_one.assert_called_once_with(
+            {'sub_board_id': board_id, 'task_total': {'$exists': True}}, {'$inc': {'task_done': 1}})
+        mock_lists_collection.delete_many.assert_not_called()
+        mock_cards_collection.delete_many.assert_not_called()
+
+    def test_streamed_board_matches_snapshot(self):
+        import json
+        from backend import app as app_module
+        from backend.memory_store import MemoryDatabase
+        from backend.storage import Storage
+        storage = Storage(MemoryDatabase())
+        board_id = str(storage.boards.insert_one({'name': 'Big board', 'version': 2}).inserted_id)
+        # Created in one order, positioned in another: the lists' id order is not their display order
+        done, todo, later = (storage.lists.insert_one({'board_id': board_id, 'title': title, 'position': position}).inserted_id
+                             for title, position in (('Done', 1), ('To Do', 0), ('Later', 2)))
+        storage.cards.insert_many([{'list_id': str(todo), 'title': f'Card {i}', 'position': 3 - i} for i in range(3)])
+        storage.cards.insert_one({'list_id': str(done), 'title': 'Project', 'type': 'project-card', 'sub_board_id': 'sub1',
+                                  'task_total': 4, 'task_done': 1, 'position': 0})
+
+        with patch.multiple(app_module, boards_collection=storage.boards, lists_collection=storage.lists,
+                            cards_collection=storage.cards):
+            snapshot = self.app.get(f'/boards/{board_id}', headers=self.headers).get_json()
+            with patch('backend.app.STREAM_CHUNK_BYTES', 64), patch.object(storage.cards, 'find', wraps=storage.cards.find) as find:
+                response = self.app.get(f'/boards/{board_id}?stream=1', headers=self.headers, buffered=False)
+                chunks = list(response.response)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.is_streamed)
+        self.assertEqual(response.headers['ETag'], f'"{board_id}.2"')
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual(json.loads(b''.join(chunks)), snapshot)
+        self.assertEqual([l['title'] for l in snapshot['lists']], ['To Do', 'Done', 'Later'])
+        self.assertEqual([c['title'] for c in snapshot['lists'][0]['cards']], ['Card 2', 'Card 1', 'Card 0'])
+        self.assertEqual(snapshot['lists'][1]['cards'][0]['progress'], 25)
+        # One cursor for the cards of every list
+        find.assert_called_once()
+
+    @patch('backend.app.cards_collection')
+    def test_cards_are_paged_by_keyset(self, mock_cards_collection):
+        from backend.pagination import decode_cursor
+        list_id = '64b0000000000000000000a1'
+        cards = [{'_id': ObjectId(), 'list_id': list_id, 'title': f'Card {i}', 'position': i} for i in range(3)]
+        mock_cards_collection.find.return_value.sort.return_value.limit.return_value = cards
+
+        response = self.app.get(f'/cards?list_id={list_id}&limit=2&fields=title', headers=self.headers)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json(), [{'_id': str(c['_id']), 'title': c['title']} for c in cards[:2]])
+        query, projection = mock_cards_collection.find.call_args.args
+        self.assertEqual(query, {'list_id': list_id})
+        self.assertEqual(projection, {'_id': 1, 'title': 1, 'position': 1})
+        mock_cards_collection.find.return_value.sort.return_value.limit.assert_called_once_with(3)
+        cursor = response.headers['X-Next-Cursor']
+        self.assertEqual(decode_cursor(cursor), (1, cards[1]['_id']))
+
+        mock_cards_collection.find.return_value.sort.return_value.limit.return_value = cards[2:]
+        response = self.app.get(f'/cards?list_id={list_id}&limit=2&after={cursor}', headers=self.headers)
+
+        self.assertEqual([c['title'] for c in response.get_json()], ['Card 2'])
+        self.assertNotIn('X-Next-Cursor', response.headers)
+        self.assertEqual(mock_cards_collection.find.call_args.args[0], {'$and': [{'list_id': list_id}, {'$or': [
+            {'position': {'$gt': 1}}, {'position': 1, '_id': {'$gt': cards[1]['_id']}}]}]})
+
+    def test_cards_reject_bad_page_parameters(self):
+        for query in ('limit=0', 'limit=abc', 'after=not-a-cursor', 'fields=title,$where'):
+            response = self.app.get(f'/cards?list_id=64b0000000000000000000a1&{query}', headers=self.headers)
+            self.assertEqual(response.status_code, 400, query)
+
+    @patch('backend.app.boards_collection')
+    def test_board_events_stream(self, mock_boards_collection):
+        from backend.app import event_bus
+        board_id = '64b0000000000000000000b2'
+        mock_boards_collection.find.return_value = [{'_id': ObjectId(board_id), 'user_id': '64b000000000000000000001', 'version': 3}]
+
+        ticket = self.app.post(f'/boards/{board_id}/events/ticket', headers=self.headers).get_json()['ticket']
+        response = self.app.get(f'/boards/{board_id}/events?ticket={ticket}', buffered=False)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'text/event-stream')
+
+        chunks = iter(response.response)
+        self.assertEqual(next(chunks), b'retry: 3000\n\n')
+        event_bus.publish(board_id, {'type': 'change', 'version': 3, 'changes': []})  # already seen
+        event_bus.publish(board_id, {'type': 'change', 'version': 4, 'changes': [{'kind': 'card', 'id': 'c1', 'op': 'delete'}]})
+        event = next(chunks).decode()
+        self.assertTrue(event.startswith('id: 4\nevent: change\n'))
+        self.assertIn('"op": "delete"', event)
+        response.close()
+
+    @patch('backend.app.boards_collection')
+    def test_board_events_of_other_users_boards_are_not_found(self, mock_boards_collection):
+        import jwt
+        from backend.app import app, event_bus
+        board_id = '64b0000000000000000000b2'
+        mock_boards_collection.find.return_value = []
+
+        self.assertEqual(self.app.post(f'/boards/{board_id}/events/ticket', headers=self.headers).status_code, 404)
+        # A ticket minted before the board changed hands still resolves ownership when the stream opens
+        ticket = jwt.encode({'user_id': '64b000000000000000000001', 'board_id': board_id, 'scope': 'board_events'},
+                            app.config['SECRET_KEY'], algorithm="HS256")
+        response = self.app.get(f'/boards/{board_id}/events?ticket={ticket}')
+
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(event_bus.subscriber_count(), 0)
+
+    @patch('backend.app.boards_collection')
+    def test_event_tickets_and_login_tokens_are_not_interchangeable(self, mock_boards_collection):
+        board_id, other_board_id = '64b0000000000000000000b2', '64b0000000000000000000b3'
+        mock_boards_collection.find.return_value = [{'_id': ObjectId(board_id), 'user_id': '64b000000000000000000001'}]
+        mock_boards_collection.aggregate.return_value = iter([])
+        ticket = self.app.post(f'/boards/{board_id}/events/ticket', headers=self.headers).get_json()['ticket']
+        token = self.headers['Authorization'].split()[1]
+
+        # The login token is only accepted in the Authorization header
+        self.assertEqual(self.app.get(f'/boards/{board_id}/events?token={token}').status_code, 401)
+        self.assertEqual(self.app.get(f'/boards/{board_id}/events?ticket={token}').status_code, 401)
+        self.assertEqual(self.app.get(f'/boards?token={token}').status_code, 401)
+        # A ticket opens only its board's stream and is no API credential
+        self.assertEqual(self.app.get(f'/boards/{other_board_id}/events?ticket={ticket}').status_code, 401)
+        self.assertEqual(self.app.get('/boards', headers={'Authorization': f'Bearer {ticket}'}).status_code, 401)
+
+
+class TestOwnership(unittest.TestCase):
+    def test_resolves_in_scoped_batches_and_memoizes(self):
+        from backend.authz import Ownership
+        boards, lists, cards = MagicMock(), MagicMock(), MagicMock()
+        boards.name = 'boards'
+        list_id, other_list, card_id = '64b0000000000000000000a1', '64b0000000000000000000a2', '64b0000000000000000000c1'
+        mock_ownership(lists, cards, lists=[{'_id': ObjectId(list_id), 'board_id': 'b1', 'title': 'To Do'}],
+                       cards=[{'_id': ObjectId(card_id), 'list_id': list_id}])
+        owned = Ownership('u1', boards, lists, cards)
+
+        owned.resolve(card_ids=[card_id], list_ids=[other_list, 'not-an-id'])
+
+        self.assertEqual(owned.card(card_id)['list_id'], list_id)
+        self.assertIsNone(owned.list(other_list))
+        self.assertIsNone(owned.list('not-an-id'))
+        self.assertEqual(owned.lists([list_id, other_list]).keys(), {list_id})
+        cards.find.assert_called_once()
+        lists.aggregate.assert_called_once()
+        queried = {str(i) for i in lists.aggregate.call_args.args[0][0]['$match']['_id']['$in']}
+        self.assertEqual(queried, {list_id, other_list})
+
+        boards.find.return_value = []
+        self.assertIsNone(owned.board('64b0000000000000000000b9'))
+        self.assertEqual(boards.find.call_args.args[0]['user_id'], 'u1')
+
+
+class TestRanking(unittest.TestCase):
+    def test_position_between(self):
+        from backend.ranking import position_between
+        self.assertEqual(position_between(None, None), 0)
+        self.assertEqual(position_between(None, 0), -1)
+        self.assertEqual(position_between(4, None), 5)
+        self.assertEqual(position_between(1, 2), 1.5)
+
+    def test_plan_reorder_moves_only_displaced_documents(self):
+        from backend.ranking import plan_reorder
+        # Last list dragged to the front: only it is rewritten
+        self.assertEqual(plan_reorder([4, 0, 1, 2, 3]), {0: -1})
+        # Two lists swapped: one write
+        moves = plan_reorder([0, 2, 1, 3])
+        self.assertEqual(len(moves), 1)
+        # Documents without a position are always placed
+        self.assertEqual(plan_reorder([None, None]), {0: 0, 1: 1})
+
+    def test_plan_reorder_result_is_ordered(self):
+        from backend.ranking import plan_reorder
+        current = [5, 3, 9, None, 1, 2, 8]
+        moves = plan_reorder(current)
+        final = [moves.get(i, p) for i, p in enumerate(current)]
+        self.assertEqual(final, sorted(final))
+        self.assertEqual(len(set(final)), len(final))
+
+    def test_rebalance_does_not_undo_a_concurrent_move(self):
+        from backend.memory_store import MemoryDatabase
+        from backend.ranking import POSITION_ORDER, rebalance
+        cards = MemoryDatabase()['cards']
+        ids = cards.insert_many([{'list_id': 'a', 'position': p} for p in (0.5, 0.5000001, 3)]).inserted_ids
+        bulk_write = cards.bulk_write
+
+        def bulk_write_after_a_move(writes, **kwargs):
+            # The first card moves to the end after the rebalance read the list
+            cards.update_one({'_id': ids[0]}, {'$set': {'position': 4}})
+            cards.bulk_write = bulk_write
+            return bulk_write(writes, **kwargs)
+        cards.bulk_write = bulk_write_after_a_move
+
+        rebalance(cards, {'list_id': 'a'})
+
+        found = list(cards.find({'list_id': 'a'}).sort(POSITION_ORDER))
+        self.assertEqual([c['_id'] for c in found], [ids[1], ids[2], ids[0]])
+        self.assertEqual([c['position'] for c in found], [0, 1, 2])
+
+
+class TestReconcile(unittest.TestCase):
+    BOARD_ID = '64b0000000000000000000b2'
+
+    def diff(self, structure):
+        from backend.app import is_done_list
+        from backend.reconcile import diff_board
+        lists, cards = self.stored()
+        return diff_board(self.BOARD_ID, lists, cards, structure, is_done_list)
+
+    def stored(self):
+        lists = [
+            {'_id': ObjectId('64b0000000000000000000a1'), 'board_id': self.BOARD_ID, 'title': 'To Do', 'position': 0},
+            {'_id': ObjectId('64b0000000000000000000a2'), 'board_id': self.BOARD_ID, 'title': 'Done', 'position': 1}
+        ]
+        cards = [
+            {'_id': ObjectId('64b0000000000000000000c1'), 'list_id': '64b0000000000000000000a1', 'title': 'A', 'position': 0},
+            {'_id': ObjectId('64b0000000000000000000c2'), 'list_id': '64b0000000000000000000a2', 'title': 'B', 'position': 0}
+        ]
+        return lists, cards
+
+    def test_rename_is_a_single_update(self):
+        diff = self.diff([
+            {'_id': '64b0000000000000000000a1', 'title': 'Backlog', 'cards': [{'_id': '64b0000000000000000000c1'}]},
+            {'_id': '64b0000000000000000000a2', 'title': 'Done', 'cards': [{'_id': '64b0000000000000000000c2', 'title': 'B'}]}
+        ])
+        self.assertEqual(len(diff.list_writes), 1)
+        self.assertEqual(diff.list_writes[0]._doc, {'$set': {'title': 'Backlog'}})
+        self.assertEqual(diff.card_writes, [])
+        self.assertEqual(diff.changes, [{'kind': 'list', 'id': '64b0000000000000000000a1', 'op': 'upsert'}])
+
+    def test_inserts_and_deletes(self):
+        diff = self.diff([
+            {'_id': '64b0000000000000000000a1', 'title': 'To Do', 'cards': [
+                {'_id': '64b0000000000000000000c1', 'title': 'A'}, {'title': 'New'}
+            ]},
+            {'title': 'Review', 'cards': []}
+        ])
+        inserted_list = diff.list_writes[0]._doc
+        self.assertEqual((inserted_list['title'], inserted_list['position']), ('Review', 1))
+        self.assertEqual(diff.list_writes[1]._filter, {'_id': {'$in': [ObjectId('64b0000000000000000000a2')]}})
+        inserted_card = diff.card_writes[0]._doc
+        self.assertEqual((inserted_card['title'], inserted_card['list_id'], inserted_card['position']),
+                         ('New', '64b0000000000000000000a1', 1))
+        self.assertEqual(diff.card_writes[1]._filter, {'_id': {'$in': [ObjectId('64b0000000000000000000c2')]}})
+        # The card went with its list; only the list deletion is logged
+        deletes = [c for c in diff.changes if c['op'] == 'delete']
+        self.assertEqual(deletes, [{'kind': 'list', 'id': '64b0000000000000000000a2', 'op': 'delete'}])
+        # One task added, the done one deleted with its list
+        self.assertEqual(diff.counters, [0, -1])
+
+    def test_task_counters_follow_moves_and_renames(self):
+        # A moves into Done, B leaves it; then Done is renamed away and To Do becomes Done
+        moved = self.diff([
+            {'_id': '64b0000000000000000000a1', 'cards': [{'_id': '64b0000000000000000000c2'}]},
+            {'_id': '64b0000000000000000000a2', 'cards': [{'_id': '64b0000000000000000000c1'}, {'title': 'C'}]}
+        ])
+        self.assertEqual(moved.counters, [1, 1])
+        renamed = self.diff([
+            {'_id': '64b0000000000000000000a1', 'title': 'Done', 'cards': [{'_id': '64b0000000000000000000c1'}]},
+            {'_id': '64b0000000000000000000a2', 'title': 'Archive', 'cards': []}
+        ])
+        self.assertEqual(renamed.counters, [-1, 0])
+
+    def test_duplicate_ids_are_rejected(self):
+        from backend.reconcile import StructureError
+        with self.assertRaises(StructureError):
+            self.diff([
+                {'_id': '64b0000000000000000000a1', 'cards': [{'_id': '64b0000000000000000000c1'}]},
+                {'_id': '64b0000000000000000000a2', 'cards': [{'_id': '64b0000000000000000000c1'}]}
+            ])
+
+
+class TestMemoryStore(unittest.TestCase):
+    def setUp(self):
+        from backend.indexes import ensure_indexes
+        from backend.memory_store import MemoryDatabase
+        self.db = MemoryDatabase()
+        ensure_indexes(self.db)
+
+    def test_indexed_find_reads_one_bucket_in_order(self):
+        from backend.ranking import POSITION_ORDER
+        cards = self.db['cards']
+        cards.insert_many([
+            {'list_id': 'a', 'title': 'third', 'position': 2},
+            {'list_id': 'b', 'title': 'other', 'position': 0},
+            {'list_id': 'a', 'title': 'first', 'position': 0},
+            {'list_id': 'a', 'title': 'second', 'position': 1},
+        ])
+
+        found = list(cards.find({'list_id': 'a'}, {'title': 1}).sort(POSITION_ORDER))
+
+        self.assertEqual([c['title'] for c in found], ['first', 'second', 'third'])
+        self.assertEqual(set(found[0]), {'_id', 'title'})
+        stats = {s['name']: s['accesses']['ops'] for s in cards.aggregate([{'$indexStats': {}}])}
+        self.assertEqual(stats['list_id_1_position_1__id_1'], 1)
+        # Results are copies
+        found[0]['title'] = 'changed'
+        self.assertEqual(cards.find_one({'_id': found[0]['_id']})['title'], 'first')
+
+    def test_writes_and_unique_indexes(self):
+        from pymongo import ReturnDocument, UpdateOne, DeleteMany
+        from pymongo.errors import DuplicateKeyError
+        users, boards = self.db['users'], self.db['boards']
+        users.insert_one({'username': 'noa'})
+        with self.assertRaises(DuplicateKeyError):
+            users.insert_one({'username': 'noa'})
+
+        board_id = boards.insert_one({'name': 'Work', 'user_id': 'u1'}).inserted_id
+        board = boards.find_one_and_update({'_id': board_id}, {'$inc': {'version': 1}},
+                                           projection={'version': 1}, return_document=ReturnDocument.AFTER)
+        self.assertEqual(board, {'_id': board_id, 'version': 1})
+
+        result = boards.bulk_write([
+            UpdateOne({'_id': board_id}, {'$set': {'title': 'Work'}}),
+            UpdateOne({'user_id': 'u2'}, {'$set': {'title': 'Personal'}}, upsert=True),
+            DeleteMany({'user_id': 'nobody'})
+        ], ordered=False)
+        self.assertEqual((result.matched_count, result.modified_count, result.upserted_count, result.deleted_count), (1, 1, 1, 0))
+        self.assertEqual(boards.count_documents({'title': {'$in': ['Work', 'Personal']}}), 2)
+
+    def test_commands_are_reported_like_pymongo(self):
+        from pymongo import DeleteMany, InsertOne, UpdateOne, monitoring
+        from backend.memory_store import MemoryDatabase
+        started = []
+        listener = MagicMock(spec=monitoring.CommandListener, started=lambda event: started.append(event.command_name))
+        db = MemoryDatabase(event_listeners=[listener])
+
+        db['cards'].insert_many([{'list_id': 'a'}, {'list_id': 'b'}])
+        # Unordered: one command per kind; ordered: one per run of the same kind
+        writes = [InsertOne({'list_id': 'c'}), UpdateOne({'list_id': 'a'}, {'$set': {'x': 1}}), InsertOne({'list_id': 'd'})]
+        db['cards'].bulk_write(writes + [DeleteMany({'list_id': 'b'})], ordered=False)
+        db['cards'].bulk_write([InsertOne({'list_id': 'e'}), UpdateOne({'list_id': 'a'}, {'$set': {'x': 2}}),
+                                InsertOne({'list_id': 'f'})])
+        list(db['cards'].find({'$or': [{'_id': 1}, {'list_id': 'a'}]}))
+
+        self.assertEqual(started, ['insert', 'insert', 'update', 'delete', 'insert', 'update', 'insert', 'find'])
+        self.assertEqual(listener.succeeded.call_count, len(started))
+
+    def test_routes_run_on_memory_storage(self):
+        from backend import app as app_module
+        from backend.storage import Storage
+        storage = Storage(self.db)
+        client = app_module.app.test_client()
+        with patch.multiple(app_module, boards_collection=storage.boards, lists_collection=storage.lists,
+                            cards_collection=storage.cards, users_collection=storage.users,
+                            changes_collection=storage.changes):
+            token = client.post('/signup', json={'username': 'noa', 'password': 'pw'}).get_json()['token']
+            headers = {'Authorization': f'Bearer {token}'}
+            boards = client.get('/boards', headers=headers).get_json()
+            work = next(b for b in boards if b['title'] == 'Work')
+
+            response = client.post(f"/boards/{work['_id']}/lists", json={'title': 'Later'}, headers=headers)
+            self.assertEqual(response.status_code, 201)
+            details = client.get(f"/boards/{work['_id']}", headers=headers).get_json()
+            self.assertEqual(details['lists'][-1]['title'], 'Later')
+            self.assertEqual(details['version'], 1)
+
+            other = client.post('/signup', json={'username': 'dana', 'password': 'pw'}).get_json()['token']
+            response = client.delete(f"/lists/{details['lists'][-1]['_id']}", headers={'Authorization': f'Bearer {other}'})
+            self.assertEqual(response.status_code, 404)
+
+    def test_legacy_project_cards_get_counters_when_storage_opens(self):
+        from backend import app as app_module
+        from backend.storage import Storage
+        storage = Storage(self.db)
+        parent = storage.boards.insert_one({'title': 'Work', 'user_id': 'u1'}).inserted_id
+        projects = storage.lists.insert_one({'board_id': str(parent), 'title': 'Projects'}).inserted_id
+        sub = str(storage.boards.insert_one({'name': 'Legacy - Tasks', 'user_id': 'u1'}).inserted_id)
+        todo, done = (storage.lists.insert_one({'board_id': sub, 'title': title}).inserted_id for title in ('To Do', 'Done'))
+        storage.cards.insert_many([{'list_id': str(todo)}, {'list_id': str(done)}, {'list_id': str(done)}])
+        project_card = storage.cards.insert_one({'list_id': str(projects), 'type': 'project-card',
+                                                 'sub_board_id': sub, 'progress': 10}).inserted_id
+
+        # Before the backfill a move leaves the legacy card alone instead of counting up from 0
+        with patch.object(app_module, 'cards_collection', storage.cards):
+            app_module.adjust_task_counters(sub, 1, 1)
+        self.assertNotIn('task_total', storage.cards.find_one({'_id': project_card}))
+
+        self.assertEqual(app_module.backfill_task_counters(storage), 1)
+        card = storage.cards.find_one({'_id': project_card})
+        self.assertEqual((card['task_total'], card['task_done'], card['progress']), (3, 2, 66))
+        self.assertEqual(app_module.backfill_task_counters(storage), 0)
+
+        # A change on the sub-board now bumps the parent board, whose project card shows its progress
+        with patch.object(app_module, 'boards_collection', storage.boards), \
+                patch.object(app_module, 'changes_collection', storage.changes):
+            app_module.record_board_changes(sub, app_module.upserted('card', 'c1'))
+        self.assertEqual(storage.boards.find_one({'_id': parent})['version'], 1)
+
+
+class TestAppFactory(unittest.TestCase):
+    def test_storage_opens_on_first_use_once_per_process(self):
+        from backend.storage import LazyStorage
+        opened = []
+        storage = LazyStorage()
+        storage.on_open.append(opened.append)
+        storage.configure('memory')
+        cards = storage.collection('cards')
+        self.assertEqual(opened, [])
+
+        cards.insert_one({'title': 'A'})
+        self.assertEqual(storage.collection('cards').count_documents({}), 1)
+        self.assertEqual(len(opened), 1)
+        self.assertIsNone(storage.client)
+
+        storage._after_fork()  # what a forked worker sees
+        self.assertEqual(cards.count_documents({}), 0)
+        self.assertEqual(len(opened), 2)
+
+    def test_ready_needs_storage_health_does_not(self):
+        from backend import app as app_module
+        client = app_module.app.test_client()
+        self.assertEqual(client.get('/health').status_code, 200)
+        self.assertEqual(client.get('/ready').status_code, 503)  # unit tests configure no storage
+
+        previous = app_module.storage.backend
+        self.addCleanup(app_module.storage.configure, previous)
+        app = app_module.create_app({'STORAGE_BACKEND': 'memory', 'MONGO_CLIENT_OPTIONS': {}})
+        self.assertEqual(app.test_client().get('/ready').get_json(), {'status': 'ready'})
+        self.assertIn('api.get_boards', app.view_functions)
+
+
+class TestTracing(unittest.TestCase):
+    def setUp(self):
+        from backend import app as app_module
+        from backend.indexes import ensure_indexes
+        from backend.memory_store import MemoryDatabase
+        from backend.storage import Storage
+        self.tracer = app_module.command_tracer
+        db = MemoryDatabase(event_listeners=[self.tracer])
+        ensure_indexes(db)
+        storage = Storage(db)
+        self.patcher = patch.multiple(app_module, boards_collection=storage.boards, lists_collection=storage.lists,
+                                      cards_collection=storage.cards, users_collection=storage.users,
+                                      changes_collection=storage.changes)
+        self.patcher.start()
+        self.addCleanup(self.patcher.stop)
+        self.app = app_module.app
+        self.client = self.app.test_client()
+        token = self.client.post('/signup', json={'username': 'noa', 'password': 'pw'}).get_json()['token']
+        self.headers = {'Authorization': f'Bearer {token}'}
+        work = next(b for b in self.client.get('/boards', headers=self.headers).get_json() if b['title'] == 'Work')
+        self.board_id = work['_id']
+
+    def test_routes_stay_within_query_budgets(self):
+        from backend.tracing import assert_query_budget
+        with assert_query_budget(self.tracer) as traces, patch.dict(self.app.config, {'DB_TRACE_HEADERS': True}):
+            board = self.client.get(f'/boards/{self.board_id}', headers=self.headers)
+            # Streaming reads the same three cursors as the snapshot
+            self.client.get(f'/boards/{self.board_id}?stream=1', headers=self.headers).get_data()
+            first, second = board.get_json()['lists'][:2]
+            card = self.client.post(f"/lists/{first['_id']}/cards", json={'title': 'New'}, headers=self.headers).get_json()
+            project = self.client.post(f"/lists/{first['_id']}/cards", json={'title': 'Launch', 'type': 'project-card'},
+                                       headers=self.headers)
+            moved = self.client.put(f"/cards/{card['_id']}", json={'new_list_id': second['_id'], 'to_position': 0},
+                                    headers=self.headers)
+            changes = self.client.get(f'/boards/{self.board_id}/changes?since=0', headers=self.headers)
+
+        self.assertEqual((project.status_code, moved.status_code, changes.status_code), (201, 200, 200))
+        self.assertEqual([t.endpoint for t in traces], ['api.get_board_details', 'api.get_board_details', 'api.create_card',
+                                                        'api.create_card', 'api.move_card', 'api.get_board_changes'])
+        # A project card inserts its sub-board's three lists at once
+        self.assertEqual(traces[3].describe().count('insert lists'), 1)
+        self.assertEqual(board.headers['X-DB-Commands'], '3')
+        self.assertIn('db;dur=', board.headers['Server-Timing'])
+        self.assertEqual((traces[1].count, traces[1].budget), (3, 3))
+        self.assertGreaterEqual(self.tracer.stats()['api.get_board_details'].by_command['find'][0], 2)
+
+    def test_over_budget_request_fails_with_its_commands(self):
+        from backend.tracing import assert_query_budget
+        with self.assertRaises(AssertionError) as raised:
+            with assert_query_budget(self.tracer, limit=1):
+                response = self.client.get(f'/boards/{self.board_id}', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('X-DB-Commands', response.headers)
+        self.assertIn('api.get_board_details: 3 commands, budget 1 (find boards, find lists, find cards)',
+                      str(raised.exception))
+
+    def test_unrouted_paths_share_one_stats_entry(self):
+        for path in ('/wp-login.php', '/.env', '/admin/config'):
+            self.assertEqual(self.client.get(path).status_code, 404)
+        stats = self.tracer.stats()
+        self.assertGreaterEqual(stats['unmatched'].requests, 3)
+        self.assertFalse(any(endpoint.startswith('/') for endpoint in stats))
+
+
+class TestWorkspaceTemplate(unittest.TestCase):
+    def test_materialize_links_documents(self):
+        from backend.workspace_template import DEFAULT_WORKSPACE
+        docs = DEFAULT_WORKSPACE.materialize('user1')
+
+        board_ids = {str(b['_id']) for b in docs['boards']}
+        list_ids = {str(l['_id']) for l in docs['lists']}
+        self.assertEqual(len(docs['boards']), 4)  # Work, Personal and two project sub-boards
+        self.assertTrue(all(b['user_id'] == 'user1' for b in docs['boards']))
+        self.assertTrue(all(l['board_id'] in board_ids for l in docs['lists']))
+        self.assertTrue(all(c['list_id'] in list_ids for c in docs['cards']))
+
+        project_cards = [c for c in docs['cards'] if c.get('type') == 'project-card']
+        self.assertEqual(len(project_cards), 2)
+        work_board_id = str(docs['boards'][0]['_id'])
+        self.assertEqual([b.get('parent_board_id') for b in docs['boards'][2:]], [work_board_id, work_board_id])
+        for card in project_cards:
+            sub_lists = [l['title'] for l in docs['lists'] if l['board_id'] == card['sub_board_id']]
+            self.assertEqual(sub_lists, ['To Do', 'In Progress', 'Done'])
+
+    def test_materialize_reuses_existing_root_board(self):
+        from bson import ObjectId
+        from backend.workspace_template import WORK_BOARD_TEMPLATE
+        root_id = ObjectId()
+        docs = WORK_BOARD_TEMPLATE.materialize('user1', root_board_ids=[root_id])
+
+        self.assertNotIn(root_id, [b['_id'] for b in docs['boards']])
+        self.assertEqual(sum(1 for l in docs['lists'] if l['board_id'] == str(root_id)), 5)
+
+    def test_each_materialization_gets_fresh_ids(self):
+        from backend.workspace_template import DEFAULT_WORKSPACE
+        first, second = DEFAULT_WORKSPACE.materialize('u1'), DEFAULT_WORKSPACE.materialize('u2')
+        self.assertFalse({c['_id'] for c in first['cards']} & {c['_id'] for c in second['cards']})
+
+
+class TestMetrics(unittest.TestCase):
+    def test_histogram_renders_cumulative_buckets(self):
+        from backend.metrics import Registry
+        registry = Registry()
+        latency = registry.histogram('latency_seconds', 'Latency.', ('route',), buckets=(0.1, 1.0))
+        for value in (0.05, 0.5, 0.7, 3.0):
+            latency.observe(value, ('say "hi"',))
+
+        lines = registry.render().splitlines()
+        self.assertEqual(lines[:2], ['# HELP latency_seconds Latency.', '# TYPE latency_seconds histogram'])
+        self.assertEqual(lines[2:], [
+            'latency_seconds_bucket{route="say \\"hi\\"",le="0.1"} 1',
+            'latency_seconds_bucket{route="say \\"hi\\"",le="1"} 3',
+            'latency_seconds_bucket{route="say \\"hi\\"",le="+Inf"} 4',
+            'latency_seconds_sum{route="say \\"hi\\""} 4.25',
+            'latency_seconds_count{route="say \\"hi\\""} 4',
+        ])
+
+    def test_pool_waits_and_failures(self):
+        from backend.metrics import PoolMetrics, Registry
+        pool = PoolMetrics(Registry())
+        pool.connection_check_out_started(MagicMock())
+        pool.connection_checked_out(MagicMock())
+        pool.connection_check_out_started(MagicMock())
+        pool.connection_check_out_failed(MagicMock(reason='timeout'))
+
+        self.assertEqual(pool.checked_out._values[()], 1)
+        self.assertEqual(pool.failures._values[('timeout',)], 1)
+        self.assertEqual(sum(pool.wait._values[()][0]), 2)
+
+    @patch('backend.app.users_collection')
+    def test_metrics_endpoint(self, mock_users_collection):
+        from werkzeug.security import generate_password_hash
+        from backend.app import app
+        client = app.test_client()
+        mock_users_collection.find_one.return_value = {'_id': '12345', 'username': 'testuser',
+                                                       'password': generate_password_hash('testpass')}
+        client.post('/login', json={'username': 'testuser', 'password': 'testpass'})
+        client.get('/health')
+
+        response = client.get('/metrics')
+        body = response.get_data(as_text=True)
+        self.assertEqual(response.content_type, 'text/plain; version=0.0.4; charset=utf-8')
+        self.assertIn('trello_http_requests_total{endpoint="api.health_check",method="GET",status="200"}', body)
+        self.assertIn('trello_http_request_duration_seconds_bucket{endpoint="api.login",method="POST",le="+Inf"}', body)
+        self.assertIn('trello_auth_seconds_count{operation="password_check"}', body)
+        self.assertIn('trello_http_requests_in_flight 1', body)  # the scrape itself
+        self.assertIn('trello_cache_hit_ratio{cache="user"}', body)
+
+
+class TestLogging(unittest.TestCase):
+    def test_records_are_json_without_secrets(self):
+        import json
+        import logging
+        from backend.log import JSONFormatter
+        record = logging.LogRecord('backend.app', logging.INFO, __file__, 1, 'Login for %s', ('noa',), None)
+        record.event, record.password = 'login', 'hunter2'
+
+        entry = json.loads(JSONFormatter().format(record))
+        self.assertEqual((entry['message'], entry['event'], entry['password']), ('Login for noa', 'login', '[redacted]'))
+
+    def test_full_queue_drops_instead_of_blocking(self):
+        import logging
+        import queue
+        from backend.log import DroppingQueueHandler, SamplingFilter
+        handler = DroppingQueueHandler(queue.Queue(maxsize=1))
+        handler.addFilter(SamplingFilter({'card_moved': 0.0}))
+        logger = logging.getLogger('test_backend.logging')
+        logger.propagate = False
+        logger.addHandler(handler)
+        self.addCleanup(logger.removeHandler, handler)
+
+        logger.warning("sampled out", extra={'event': 'card_moved'})
+        logger.warning("first")
+        logger.warning("second")
+
+        self.assertEqual(handler.queue.get_nowait().msg, 'first')
+        self.assertEqual(handler.dropped, 1)
+
+    @patch('backend.app.users_collection')
+    def test_login_checks_password_once_and_never_logs_it(self, mock_users_collection):
+        from werkzeug.security import generate_password_hash
+        from backend.app import app, password_hasher
+        mock_users_collection.find_one.return_value = {'_id': '12345', 'username': 'testuser',
+                                                       'password': generate_password_hash('testpass')}
+        with patch.object(password_hasher, 'verify', wraps=password_hasher.verify) as check, \
+                self.assertLogs('backend.app', 'INFO') as logs:
+            response = app.test_client().post('/login', json={'username': 'testuser', 'password': 'wrong-pass'})
+
+        self.assertEqual(response.status_code, 401)
+        check.assert_called_once()
+        self.assertNotIn('wrong-pass', '\n'.join(logs.output))
+
+
+class TestPasswords(unittest.TestCase):
+    def test_hashes_in_worker_processes(self):
+        from backend.passwords import PasswordHasher
+        hasher = PasswordHasher(method='pbkdf2:sha256:1000', workers=1)
+        self.addCleanup(hasher.shutdown)
+
+        stored = hasher.hash('secret')
+        self.assertTrue(stored.startswith('pbkdf2:sha256:1000$'))
+        self.assertTrue(hasher.verify(stored, 'secret'))
+        self.assertFalse(hasher.verify(stored, 'wrong'))
+        self.assertEqual(hasher.pending, 0)
+
+    def test_pool_size_follows_the_cpu_limit(self):
+        from backend.passwords import PasswordHasher
+        from backend.serve import password_hash_workers
+        with patch('backend.serve.cpu_limit', return_value=2), patch.dict(os.environ):
+            os.environ.pop('PASSWORD_HASH_WORKERS', None)
+            os.environ.pop('PASSWORD_HASH_QUEUE', None)
+            hasher = PasswordHasher.from_env()
+        self.assertEqual((hasher.workers, hasher.max_pending), (2, 8))
+        # Under backend.serve every server worker has a pool; together they get the CPUs once
+        self.assertEqual(password_hash_workers(1, 3), 1)
+        self.assertEqual(password_hash_workers(8, 2), 4)
+
+    @patch('backend.app.users_collection')
+    def test_full_queue_answers_503(self, mock_users_collection):
+        from backend.app import app
+        from backend.passwords import PasswordHasher
+        mock_users_collection.find_one.return_value = None
+        busy = PasswordHasher(workers=0, max_pending=0)
+        with patch('backend.app.password_hasher', busy):
+            response = app.test_client().post('/signup', json={'username': 'noa', 'password': 'pw'})
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.headers['Retry-After'], '1')
+        self.assertEqual(busy.rejected, 1)
+        mock_users_collection.insert_one.assert_not_called()
+
+    @patch('backend.app.users_collection')
+    def test_login_upgrades_old_hashes(self, mock_users_collection):
+        from werkzeug.security import generate_password_hash
+        from backend.app import app, user_cache
+        from backend.passwords import PasswordHasher
+        old_hash = generate_password_hash('testpass', method='sha256')
+        mock_users_collection.find_one.return_value = {'_id': '12345', 'username': 'testuser', 'password': old_hash}
+        user_cache.set('12345', {'_id': '12345'})
+        with patch('backend.app.password_hasher', PasswordHasher(method='pbkdf2:sha256:1000', workers=0)):
+            response = app.test_client().post('/login', json={'username': 'testuser', 'password': 'testpass'})
+
+        self.assertEqual(response.status_code, 200)
+        query, update = mock_users_collection.update_one.call_args.args
+        self.assertEqual(query, {'_id': '12345', 'password': old_hash})
+        self.assertTrue(update['$set']['password'].startswith('pbkdf2:sha256:1000$'))
+        self.assertIsNone(user_cache.get('12345'))
+
+
+class TestTTLCache(unittest.TestCase):
+    def test_lru_eviction_and_stats(self):
+        from backend.cache import TTLCache
+        cache = TTLCache(maxsize=2, ttl=60)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')          # 'b' is now least recently used
+        cache.set('c', 3)
+
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.get('c'), 3)
+        self.assertEqual(cache.stats()['hits'], 3)
+        self.assertEqual(cache.stats()['misses'], 1)
+
+    def test_entries_expire(self):
+        from backend.cache import TTLCache
+        now = [100.0]
+        cache = TTLCache(maxsize=10, ttl=5, clock=lambda: now[0])
+        cache.set('a', 1)
+        now[0] += 4.9
+        self.assertEqual(cache.get('a'), 1)
+        now[0] += 0.2
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.stats()['size'], 0)
+
+
+class TestSnapshotCache(unittest.TestCase):
+    def test_versions_and_lru_by_bytes(self):
+        from backend.cache import SnapshotCache
+        cache = SnapshotCache(max_bytes=10)
+        cache.set('board:a', 1, b'aaaa')
+        cache.set('board:b', 1, b'bbbb')
+        self.assertEqual(cache.get('board:a', 1), b'aaaa')
+        self.assertIsNone(cache.get('board:b', 2))  # a newer version: stale entry dropped
+
+        cache.set('board:b', 2, b'bbbb')
+        cache.set('board:c', 1, b'cccc')  # 12 bytes: evicts a, the least recently used
+        self.assertIsNone(cache.get('board:a', 1))
+        cache.set('board:d', 1, b'x' * 11)  # larger than the whole cache: not kept
+        stats = cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['evictions']), (1, 2, 1))
+        self.assertEqual((stats['size'], stats['bytes']), (2, 8))
+
+    def test_shared_store_is_used_across_processes(self):
+        import fakeredis
+        from redis.exceptions import ConnectionError
+        from backend.cache import RedisStore, SnapshotCache
+        server = fakeredis.FakeServer()
+        here = SnapshotCache(shared=RedisStore(fakeredis.FakeRedis(server=server)))
+        there = SnapshotCache(shared=RedisStore(fakeredis.FakeRedis(server=server)))
+
+        here.set('board:a', 3, b'{"lists":[]}')
+        self.assertEqual(there.get('board:a', 3), b'{"lists":[]}')
+        self.assertEqual(there.get('board:a', 3), b'{"lists":[]}')
+        self.assertEqual((there.stats()['shared_hits'], there.stats()['hits']), (1, 1))
+        self.assertIsNone(SnapshotCache(shared=there.shared).get('board:a', 4))
+
+        here.invalidate('board:a')
+        self.assertIsNone(SnapshotCache(shared=there.shared).get('board:a', 3))
+
+        broken = MagicMock()
+        broken.get.side_effect = ConnectionError('down')
+        cache = SnapshotCache(shared=RedisStore(broken))
+        self.assertIsNone(cache.get('board:a', 3))
+        self.assertEqual(cache.stats()['shared_errors'], 1)
+
+    def test_board_reads_are_served_from_cache_until_the_board_changes(self):
+        from backend import app as app_module
+        from backend.tracing import assert_query_budget
+        self.addCleanup(app_module.storage.configure, app_module.storage.backend)
+        client = app_module.create_app({'STORAGE_BACKEND': 'memory', 'MONGO_CLIENT_OPTIONS': {}}).test_client()
+        token = client.post('/signup', json={'username': 'noa', 'password': 'pw'}).get_json()['token']
+        headers = {'Authorization': f'Bearer {token}'}
+        work = next(b for b in client.get('/boards', headers=headers).get_json() if b['title'] == 'Work')
+
+        with assert_query_budget(app_module.command_tracer) as traces:
+            first = client.get(f"/boards/{work['_id']}", headers=headers)
+            second = client.get(f"/boards/{work['_id']}", headers=headers)
+        self.assertEqual(first.data, second.data)
+        self.assertEqual([t.count for t in traces], [3, 1])  # the second read loads only the board
+
+        first_list = first.get_json()['lists'][0]
+        client.post(f"/lists/{first_list['_id']}/cards", json={'title': 'New'}, headers=headers)
+        after = client.get(f"/boards/{work['_id']}", headers=headers).get_json()
+        self.assertEqual(after['version'], 1)
+        self.assertEqual(after['lists'][0]['cards'][-1]['title'], 'New')
+        self.assertIn('trello_board_cache_hit_ratio', client.get('/metrics').get_data(as_text=True))
+
+class TestEventBus(unittest.TestCase):
+    def test_in_process_fan_out(self):
+        from backend.events import InProcessBus
+        bus = InProcessBus()
+        first, second, other = bus.subscribe('b1'), bus.subscribe('b1'), bus.subscribe('b2')
+
+        bus.publish('b1', {'type': 'change', 'version': 1})
+
+        self.assertEqual(first.get(timeout=0)['version'], 1)
+        self.assertEqual(second.get(timeout=0)['version'], 1)
+        self.assertIsNone(other.get(timeout=0))
+        for subscription in (first, second, other):
+            subscription.close()
+        self.assertEqual(bus.subscriber_count(), 0)
+
+    def test_slow_subscriber_is_told_to_resync(self):
+        from backend import events
+        bus = events.InProcessBus()
+        subscription = bus.subscribe('b1')
+        for version in range(events.SUBSCRIBER_QUEUE_SIZE + 1):
+            bus.publish('b1', {'type': 'change', 'version': version})
+
+        self.assertEqual(subscription.get(timeout=0), events.OVERFLOW)
+        self.assertIsNone(subscription.get(timeout=0))
+
+    def test_change_stream_is_shared_by_the_process(self):
+        import queue
+        import time
+        from backend.events import ChangeStreamBus
+
+        class FakeChangeStream:
+            def __init__(self):
+                self.changes, self.alive = queue.Queue(), True
+
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *exc):
+                self.alive = False
+
+            def try_next(self):
+                try:
+                    return self.changes.get(timeout=0.01)
+                except queue.Empty:
+                    return None
+
+        stream = FakeChangeStream()
+        changes_collection = MagicMock()
+        changes_collection.watch.return_value = stream
+        bus = ChangeStreamBus(changes_collection)
+        first, second, other = bus.subscribe('b1'), bus.subscribe('b1'), bus.subscribe('b2')
+
+        stream.changes.put({'fullDocument': {'board_id': 'b1', 'version': 2, 'changes': []}})
+        self.assertEqual(first.get(timeout=1)['version'], 2)
+        self.assertEqual(second.get(timeout=1)['version'], 2)
+        self.assertIsNone(other.get(timeout=0.05))
+        changes_collection.watch.assert_called_once()
+
+        # The stream closes once its last subscriber leaves
+        for subscription in (first, second, other):
+            subscription.close()
+        for _ in range(100):
+            if not stream.alive:
+                break
+            time.sleep(0.01)
+        self.assertFalse(stream.alive)
+
+
+class TestJSONProvider(unittest.TestCase):
+    def setUp(self):
+        from datetime import datetime
+        from backend.json_provider import api_document
+        self.card_id = ObjectId()
+        self.doc = {
+            '_id': ObjectId(), 'name': 'Sub - Tasks', 'created': datetime(2024, 5, 1, 12, 0),
+            'cards': [api_document({'_id': self.card_id, 'sub_board_id': 'b1', 'title': 'Project'})]
+        }
+
+    def test_encodes_mongo_types_and_api_field_names(self):
+        import json
+        from backend.app import app
+        from backend.json_provider import api_document
+        body = json.loads(app.json.dumps(api_document(self.doc)))
+
+        self.assertEqual(body['_id'], str(self.doc['_id']))
+        self.assertEqual(body['title'], 'Sub - Tasks')
+        self.assertNotIn('name', body)
+        self.assertEqual(body['created'], '2024-05-01T12:00:00+00:00')
+        self.assertEqual(body['cards'][0], {'_id': str(self.card_id), 'subBoardId': 'b1', 'title': 'Project'})
+
+    def test_stdlib_fallback_matches_orjson(self):
+        from backend import json_provider
+        from backend.app import app
+        from backend.json_provider import api_document
+        with app.app_context():
+            fast = app.json.response(api_document(self.doc)).get_data()
+            with patch.object(json_provider, 'orjson', None):
+                fallback = app.json.response(api_document(self.doc)).get_data()
+        self.assertEqual(fast, fallback)
+
+
+class TestIndexes(unittest.TestCase):
+    def test_ensure_indexes_covers_every_collection(self):
+        from backend.indexes import ensure_indexes
+        collections = {}
+        db = MagicMock()
+        db.__getitem__.side_effect = lambda name: collections.setdefault(name, MagicMock())
+
+        ensure_indexes(db)
+
+        self.assertEqual(sorted(collections), ['board_changes', 'boards', 'cards', 'lists', 'users'])
+        lists_models = collections['lists'].create_indexes.call_args.args[0]
+        self.assertIn('board_id_1_position_1__id_1', [m.document['name'] for m in lists_models])
+
+    def test_index_report_flags_missing_and_unused(self):
+        from backend.indexes import index_report
+        from pymongo import IndexModel
+        registry = {'cards': [IndexModel([('list_id', 1), ('position', 1)]), IndexModel([('sub_board_id', 1)])]}
+        db = MagicMock()
+        db['cards'].list_indexes.return_value = [{'name': '_id_'}, {'name': 'list_id_1_position_1'}, {'name': 'title_1'}]
+        db['cards'].aggregate.return_value = [
+            {'name': '_id_', 'accesses': {'ops': 3}},
+            {'name': 'list_id_1_position_1', 'accesses': {'ops': 42}},
+            {'name': 'title_1', 'accesses': {'ops': 0}}
+        ]
+
+        report = index_report(db, registry)['cards']
+
+        self.assertEqual(report['missing'], ['sub_board_id_1'])
+        self.assertEqual(report['unused'], ['title_1'])
+        self.assertEqual(report['unregistered'], ['title_1'])
+
+class TestServe(unittest.TestCase):
+    def test_workers_follow_cpus_and_worker_class(self):
+        from backend.serve import options
+        shared_events = {'EVENT_BUS': 'changestream'}
+        gevent = options(shared_events, cpus=2)
+        self.assertEqual((gevent['worker_class'], gevent['workers']), ('gevent', 2))
+        self.assertFalse(gevent['preload_app'])
+        self.assertNotIn('threads', gevent)
+
+        gthread = options({**shared_events, 'WEB_WORKER_CLASS': 'gthread'}, cpus=2)
+        self.assertEqual((gthread['workers'], gthread['threads']), (5, 4))
+        self.assertTrue(gthread['preload_app'])
+
+        self.assertEqual(options({**shared_events, 'WEB_CONCURRENCY': '3', 'WEB_MAX_REQUESTS': '0'}, cpus=8)['workers'], 3)
+        with self.assertRaises(ValueError):
+            options({'WEB_WORKER_CLASS': 'eventlet'}, cpus=1)
+
+    def test_in_process_events_run_one_worker(self):
+        from backend.serve import options
+        # Each board event must reach every SSE client, which a single worker guarantees
+        self.assertEqual(options({}, cpus=4)['workers'], 1)
+        self.assertEqual(options({'EVENT_BUS': 'memory', 'WEB_WORKER_CLASS': 'gthread'}, cpus=4)['workers'], 1)
+        with self.assertRaises(ValueError):
+            options({'WEB_CONCURRENCY': '3'}, cpus=4)
+
+    def test_memory_storage_runs_one_worker(self):
+        from backend.serve import options
+        with self.assertLogs('backend.serve', 'WARNING'):
+            settings = options({'STORAGE_BACKEND': 'memory', 'WEB_CONCURRENCY': '4'}, cpus=4)
+        self.assertEqual(settings['workers'], 1)
+
+    def test_uvicorn_workers_serve_the_asgi_app(self):
+        from backend.serve import options
+        settings = options({'WEB_WORKER_CLASS': 'uvicorn', 'EVENT_BUS': 'changestream'}, cpus=2)
+        self.assertEqual((settings['worker_class'], settings['workers']), ('uvicorn.workers.UvicornWorker', 2))
+
+class TestAsgiApp(unittest.TestCase):
+    def setUp(self):
+        from starlette.testclient import TestClient
+        from backend import app as app_module
+        from backend.asgi import create_asgi_app
+        self.addCleanup(app_module.storage.configure, app_module.storage.backend)
+        asgi = create_asgi_app({'STORAGE_BACKEND': 'memory', 'MONGO_CLIENT_OPTIONS': {}})
+        self.client = TestClient(asgi).__enter__()
+        self.addCleanup(self.client.__exit__, None, None, None)
+        self.flask = asgi.state.flask.test_client()
+
+        token = self.client.post('/signup', json={'username': 'noa', 'password': 'pw'}).json()['token']
+        self.headers = {'Authorization': f'Bearer {token}'}
+        boards = self.client.get('/boards', headers=self.headers).json()
+        self.work_id = next(b['_id'] for b in boards if b['title'] == 'Work')
+
+    def test_native_routes_answer_like_flask(self):
+        from backend.app import board_cache
+        lists = self.flask.get(f'/boards/{self.work_id}', headers=self.headers).get_json()['lists']
+        for path in ('/boards', f'/boards/{self.work_id}', f'/lists?board_id={self.work_id}&limit=2',
+                     f"/cards?list_id={lists[0]['_id']}&fields=title,subBoardId,progress"):
+            board_cache.clear()
+            native = self.client.get(path, headers=self.headers)
+            board_cache.clear()
+            flask = self.flask.get(path, headers=self.headers)
+            self.assertEqual((native.status_code, native.content), (flask.status_code, flask.data), path)
+            for header in ('ETag', 'X-Next-Cursor'):
+                self.assertEqual(native.headers.get(header), flask.headers.get(header), path)
+
+        etag = self.client.get('/boards', headers=self.headers).headers['ETag']
+        self.assertEqual(self.client.get('/boards', headers={**self.headers, 'If-None-Match': etag}).status_code, 304)
+        self.assertEqual(self.client.get('/boards').status_code, 401)
+        token = self.headers['Authorization'].split()[1]
+        self.assertEqual(self.client.get(f'/boards?token={token}').status_code, 401)
+
+    def test_move_card_and_fallback_routes_share_storage(self):
+        board = self.client.get(f'/boards/{self.work_id}', headers=self.headers).json()
+        first, last = board['lists'][0], board['lists'][-1]
+        card = first['cards'][0]
+
+        response = self.client.put(f"/cards/{card['_id']}", json={'new_list_id': last['_id'], 'to_position': 0},
+                                   headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+
+        # Read back through the Flask app: position, version and change log written like move_card's
+        board = self.flask.get(f'/boards/{self.work_id}', headers=self.headers).get_json()
+        self.assertEqual(board['lists'][-1]['cards'][0]['_id'], card['_id'])
+        self.assertEqual(board['version'], 1)
+        changes = self.client.get(f'/boards/{self.work_id}/changes?since=0', headers=self.headers).json()
+        self.assertEqual([c['_id'] for c in changes['cards']], [card['_id']])
+
+        other = self.client.post('/signup', json={'username': 'dana', 'password': 'pw'}).json()['token']
+        response = self.client.put(f"/cards/{card['_id']}", json={'new_list_id': first['_id']},
+                                   headers={'Authorization': f'Bearer {other}'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_open_event_streams_hold_no_bridge_threads(self):
+        import asyncio
+        import json
+        from backend.app import event_bus
+        asgi = self.client.app
+        ticket = self.client.post(f'/boards/{self.work_id}/events/ticket', headers=self.headers).json()['ticket']
+
+        def call(method, path, query=b'', headers=(), body=b''):
+            """Start a request on the running loop; returns (task, sent messages, disconnect event)."""
+            sent, disconnect = asyncio.Queue(), asyncio.Event()
+            pending = [{'type': 'http.request', 'body': body, 'more_body': False}]
+
+            async def receive():
+                if pending:
+                    return pending.pop()
+                await disconnect.wait()
+                return {'type': 'http.disconnect'}
+
+            async def send(msg):
+                await sent.put(msg)
+
+            scope = {'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': method,
+                     'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'root_path': '', 'query_string': query,
+                     'headers': [(k.lower().encode(), v.encode()) for k, v in headers],
+                     'server': ('testserver', 80), 'client': ('testclient', 1)}
+            return asyncio.ensure_future(asgi(scope, receive, send)), sent, disconnect
+
+        async def body_of(sent):
+            return (await asyncio.wait_for(sent.get(), 5)).get('body', b'').decode()
+
+        async def scenario():
+            # More open streams than the WSGI bridge has threads
+            streams = [call('GET', f'/boards/{self.work_id}/events', f'ticket={ticket}'.encode()) for _ in range(12)]
+            for _, sent, _ in streams:
+                self.assertEqual((await asyncio.wait_for(sent.get(), 5))['status'], 200)
+                self.assertEqual(await body_of(sent), 'retry: 3000\n\n')
+            self.assertEqual(event_bus.subscriber_count(), 12)
+
+            # A write through the Flask fallback still gets a thread
+            payload = json.dumps({'name': 'Side project'}).encode()
+            write = call('POST', '/boards', body=payload, headers=[
+                ('Authorization', self.headers['Authorization']), ('Content-Type', 'application/json'),
+                ('Content-Length', str(len(payload)))])
+            self.assertEqual((await asyncio.wait_for(write[1].get(), 5))['status'], 201)
+
+            # Events published by another thread reach every stream
+            await asyncio.to_thread(event_bus.publish, self.work_id, {'type': 'change', 'version': 9, 'changes': []})
+            for _, sent, _ in streams:
+                self.assertTrue((await body_of(sent)).startswith('id: 9\nevent: change\n'))
+
+            for task, _, disconnect in streams + [write]:
+                disconnect.set()
+            await asyncio.wait_for(asyncio.gather(*(task for task, _, _ in streams + [write])), 5)
+
+        asyncio.run(scenario())
+        self.assertEqual(event_bus.subscriber_count(), 0)
+
 if __name__ == '__main__':
     unittest.main()